@@ -0,0 +1,88 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import pandas as pd
+
+# a local S3 stand-in: every request goes over HTTP to this process, credentials are never looked up
+os.environ.update(AWS_ACCESS_KEY_ID = "bench", AWS_SECRET_ACCESS_KEY = "bench", PDM_DATA_FORMAT = "csv")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import aws_clients
+import preprocessing
+from storage import LocalS3Client, upload_csv_multipart
+
+
+class S3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def do_PUT(self):
+        self.connections.add(self.client_address)
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("ETag", '"bench"')
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+# upload_file_s3 before the client factory: a new default session and client for every upload
+def legacy_upload_file_s3(df, name):
+    boto3.setup_default_session(region_name = "us-east-1")
+    s3_client = boto3.client("s3", region_name = "us-east-1")
+    upload_csv_multipart(df, s3_client, preprocessing.bucket, f"{preprocessing.prefix}/data/preprocessed/{name}.csv")
+
+
+def timed(function, tables, threads = 1):
+    S3Handler.connections = set()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            with ThreadPoolExecutor(threads) as pool:
+                list(pool.map(lambda item: function(item[1], item[0]), tables))
+        finally:
+            sys.stdout = stdout
+    return time.perf_counter() - start, len(S3Handler.connections)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type = int, default = 200)
+    parser.add_argument("--rows", type = int, default = 100)
+    parser.add_argument("--threads", type = int, default = 8)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), S3Handler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    os.environ["AWS_ENDPOINT_URL"] = f"http://127.0.0.1:{server.server_port}"
+
+    df = pd.DataFrame({"machineID": range(args.rows), "volt": 170.0})
+    tables = [(f"table-{i}", df) for i in range(args.uploads)]
+    print(f"{args.uploads} uploads of {args.rows} rows       seconds  per upload   TCP connections")
+    for label, function, threads in (("client per upload", legacy_upload_file_s3, 1),
+                                     ("shared client", preprocessing.upload_file_s3, 1),
+                                     (f"client per upload, {args.threads} threads", legacy_upload_file_s3, args.threads),
+                                     (f"shared client, {args.threads} threads", preprocessing.upload_file_s3, args.threads)):
+        seconds, connections = timed(function, tables, threads)
+        print(f"  {label:32s} {seconds:8.2f} {seconds / args.uploads * 1000:8.1f} ms {connections:12d}")
+        if function is preprocessing.upload_file_s3:
+            assert connections <= max(threads, 1) + 1
+
+    # a fake swapped in for the factory's S3 client receives the uploads instead
+    with tempfile.TemporaryDirectory() as tmp:
+        aws_clients.set_client("s3", LocalS3Client(tmp))
+        timed(preprocessing.upload_file_s3, tables[:3])
+        aws_clients.set_client("s3", None)
+        written = os.listdir(os.path.join(tmp, preprocessing.bucket, *preprocessing.prefix.split("/"), "data", "preprocessed"))
+        assert sorted(written) == ["table-0.csv", "table-1.csv", "table-2.csv"]
+        print("uploads go to a LocalS3Client set with aws_clients.set_client")
+    server.shutdown()
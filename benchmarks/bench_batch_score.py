@@ -0,0 +1,90 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pyarrow.parquet as pq
+from sklearn.ensemble import RandomForestClassifier
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+from batch_score import PART_PATTERN, batch_score, combine_parts
+from compact_forest import export_forest
+from inference_client import HttpTransport, LocalEndpoint, run_batches
+from bench_feature_dtypes import feature_sample
+
+
+def model_dir(path, n_estimators, seed = 0):
+    X, y = feature_sample(20000, seed + 1)
+    model = RandomForestClassifier(n_estimators = n_estimators, min_samples_leaf = 3, random_state = seed).fit(X, y)
+    os.makedirs(path)
+    joblib.dump(model, os.path.join(path, "model.joblib"))
+    export_forest(model, os.path.join(path, "forest"))
+    return path
+
+
+def quiet(function, *args):
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            return function(*args)
+        finally:
+            sys.stdout = stdout
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type = int, default = 2_000_000)
+    parser.add_argument("--chunk-rows", type = int, default = 100_000)
+    parser.add_argument("--n-estimators", type = int, default = 10)
+    parser.add_argument("--replay-rows", type = int, default = 2000)
+    parser.add_argument("--workers", type = int, nargs = "+", default = sorted({1, os.cpu_count()}))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = model_dir(os.path.join(tmp, "model"), args.n_estimators)
+        # the inference files carry every feature as a float
+        features = feature_sample(args.rows)[0].astype(np.float32)
+        csv_path = os.path.join(tmp, "inference.csv")
+        parquet_path = os.path.join(tmp, "inference.parquet")
+        # the inference CSV layout: no header, feature contract order
+        features.to_csv(csv_path, header = False, index = False)
+        features.to_parquet(parquet_path, row_group_size = 250_000)
+        print(f"{args.rows:,} rows, {args.n_estimators} trees, chunks of {args.chunk_rows:,} rows")
+
+        # previous approach: every row sent to the endpoint on its own
+        with LocalEndpoint(model) as endpoint:
+            lines = [",".join(map(repr, row)) for row in features.iloc[:args.replay_rows].to_numpy().tolist()]
+            report = run_batches(((1, line) for line in lines), HttpTransport(endpoint.url), concurrency = 8)
+        print(f"{'endpoint replay, 1 row/request':36s} {report['rows_per_sec']:12,.0f} rows/s")
+
+        for path in (csv_path, parquet_path):
+            for workers in args.workers:
+                out_dir = os.path.join(tmp, f"scores-{workers}")
+                report = quiet(batch_score, path, model, out_dir, workers, args.chunk_rows, True)
+                label = f"batch_score {os.path.splitext(path)[1][1:]}, {workers} workers"
+                print(f"{label:36s} {report['rows_per_sec']:12,.0f} rows/s  parallelism {report['parallelism']:.2f}")
+        reference = pq.read_table(combine_parts(out_dir, os.path.join(tmp, "reference.parquet")))
+        assert reference.column("row").to_pylist() == list(range(args.rows))
+
+        # crash after a few chunks, then resume from the parts that were written
+        out_dir = os.path.join(tmp, "crashed")
+        command = [sys.executable, os.path.join(SCRIPTS_DIR, "batch_score.py"), "--data", parquet_path,
+                   "--model-dir", model, "--out-dir", out_dir, "--chunk-rows", str(args.chunk_rows), "--workers", "1"]
+        # its own process group, so the kill also takes down the pool workers instead of leaving them blocked
+        process = subprocess.Popen(command, stdout = subprocess.DEVNULL, start_new_session = True)
+        while process.poll() is None and not os.path.exists(os.path.join(out_dir, PART_PATTERN.format(2))):
+            time.sleep(0.05)
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+        written = len([name for name in os.listdir(out_dir) if name.endswith(".parquet")])
+        report = quiet(batch_score, parquet_path, model, out_dir, 1, args.chunk_rows)
+        resumed = pq.read_table(combine_parts(out_dir, os.path.join(tmp, "resumed.parquet")))
+        assert resumed.equals(reference)
+        print(f"killed after {written} chunks, resume skipped {report['skipped_chunks']} and scored "
+              f"{report['scored_rows']:,} rows; output identical to an uninterrupted run")
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from datacapture_preprocessing import PREDICTION_COLUMN, decode_capture, feature_names, preprocess_handler
+from feature_schema import FAILURE_CLASSES, FEATURE_COLUMNS
+from bench_feature_dtypes import feature_sample
+
+
+# Previous datacapture_preprocessing.preprocess_handler, kept for comparison
+def legacy_preprocess_handler(inference_record):
+    input_data = json.loads(inference_record.endpoint_input.data)
+    input_data = {f"feature{str(i).zfill(10)}": val for i, val in enumerate(input_data)}
+
+    output_data = json.loads(inference_record.endpoint_output.data)
+    output_data = {"prediction0": output_data}
+
+    print(input_data)
+    print(type(input_data))
+    print(output_data)
+    return {**input_data}
+
+
+def capture_line(event_id, input_data, content_type, prediction):
+    output_data = json.dumps({"predictions": prediction, "classes": FAILURE_CLASSES})
+    return json.dumps({
+        "captureData": {
+            "endpointInput": {"observedContentType": content_type, "mode": "INPUT", "data": input_data,
+                              "encoding": "JSON" if content_type == "application/json" else "CSV"},
+            "endpointOutput": {"observedContentType": "application/json", "mode": "OUTPUT", "data": output_data,
+                               "encoding": "JSON"},
+        },
+        "eventMetadata": {"eventId": event_id, "inferenceTime": "2015-10-01T06:00:00Z"},
+        "eventVersion": "0",
+    })
+
+
+# SageMaker data capture JSONL, one file per `records_per_file` records; JSON array or CSV single-row requests
+def write_capture(directory, n_records, records_per_file, content_type, seed = 0):
+    features, labels = feature_sample(n_records, seed)
+    # JSON has no NaN; the label after a machine's last reading has no days since replacement and is sent as 0
+    features = np.round(np.nan_to_num(features.to_numpy(np.float64)), 4)
+    for start in range(0, n_records, records_per_file):
+        with open(os.path.join(directory, f"capture-{start:09d}.jsonl"), "w") as f:
+            for i in range(start, min(start + records_per_file, n_records)):
+                row = features[i].tolist()
+                input_data = json.dumps(row) if content_type == "application/json" else ",".join(map(repr, row))
+                f.write(capture_line(f"event-{i}", input_data, content_type, [labels[i]]) + "\n")
+    return features, labels
+
+
+# The monitoring job's loop: every line parsed and handed to the handler one record at a time
+def per_record(directory, handler):
+    rows = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name)) as f:
+            for line in f:
+                capture = json.loads(line)["captureData"]
+                rows.append(handler(SimpleNamespace(
+                    endpoint_input = SimpleNamespace(**capture["endpointInput"]),
+                    endpoint_output = SimpleNamespace(**capture["endpointOutput"]))))
+    return rows
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type = int, default = 1_000_000)
+    parser.add_argument("--records-per-file", type = int, default = 100_000)
+    args = parser.parse_args()
+
+    names = feature_names(len(FEATURE_COLUMNS))
+    print(f"{args.records:,} capture records, {len(FEATURE_COLUMNS)} features")
+    print(f"{'':16s} {'decoder':28s} {'seconds':>8s} {'records/s':>11s}")
+    for content_type in ("application/json", "text/csv"):
+        with tempfile.TemporaryDirectory() as tmp:
+            features, labels = write_capture(tmp, args.records, args.records_per_file, content_type)
+            tables, batch_s = timed(lambda: [table for _, table in decode_capture(tmp)])
+            decoded = np.column_stack([np.concatenate([t.column(name).to_numpy() for t in tables]) for name in names])
+            predictions = np.concatenate([t.column(PREDICTION_COLUMN).to_numpy(zero_copy_only = False) for t in tables])
+            assert np.array_equal(decoded, features) and np.array_equal(predictions, labels)
+
+            results = [("batch, per file", batch_s)]
+            if content_type == "application/json":
+                with open(os.devnull, "w") as devnull:
+                    stdout, sys.stdout = sys.stdout, devnull
+                    legacy, legacy_s = timed(per_record, tmp, legacy_preprocess_handler)
+                    sys.stdout = stdout
+                results.append(("previous handler per record", legacy_s))
+            # the wrapper is a batch of one, correct but only meant for the per-record monitor contract
+            sample = args.records // 100
+            with open(os.path.join(tmp, sorted(os.listdir(tmp))[0])) as f:
+                head = [next(f) for _ in range(sample)]
+            with tempfile.TemporaryDirectory() as small:
+                with open(os.path.join(small, "capture.jsonl"), "w") as f:
+                    f.writelines(head)
+                wrapped, wrapped_s = timed(per_record, small, preprocess_handler)
+            if content_type == "application/json":
+                assert wrapped == legacy[:sample]
+            assert wrapped == [dict(zip(names, row)) for row in features[:sample].tolist()]
+            results.append((f"wrapper per record (x100)", wrapped_s * 100))
+
+            for label, seconds in results:
+                print(f"{content_type:16s} {label:28s} {seconds:8.1f} {args.records / seconds:11,.0f}")
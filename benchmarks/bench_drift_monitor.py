@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from scipy.stats import ks_2samp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from drift_monitor import QUANTILES, SKETCH_ALPHA, DriftMonitor, FeatureStatistics, build_baseline, monitor_capture
+from feature_schema import FEATURE_COLUMNS, LABEL_COLUMN, encode_features
+from bench_datacapture_decoding import capture_line
+from bench_feature_dtypes import labeled_table
+
+
+# Hourly capture files of CSV requests, `rows_per_file` feature rows each
+def write_capture(directory, X, labels, rows_per_file):
+    for file, start in enumerate(range(0, len(X), rows_per_file)):
+        hour_dir = os.path.join(directory, f"{file // 24:04d}", f"{file % 24:02d}")
+        os.makedirs(hour_dir)
+        with open(os.path.join(hour_dir, "capture.jsonl"), "w") as f:
+            for i in range(start, min(start + rows_per_file, len(X))):
+                f.write(capture_line(f"event-{i}", ",".join(map(repr, X[i].tolist())), "text/csv", [labels[i]]) + "\n")
+
+
+def state_bytes(monitor):
+    stats = [monitor.total] + [window for _, window, _ in monitor.windows]
+    return sum(s.sketch.nbytes + s.histogram.nbytes + 6 * s.count.nbytes for s in stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 30)
+    parser.add_argument("--days", type = int, default = 300)
+    parser.add_argument("--rows-per-file", type = int, default = 2000)
+    parser.add_argument("--windows", type = int, default = 6)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        labeled = labeled_table(args.machines, args.days).sort_values("datetime", kind = "stable")
+        sys.stdout = stdout
+    X = encode_features(labeled)[FEATURE_COLUMNS].to_numpy(np.float64)
+    labels = labeled[LABEL_COLUMN].astype(str).to_numpy()
+    split = len(X) * 2 // 3
+    train, live = X[:split], X[split:]
+
+    start = time.perf_counter()
+    baseline = build_baseline(train, labels[:split])
+    print(f"baseline of {len(train):,} rows in {time.perf_counter() - start:.2f}s, "
+          f"{len(json.dumps(baseline)) / 1024:.0f} KB as JSON")
+
+    # the sketch and the moments against exact numpy / scipy numbers
+    stats = FeatureStatistics.from_dict(baseline["features"])
+    assert np.allclose(stats.mean, train.mean(axis = 0)) and np.allclose(stats.variance(), train.var(axis = 0, ddof = 1))
+    exact = np.quantile(train, QUANTILES, axis = 0, method = "inverted_cdf").T
+    error = np.abs(stats.quantiles() - exact) / np.maximum(np.abs(exact), 1e-6)
+    print(f"sketch quantiles: max relative error {error.max():.4f} (bound {SKETCH_ALPHA})")
+    assert error.max() <= SKETCH_ALPHA + 1e-9
+    halves = FeatureStatistics.from_dict(baseline["features"]).empty().update(train[:split // 2]).merge(
+        stats.empty().update(train[split // 2:]))
+    assert np.allclose(halves.mean, stats.mean) and np.allclose(halves.m2, stats.m2)
+    assert np.array_equal(halves.sketch, stats.sketch) and np.array_equal(halves.histogram, stats.histogram)
+
+    drifted = live.copy()
+    drifted[:, FEATURE_COLUMNS.index("voltmean_3h")] *= 1.05
+    drifted[:, FEATURE_COLUMNS.index("vibrationsd_24h")] += 1.0
+    print(f"{'stream':10s} {'rows':>8s} {'seconds':>8s} {'rows/s':>9s} {'state KB':>9s}  drifting features "
+          f"(last {args.windows} windows)")
+    for label, stream in (("unchanged", live), ("drifted", drifted)):
+        with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+            write_capture(tmp, stream, labels[split:], args.rows_per_file)
+            monitor = DriftMonitor(baseline, args.windows)
+            stdout, sys.stdout = sys.stdout, devnull
+            start = time.perf_counter()
+            monitor_capture(monitor, tmp)
+            seconds = time.perf_counter() - start
+            sys.stdout = stdout
+        report = monitor.report()
+        print(f"{label:10s} {len(stream):8,d} {seconds:8.2f} {len(stream) / seconds:9,.0f} "
+              f"{state_bytes(monitor) / 1024:9.0f}  {report['drifting']}")
+
+        # KS from the sketches against scipy on the same rows
+        window_rows = int(report["rows"])
+        worst = 0.0
+        for feature, name in enumerate(FEATURE_COLUMNS):
+            exact_ks = ks_2samp(train[:, feature], stream[-window_rows:, feature]).statistic
+            worst = max(worst, abs(report["features"][name]["ks"] - exact_ks))
+        print(f"{'':10s} sketch KS vs scipy over {window_rows:,} rows: max abs difference {worst:.4f}")
+        # replacements are scheduled the same way all year, only the shifted features drift
+        expected = {"voltmean_3h", "vibrationsd_24h"} if label == "drifted" else set()
+        assert set(report["drifting"]) == expected
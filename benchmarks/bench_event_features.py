@@ -0,0 +1,97 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from preprocessing import COMPONENTS, ERROR_IDS, category_datatype, errors_lag_features, maintenance_features
+from synthetic_pdm import generate
+
+
+# Previous implementation of preprocessing.errors_lag_features (hourly merge, pivots, rolling sum), kept for comparison
+def legacy_errors_lag_features(df, telemetry_df):
+    df = category_datatype(df, 'errorID', ERROR_IDS)
+    error_count = pd.get_dummies(df.set_index('datetime')).reset_index()
+    error_count.columns = ['datetime', 'machineID', 'error1', 'error2', 'error3', 'error4', 'error5']
+    error_count = error_count.groupby(['machineID', 'datetime']).sum().reset_index()
+    error_count = telemetry_df[['datetime', 'machineID']].merge(error_count, on = ['machineID', 'datetime'], how = 'left').fillna(0.0)
+    temp = []
+    fields = ['error%d' % i for i in range(1, 6)]
+    for col in fields:
+        temp.append(pd.pivot_table(error_count, index = 'datetime', columns = 'machineID', values = col)
+                    .resample('3H', closed = 'left', label = 'right').first().unstack())
+    error_count = pd.concat(temp, axis = 1)
+    position = error_count.groupby(level = 'machineID').cumcount()
+    error_count = error_count.rolling(window = 24, center = False).sum().where(position >= 23)
+    error_count.columns = [i + 'count' for i in fields]
+    error_count.reset_index(inplace = True)
+    return error_count.dropna()
+
+
+# Previous implementation of preprocessing.maintenance_features (outer merge and ffill), kept for comparison
+def legacy_maintenance_features(df, telemetry_df):
+    df = category_datatype(df, 'comp', COMPONENTS)
+    comp_rep = pd.get_dummies(df.set_index('datetime')).reset_index()
+    comp_rep.columns = ['datetime', 'machineID', 'comp1', 'comp2', 'comp3', 'comp4']
+    comp_rep = comp_rep.groupby(['machineID', 'datetime']).sum().reset_index()
+    comp_rep = telemetry_df[['datetime', 'machineID']].merge(comp_rep, on = ['datetime', 'machineID'],
+                                                             how = 'outer').fillna(0).sort_values(by = ['machineID', 'datetime'])
+    for comp in COMPONENTS:
+        comp_rep.loc[comp_rep[comp] < 1, comp] = None
+        comp_rep.loc[-comp_rep[comp].isnull(), comp] = comp_rep.loc[-comp_rep[comp].isnull(), 'datetime']
+        comp_rep[comp] = comp_rep.groupby('machineID')[comp].ffill()
+    comp_rep = comp_rep.loc[comp_rep['datetime'] > pd.to_datetime('2015-01-01')]
+    for comp in COMPONENTS:
+        comp_rep[comp] = (comp_rep["datetime"] - pd.to_datetime(comp_rep[comp])) / np.timedelta64(1, "D")
+    return comp_rep
+
+
+# Telemetry keys with gaps: random missing readings, one machine with a missing day, one without any telemetry
+def gappy_keys(keys, seed = 1):
+    rng = np.random.default_rng(seed)
+    keys = keys.loc[rng.random(len(keys)) > 0.05]
+    day = (keys['machineID'] == 2) & (keys['datetime'].dt.dayofyear == 10)
+    return keys.loc[~day & (keys['machineID'] != 3)].reset_index(drop = True)
+
+
+# The reading keys the two implementations are compared and timed on (tests/test_event_features.py)
+def key_scenarios(keys):
+    return {
+        "full hourly grid": keys,
+        "gaps and missing machines": gappy_keys(keys),
+        "shifted start (13:00)": keys.loc[keys['datetime'] >= "2015-01-01 13:00:00"],
+    }
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 100)
+    parser.add_argument("--days", type = int, default = 365)
+    args = parser.parse_args()
+
+    raw = generate(args.machines, args.days)
+    errors, maint = raw['errors'], raw['maint']
+    scenarios = key_scenarios(raw['telemetry'][['datetime', 'machineID']])
+    print(f"{len(errors)} error and {len(maint)} maintenance events, {args.machines} machines x {args.days} days")
+    print(f"{'scenario':28s} {'table':6s} {'legacy s':>9s} {'events s':>9s} {'speedup':>8s} {'rows':>9s}")
+    with open(os.devnull, "w") as devnull:
+        for scenario, keys in scenarios.items():
+            for table, legacy, current in (("errors", legacy_errors_lag_features, errors_lag_features),
+                                           ("maint", legacy_maintenance_features, maintenance_features)):
+                events = errors if table == "errors" else maint
+                stdout, sys.stdout = sys.stdout, devnull
+                expected, legacy_s = timed(legacy, events.copy(), keys)
+                actual, current_s = timed(lambda e, k: current(e, k, upload = None), events.copy(), keys)
+                sys.stdout = stdout
+                print(f"{scenario:28s} {table:6s} {legacy_s:9.2f} {current_s:9.3f} {legacy_s / current_s:7.1f}x "
+                      f"{len(actual):9d}")
+    # equality with the legacy functions is checked by tests/test_event_features.py
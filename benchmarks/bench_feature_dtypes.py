@@ -0,0 +1,121 @@
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import preprocessing
+from feature_schema import FEATURE_COLUMNS, LABEL_COLUMN, encode_features, memory_report, read_training_csv
+from synthetic_pdm import generate
+
+# feature_sample's fleet: 8 labeled rows per machine and day (a few less on the first day), at most
+# MAX_SAMPLE_MACHINES machines
+SAMPLE_DAYS = 365
+MAX_SAMPLE_MACHINES = 50
+
+
+def labeled_table(n_machines, n_days, seed = 0):
+    inputs = generate(n_machines, n_days, seed)
+    telemetry_df = preprocessing.telemetry_features(inputs['telemetry'], upload = None)
+    errors_df = preprocessing.errors_lag_features(inputs['errors'], inputs['telemetry'], upload = None)
+    maint_df = preprocessing.maintenance_features(inputs['maint'], inputs['telemetry'], upload = None)
+    failures_df = preprocessing.failure_features(inputs['failures'], upload = None)
+    machines_df = preprocessing.machine_features(inputs['machines'])
+    return preprocessing.label_construct(telemetry_df, errors_df, maint_df, machines_df, failures_df, upload = None)
+
+
+# Model inputs (encoded, in feature contract order) and labels of n_rows labeled rows, from a synthetic_pdm fleet
+# just large enough to hold them; past MAX_SAMPLE_MACHINES machines the rows repeat in shuffled order
+def feature_sample(n_rows, seed = 0):
+    n_machines = min(MAX_SAMPLE_MACHINES, max(1, math.ceil(n_rows / (7 * SAMPLE_DAYS))))
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            labeled = labeled_table(n_machines, SAMPLE_DAYS, seed)
+        finally:
+            sys.stdout = stdout
+    rows = np.resize(np.random.default_rng(seed).permutation(len(labeled)), n_rows)
+    sample = labeled.iloc[rows].reset_index(drop = True)
+    return encode_features(sample), sample[LABEL_COLUMN].astype(str).to_numpy()
+
+
+# The labeled table as label_construct produced it before the schema: float64 numbers, int64 keys, string labels
+def legacy_table(labeled):
+    legacy = labeled.copy()
+    for col in legacy.columns:
+        if pd.api.types.is_float_dtype(legacy[col]) or pd.api.types.is_unsigned_integer_dtype(legacy[col]):
+            legacy[col] = legacy[col].astype(np.float64)
+    legacy['machineID'] = legacy['machineID'].astype(np.int64)
+    legacy['age'] = legacy['age'].astype(np.int64)
+    legacy[LABEL_COLUMN] = legacy[LABEL_COLUMN].astype(str)
+    return legacy
+
+
+def legacy_matrix(legacy):
+    return pd.get_dummies(legacy.drop(['datetime', 'machineID', LABEL_COLUMN], axis = 1))
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def fit(X, y, n_estimators, seed = 0):
+    model = RandomForestClassifier(n_estimators = n_estimators, min_samples_leaf = 3, random_state = seed, n_jobs = -1)
+    return timed(model.fit, X, y)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 1000)
+    parser.add_argument("--days", type = int, default = 120)
+    parser.add_argument("--fit-rows", type = int, default = 200000)
+    parser.add_argument("--n-estimators", type = int, default = 10)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        labeled = labeled_table(args.machines, args.days)
+        sys.stdout = stdout
+    legacy = legacy_table(labeled)
+    print(f"{args.machines} machines x {args.days} days: {len(labeled):,} labeled rows")
+
+    (old_matrix, old_split), (new_matrix, new_split) = timed(legacy_matrix, legacy), timed(encode_features, labeled)
+    rows = []
+    for name, old, new in (("labeled table", legacy, labeled), ("training matrix", old_matrix, new_matrix)):
+        old, new = memory_report(old), memory_report(new)
+        rows.append((name, old["bytes"] / 2**20, new["bytes"] / 2**20, old["bytes_per_row"], new["bytes_per_row"]))
+    print(f"{'':16s} {'float64 MB':>10s} {'schema MB':>10s} {'B/row':>7s} {'B/row':>7s} {'saved':>6s}")
+    for name, old_mb, new_mb, old_row, new_row in rows:
+        print(f"{name:16s} {old_mb:10.1f} {new_mb:10.1f} {old_row:7.0f} {new_row:7.0f} {1 - new_mb / old_mb:6.0%}")
+
+    print(f"{'':16s} {'float64 s':>10s} {'schema s':>10s}")
+    print(f"{'feature matrix':16s} {old_split:10.2f} {new_split:10.2f}")
+    with tempfile.TemporaryDirectory() as tmp:
+        old_train = old_matrix.assign(**{LABEL_COLUMN: legacy[LABEL_COLUMN]})
+        new_train = new_matrix.assign(**{LABEL_COLUMN: labeled[LABEL_COLUMN]})
+        old_path, new_path = os.path.join(tmp, "old.csv"), os.path.join(tmp, "new.csv")
+        _, old_write = timed(lambda: old_train.to_csv(old_path, index = False))
+        _, new_write = timed(lambda: new_train.to_csv(new_path, index = False))
+        print(f"{'write train CSV':16s} {old_write:10.2f} {new_write:10.2f}")
+        old_read, old_read_s = timed(pd.read_csv, old_path)
+        new_read, new_read_s = timed(read_training_csv, new_path)
+        print(f"{'read train CSV':16s} {old_read_s:10.2f} {new_read_s:10.2f}   "
+              f"({memory_report(old_read)['bytes'] / 2**20:.0f} MB vs {memory_report(new_read)['bytes'] / 2**20:.0f} MB)")
+        assert list(new_read.columns) == FEATURE_COLUMNS + [LABEL_COLUMN]
+
+    # random forest on the same rows, the float64 frame is copied to float32 inside fit
+    sample = np.random.default_rng(0).choice(len(labeled), size = min(args.fit_rows, len(labeled)), replace = False)
+    old_model, old_fit = fit(old_matrix.iloc[sample], legacy[LABEL_COLUMN].iloc[sample], args.n_estimators)
+    new_model, new_fit = fit(new_matrix.iloc[sample], labeled[LABEL_COLUMN].iloc[sample], args.n_estimators)
+    print(f"{'forest fit':16s} {old_fit:10.2f} {new_fit:10.2f}   ({len(sample):,} rows, {args.n_estimators} trees)")
+    old_accuracy = (old_model.predict(old_matrix.iloc[sample]) == legacy[LABEL_COLUMN].iloc[sample]).mean()
+    new_accuracy = (new_model.predict(new_matrix.iloc[sample]) == labeled[LABEL_COLUMN].iloc[sample].astype(str)).mean()
+    print(f"training accuracy {old_accuracy:.4f} (one-hot models) vs {new_accuracy:.4f} (model codes)")
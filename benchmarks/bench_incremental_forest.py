@@ -0,0 +1,73 @@
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from feature_schema import FEATURE_COLUMNS
+from incremental_forest import check_feature_order, grow_forest, macro_f1
+from train_test_split_data import load_walk_forward, train_test_split_script, walk_forward_datetimes
+from bench_feature_dtypes import labeled_table
+
+
+def fit(X, y, n_estimators, seed = 0):
+    start = time.perf_counter()
+    model = RandomForestClassifier(n_estimators = n_estimators, min_samples_leaf = 3, random_state = seed, n_jobs = -1)
+    model.fit(X, y)
+    return model, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 60)
+    parser.add_argument("--days", type = int, default = 300)
+    parser.add_argument("--n-estimators", type = int, default = 30)
+    parser.add_argument("--new-estimators", type = int, default = 10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        for name in ("train", "test"):
+            os.makedirs(os.path.join(tmp, name))
+        stdout, sys.stdout = sys.stdout, devnull
+        train_test_split_script(labeled_table(args.machines, args.days), tmp)
+        sys.stdout = stdout
+        X, y, folds = load_walk_forward(os.path.join(tmp, "train"))
+        datetimes = walk_forward_datetimes(os.path.join(tmp, "train")).to_numpy()
+
+    # previous model: trained up to the first fold's cutoff; new data: up to the last fold's cutoff
+    old_end, new_end, test_start = folds[0]["train_end"], folds[-1]["train_end"], folds[-1]["test_start"]
+    X_test, y_test = X.iloc[test_start:], y.iloc[test_start:]
+    previous, previous_s = fit(X.iloc[:old_end], y.iloc[:old_end], args.n_estimators)
+    full, full_s = fit(X.iloc[:new_end], y.iloc[:new_end], args.n_estimators)
+    print(f"{old_end:,} rows seen by the previous model, {new_end - old_end:,} new rows, "
+          f"{len(X_test):,} held-out rows")
+
+    print(f"{'':34s} {'seconds':>8s} {'trees':>6s} {'held-out macro F1':>18s}")
+    print(f"{'previous model':34s} {previous_s:8.2f} {len(previous.estimators_):6d} "
+          f"{macro_f1(previous, X_test, y_test):18.4f}")
+    print(f"{'full retrain on all rows':34s} {full_s:8.2f} {len(full.estimators_):6d} {macro_f1(full, X_test, y_test):18.4f}")
+    for label, max_estimators in (("warm start +%d trees" % args.new_estimators, None),
+                                  ("rolling, oldest %d replaced" % args.new_estimators, args.n_estimators)):
+        model = copy.deepcopy(previous)
+        report = grow_forest(model, X.iloc[old_end:new_end], y.iloc[old_end:new_end], args.new_estimators, max_estimators)
+        print(f"{label:34s} {report['fit_seconds']:8.2f} {report['n_estimators']:6d} "
+              f"{macro_f1(model, X_test, y_test):18.4f}")
+
+    # growth time follows the size of the new slice; short slices usually lack some failure classes
+    print(f"{'new days':>8s} {'new rows':>9s} {'seconds':>8s} {'missing classes':>16s}")
+    cutoff = datetimes[old_end]
+    for days in (1, 7, 14, 28, 56):
+        end = int(np.searchsorted(datetimes, cutoff + np.timedelta64(days, 'D')))
+        report = grow_forest(copy.deepcopy(previous), X.iloc[old_end:end], y.iloc[old_end:end], args.new_estimators)
+        print(f"{days:8d} {end - old_end:9,d} {report['fit_seconds']:8.2f} {report['missing_classes']:16d}")
+
+    try:
+        check_feature_order(previous, {}, FEATURE_COLUMNS[1:] + FEATURE_COLUMNS[:1])
+        raise AssertionError("a reordered feature contract should be rejected")
+    except ValueError as e:
+        print(f"reordered columns rejected: {str(e)[:80]}...")
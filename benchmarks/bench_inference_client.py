@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from inference_client import HttpTransport, LocalEndpoint, read_batches, run_batches
+from bench_batch_score import model_dir
+from bench_feature_dtypes import feature_sample
+
+
+# Previous inference_client.read_batches, kept for comparison: the header check ran on the first line of every
+# batch, so a batch starting with a "nan" row lost that row
+def legacy_read_batches(path, batch_size):
+    with open(path) as f:
+        batch = []
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if not batch and not (line[0].isdigit() or line[0] in "+-."):
+                # header row
+                continue
+            batch.append(line)
+            if len(batch) == batch_size:
+                yield len(batch), "\n".join(batch)
+                batch = []
+        if batch:
+            yield len(batch), "\n".join(batch)
+
+
+def timed_read(reader, path, batch_size):
+    start = time.perf_counter()
+    rows = sum(n_rows for n_rows, _ in reader(path, batch_size))
+    return rows, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type = int, default = 1_000_000)
+    parser.add_argument("--endpoint-rows", type = int, default = 20000)
+    parser.add_argument("--n-estimators", type = int, default = 10)
+    parser.add_argument("--batch-sizes", type = int, nargs = "+", default = [1, 16, 64, 256])
+    parser.add_argument("--concurrency", type = int, default = 8)
+    # every this many rows the first feature is missing, as after a sensor gap
+    parser.add_argument("--missing-every", type = int, default = 97)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        features = feature_sample(args.rows)[0].astype(np.float32)
+        features.iloc[::args.missing_every, 0] = np.nan
+        path = os.path.join(tmp, "inference.csv")
+        features.to_csv(path, index = False, na_rep = "nan")
+        print(f"{args.rows:,} rows with a header, every {args.missing_every}th row starting with nan")
+
+        print(f"{'reader':10s} {'batch':>6s} {'rows read':>10s} {'seconds':>8s}")
+        for batch_size in args.batch_sizes:
+            for label, reader in (("previous", legacy_read_batches), ("current", read_batches)):
+                rows, seconds = timed_read(reader, path, batch_size)
+                print(f"{label:10s} {batch_size:6d} {rows:10,d} {seconds:8.2f}")
+            assert rows == args.rows
+
+        endpoint_path = os.path.join(tmp, "endpoint.csv")
+        features.iloc[:args.endpoint_rows].to_csv(endpoint_path, index = False, na_rep = "nan")
+        model = model_dir(os.path.join(tmp, "model"), args.n_estimators)
+        print(f"local endpoint, {args.endpoint_rows:,} rows, {args.n_estimators} trees, "
+              f"concurrency {args.concurrency}")
+        with LocalEndpoint(model) as endpoint:
+            for batch_size in args.batch_sizes:
+                report = run_batches(read_batches(endpoint_path, batch_size), HttpTransport(endpoint.url),
+                                     args.concurrency)
+                assert report["rows"] == args.endpoint_rows
+                print(f"  batch {batch_size:4d} {report['rows_per_sec']:10,.0f} rows/s  p50 {report['p50_ms']:6.1f} ms"
+                      f"  p99 {report['p99_ms']:6.1f} ms")
@@ -0,0 +1,80 @@
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import rf_script
+from bench_feature_dtypes import feature_sample
+
+INFERENCE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "datasets", "PdM_inference_data.csv")
+
+
+# Forest with the production hyperparameters, fitted on labeled rows in the inference data's column order
+def fit_model(n_estimators, seed = 0):
+    X, y = feature_sample(20000, seed)
+    model = RandomForestClassifier(n_estimators = n_estimators, min_samples_leaf = 3, n_jobs = -1, random_state = seed)
+    return model.fit(X.to_numpy(np.float32), y)
+
+
+def encode(rows, content_type):
+    if content_type == rf_script.CSV_CONTENT_TYPE:
+        return "\n".join(",".join(repr(float(v)) for v in row) for row in rows)
+    if content_type == rf_script.JSON_CONTENT_TYPE:
+        return json.dumps(rows.tolist())
+    if content_type == rf_script.JSONLINES_CONTENT_TYPE:
+        return "\n".join(json.dumps(row) for row in rows.tolist())
+    buffer = io.BytesIO()
+    np.save(buffer, rows.astype(np.float32))
+    return buffer.getvalue()
+
+
+# Full handler chain for one request, as the serving container runs it
+def invoke(model, body, content_type, accept = rf_script.JSON_CONTENT_TYPE):
+    data = rf_script.input_fn(body, content_type)
+    return rf_script.output_fn(rf_script.predict_fn(data, model), accept)
+
+
+def rows_per_second(model, rows, batch_size, content_type):
+    requests = [encode(rows[i:i + batch_size], content_type) for i in range(0, len(rows), batch_size)]
+    start = time.perf_counter()
+    for body in requests:
+        invoke(model, body, content_type)
+    return len(rows) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-estimators", type = int, default = 100)
+    parser.add_argument("--rows", type = int, default = 5000)
+    parser.add_argument("--per-row-limit", type = int, default = 500)
+    parser.add_argument("--batch-sizes", type = int, nargs = "+", default = [32, 256, 1024])
+    args = parser.parse_args()
+
+    base = np.loadtxt(INFERENCE_DATA, delimiter = ",")
+    rows = base[np.arange(args.rows) % len(base)]
+    with tempfile.TemporaryDirectory() as model_dir:
+        joblib.dump(fit_model(args.n_estimators), os.path.join(model_dir, "model.joblib"))
+        model = rf_script.model_fn(model_dir)
+        model.set_params(n_jobs = 1)
+
+        # handlers must agree with sklearn on every row
+        result = json.loads(invoke(model, encode(rows[:256], rf_script.CSV_CONTENT_TYPE), rf_script.CSV_CONTENT_TYPE)[0])
+        assert result["predictions"] == model.predict(rows[:256]).tolist()
+
+        print(f"{args.n_estimators} trees, {args.rows} rows from {os.path.basename(INFERENCE_DATA)}")
+        for content_type in (rf_script.CSV_CONTENT_TYPE, rf_script.JSON_CONTENT_TYPE,
+                             rf_script.JSONLINES_CONTENT_TYPE, rf_script.NPY_CONTENT_TYPE):
+            per_row = rows_per_second(model, rows[:args.per_row_limit], 1, content_type)
+            line = f"{content_type:24s} per-row {per_row:10.0f} rows/s"
+            for batch_size in args.batch_sizes:
+                batched = rows_per_second(model, rows, batch_size, content_type)
+                line += f" | batch {batch_size:5d} {batched:10.0f} rows/s ({batched / per_row:5.0f}x)"
+            print(line)
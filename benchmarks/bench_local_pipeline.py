@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from local_pipeline import ArtifactStore, DEFAULT_STAGES, run_pipeline
+from synthetic_pdm import write_dataset
+
+
+def timed_run(store, raw_dir, params, force = ()):
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        start = time.perf_counter()
+        try:
+            results = run_pipeline(raw_dir, DEFAULT_STAGES, params, force, store)
+        finally:
+            sys.stdout = stdout
+    return results, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 20)
+    parser.add_argument("--days", type = int, default = 300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = os.path.join(tmp, "raw")
+        write_dataset(raw_dir, args.machines, args.days)
+        store = ArtifactStore(os.path.join(tmp, "artifacts"), max_bytes = 0)
+        params = {'train': {'n_estimators': 10}}
+
+        print(f"{'run':32s} {'seconds':>8s}  " + " ".join(f"{stage:>10s}" for stage in DEFAULT_STAGES))
+        runs = [("cold", params, ()),
+                ("unchanged rerun", params, ()),
+                ("--force split", params, ("split",)),
+                ("train.n_estimators=20", {'train': {'n_estimators': 20}}, ()),
+                ("back to n_estimators=10", params, ())]
+        outputs = {}
+        for label, run_params, force in runs:
+            results, seconds = timed_run(store, raw_dir, run_params, force)
+            print(f"{label:32s} {seconds:8.1f}  " + " ".join(f"{results[s][0]:>10s}" for s in DEFAULT_STAGES))
+            outputs[label] = {stage: result[2] for stage, result in results.items()}
+        assert outputs["unchanged rerun"] == outputs["cold"]
+        # a forced split writes the same bytes, so train and deploy still hit
+        assert outputs["--force split"] == outputs["cold"]
+        assert outputs["back to n_estimators=10"] == outputs["cold"]
+
+        # size-based eviction: the least recently used train/deploy outputs go first
+        entries = list(store.entries())
+        total = sum(m["bytes"] for m in entries)
+        small = ArtifactStore(store.root, max_bytes = total - 1)
+        _, seconds = timed_run(small, raw_dir, params)
+        kept = {(m["stage"], m["key"]) for m in small.entries()}
+        evicted = [m for m in entries if (m["stage"], m["key"]) not in kept]
+        print(f"{len(entries)} entries, {total / 2**20:.1f} MB; with max_bytes={total - 1} "
+              f"evicted {[m['stage'] for m in evicted]}")
+        assert all(m["stage"] in ("train", "deploy") and m["params"].get("n_estimators") == 20 for m in evicted)
@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+from compact_forest import export_forest, load_forest
+from bench_feature_dtypes import feature_sample
+
+# Runs in a fresh interpreter so load time and RSS are not polluted by the training process
+LOAD_PROBE = """
+import json, sys, time
+import numpy as np
+sys.path.insert(0, {scripts!r})
+import rf_script
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS"))
+
+base = rss_kb()
+start = time.perf_counter()
+model = rf_script.model_fn({model_dir!r})
+load = time.perf_counter() - start
+after_load = rss_kb()
+X = np.load({sample!r})
+start = time.perf_counter()
+model.predict_proba(X)
+first = time.perf_counter() - start
+after_predict = rss_kb()
+print(json.dumps({{"load_s": load, "first_predict_s": first,
+                   "rss_load_mb": (after_load - base) / 1024, "rss_predict_mb": (after_predict - base) / 1024}}))
+"""
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def probe(model_dir, sample):
+    code = LOAD_PROBE.format(scripts = SCRIPTS_DIR, model_dir = model_dir, sample = sample)
+    output = subprocess.run([sys.executable, "-W", "ignore", "-c", code], capture_output = True, text = True, check = True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type = int, default = 200000)
+    parser.add_argument("--n-estimators", type = int, default = 100)
+    parser.add_argument("--min-samples-leaf", type = int, default = 3)
+    args = parser.parse_args()
+
+    X, y = feature_sample(args.rows)
+    X = X.to_numpy(np.float32)
+    start = time.perf_counter()
+    model = RandomForestClassifier(n_estimators = args.n_estimators, min_samples_leaf = args.min_samples_leaf,
+                                   n_jobs = -1, random_state = 0).fit(X, y)
+    print(f"trained {args.n_estimators} trees on {args.rows} rows in {time.perf_counter() - start:.1f}s, "
+          f"{sum(e.tree_.node_count for e in model.estimators_):,} nodes")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        joblib_dir = os.path.join(tmp, "joblib")
+        compact_dir = os.path.join(tmp, "compact")
+        os.makedirs(joblib_dir)
+        joblib.dump(model, os.path.join(joblib_dir, "model.joblib"))
+        export_forest(model, os.path.join(compact_dir, "forest"))
+
+        sample = os.path.join(tmp, "sample.npy")
+        np.save(sample, X[:1024])
+        forest = load_forest(os.path.join(compact_dir, "forest"))
+        np.testing.assert_allclose(forest.predict_proba(X[:5000]), model.predict_proba(X[:5000]), rtol = 0, atol = 1e-12)
+        assert (forest.predict(X[:5000]) == model.predict(X[:5000])).all()
+        print("parity with sklearn on 5000 rows: OK")
+
+        print(f"{'format':8s} {'size MB':>9s} {'load s':>8s} {'RSS load MB':>12s} {'1st predict s':>14s} {'RSS predict MB':>15s}")
+        for name, model_dir in (("joblib", joblib_dir), ("compact", compact_dir)):
+            result = probe(model_dir, sample)
+            print(f"{name:8s} {directory_size(model_dir) / 2**20:9.1f} {result['load_s']:8.3f} {result['rss_load_mb']:12.1f} "
+                  f"{result['first_predict_s']:14.3f} {result['rss_predict_mb']:15.1f}")
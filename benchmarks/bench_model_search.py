@@ -0,0 +1,60 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from feature_schema import FEATURE_COLUMNS
+from model_search import search_configurations, successive_halving
+from train_test_split_data import load_walk_forward, train_test_split_script
+from bench_feature_dtypes import labeled_table
+
+SPACE = {"n_estimators": [10, 30], "min_samples_leaf": [1, 5, 20], "max_features": ["sqrt", 0.5]}
+
+
+def run(features, labels, folds, configurations, workers, halving_factor):
+    start = time.perf_counter()
+    board = successive_halving(features, labels, folds, configurations, workers, halving_factor)
+    return board, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 30)
+    parser.add_argument("--days", type = int, default = 300)
+    parser.add_argument("--workers", type = int, default = os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        for name in ("train", "test"):
+            os.makedirs(os.path.join(tmp, name))
+        stdout, sys.stdout = sys.stdout, devnull
+        train_test_split_script(labeled_table(args.machines, args.days), tmp)
+        sys.stdout = stdout
+        features, labels, folds = load_walk_forward(os.path.join(tmp, "train"))
+    X, y = features[FEATURE_COLUMNS].to_numpy("float32"), labels.cat.codes.to_numpy()
+    configurations = search_configurations(SPACE)
+    print(f"{len(X):,} rows ({X.nbytes / 2**20:.0f} MB shared matrix), {len(folds)} walk-forward folds, "
+          f"{len(configurations)} configurations, {args.workers} workers")
+
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        exhaustive, exhaustive_s = run(X, y, folds, configurations, args.workers, 1)
+        halving, halving_s = run(X, y, folds, configurations, args.workers, 3)
+        sys.stdout = stdout
+
+    ranking = [json.dumps(row["config"], sort_keys = True) for row in exhaustive]
+    best = json.dumps(halving[0]["config"], sort_keys = True)
+    full_fits = len(configurations) * len(folds)
+    halving_fits = sum(row["rung"] + 1 for row in halving) * len(folds)
+    print(f"{'':24s} {'seconds':>8s} {'fits':>5s}  best configuration (mean macro F1)")
+    print(f"{'every config, all rows':24s} {exhaustive_s:8.1f} {full_fits:5d}  {exhaustive[0]['config']} "
+          f"({exhaustive[0]['f1_macro']:.4f})")
+    print(f"{'successive halving':24s} {halving_s:8.1f} {halving_fits:5d}  {halving[0]['config']} "
+          f"({halving[0]['f1_macro']:.4f})")
+    print(f"halving's pick is #{ranking.index(best) + 1} of {len(ranking)} in the exhaustive ranking")
+    worker_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"largest worker RSS {worker_mb:.0f} MB with the matrix memory-mapped")
@@ -0,0 +1,86 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from feature_ingest import FeatureStoreIngester, IngestCheckpoint, LocalFeatureStoreClient, feature_store_types
+from feature_lookup import FEATURE_GROUPS, OnlineFeatureAssembler, TTLCache
+from feature_schema import encode_features
+from preprocessing import errors_lag_features, maintenance_features, telemetry_features
+from storage import LocalS3Client
+from synthetic_pdm import generate
+
+
+# Preprocessed tables of n_machines over n_days, shaped like preprocessing.py's uploads
+def preprocessed_tables(n_machines, n_days):
+    raw = generate(n_machines, n_days)
+    telemetry = telemetry_features(raw['telemetry'], upload = None)
+    return {
+        'telemetry_fg': telemetry,
+        'errors_fg': errors_lag_features(raw['errors'], telemetry, upload = None),
+        'maintenance_fg': maintenance_features(raw['maint'], telemetry, upload = None),
+        'machines_fg': raw['machines'],
+    }
+
+
+# Vector of every machine built from each table's latest row, independently of the online store
+def expected_vectors(tables):
+    latest = {}
+    for name, df in tables.items():
+        if 'datetime' in df.columns:
+            df = df.sort_values('datetime').groupby('machineID').tail(1)
+        latest[name] = df.set_index('machineID')[FEATURE_GROUPS[name]]
+    merged = pd.concat(latest.values(), axis = 1)
+    return encode_features(merged).astype(np.float32)
+
+
+def run_workload(assembler, requests):
+    for machine_ids in requests:
+        assembler.assemble([{"machineID": m} for m in machine_ids])
+    return assembler.metrics()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 100)
+    parser.add_argument("--days", type = int, default = 30)
+    parser.add_argument("--requests", type = int, default = 2000)
+    parser.add_argument("--batch", type = int, default = 8)
+    parser.add_argument("--latency-ms", type = float, default = 5.0)
+    args = parser.parse_args()
+
+    tables = preprocessed_tables(args.machines, args.days)
+    store = LocalFeatureStoreClient(creating_polls = 0)
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = IngestCheckpoint(LocalS3Client(tmp), "bucket", "checkpoint.json")
+        ingester = FeatureStoreIngester(store, store, checkpoint, max_workers = 8, chunk_rows = 2000, poll_interval = 0.01)
+        ingester.run({name: feature_store_types(df.copy()) for name, df in tables.items()},
+                     "machineID", "event_time", "s3://bucket/offline", "role")
+
+    # every machine's assembled vector is its latest row of each preprocessed table
+    expected = expected_vectors(tables)
+    assembled = OnlineFeatureAssembler(store).assemble([{"machineID": m} for m in expected.index])
+    np.testing.assert_allclose(assembled, expected.to_numpy(), rtol = 1e-6)
+    print(f"assembled vectors for {len(expected)} machines match the latest preprocessed rows: OK")
+
+    # skewed traffic: a few machines are scored far more often than the rest
+    rng = np.random.default_rng(0)
+    popularity = 1.0 / np.arange(1, args.machines + 1)
+    requests = [rng.choice(np.arange(1, args.machines + 1), size = args.batch, p = popularity / popularity.sum())
+                for _ in range(args.requests)]
+    store.latency = args.latency_ms / 1000
+
+    print(f"{args.requests} requests of {args.batch} machines, {args.latency_ms} ms per BatchGetRecord")
+    for label, cache in (("no cache", TTLCache(ttl = 0.0)), ("LRU/TTL 300s", TTLCache(ttl = 300.0)),
+                         ("LRU 120 entries", TTLCache(max_entries = 120, ttl = 300.0))):
+        start = time.perf_counter()
+        metrics = run_workload(OnlineFeatureAssembler(store, cache = cache), requests)
+        elapsed = time.perf_counter() - start
+        print(f"{label:15s} {elapsed:6.2f}s  hit rate {metrics['cache_hit_rate']:.3f}  "
+              f"BatchGetRecord calls {metrics['batch_get_calls']:5d}  "
+              f"assemble p50 {metrics['assemble_p50_ms']:.2f} ms  p99 {metrics['assemble_p99_ms']:.2f} ms")
@@ -0,0 +1,75 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import preprocessing
+import profiler
+from bench_telemetry_features import legacy_telemetry_features
+from synthetic_pdm import generate
+
+
+def trace_run(path, function, telemetry, repeat):
+    profiler.events.clear()
+    profiler.configure(trace = path or "")
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function(telemetry.copy())
+        seconds = time.perf_counter() - start
+        sys.stdout = stdout
+    profiler.write_trace()
+    profiler.configure(trace = "")
+    return seconds / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 30)
+    parser.add_argument("--days", type = int, default = 365)
+    parser.add_argument("--calls", type = int, default = 20000)
+    parser.add_argument("--repeat", type = int, default = 3)
+    args = parser.parse_args()
+
+    # fixed cost of one stage call, with profiling off and with a trace
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, trace in (("profiling off", ""), ("trace", os.path.join(tmp, "noop.json"))):
+            profiler.configure(trace = trace)
+            start = time.perf_counter()
+            for _ in range(args.calls):
+                with profiler.profile_stage("noop"):
+                    pass
+            per_call = (time.perf_counter() - start) / args.calls
+            profiler.events.clear()
+            print(f"profile_stage overhead, {label}: {per_call * 1e6:.2f} us per stage call")
+        profiler.configure(trace = "")
+
+    telemetry = generate(args.machines, args.days)['telemetry']
+    features = lambda df: preprocessing.telemetry_features(df, upload = None)
+    trace_run(None, features, telemetry, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"telemetry_features on {len(telemetry):,} rows        seconds")
+        timings = {}
+        for label, memory, dump_dir in (("timing + RSS", False, None), ("with tracemalloc", True, None),
+                                        ("with cProfile dumps", False, os.path.join(tmp, "dumps"))):
+            profiler.configure(memory = memory, dump_dir = dump_dir or "")
+            timings[label] = trace_run(os.path.join(tmp, f"{label}.json"), features, telemetry, args.repeat)
+            print(f"  {label:36s} {timings[label]:8.2f}")
+        profiler.configure(memory = False, dump_dir = "")
+
+        # a regression shows up as a number: the previous implementation traced under the same stage name
+        baseline = os.path.join(tmp, "timing + RSS.json")
+        current = os.path.join(tmp, "legacy.json")
+        legacy = profiler.stage("telemetry_features")(legacy_telemetry_features)
+        telemetry['datetime'] = pd.to_datetime(telemetry['datetime'])
+        trace_run(current, legacy, telemetry, 1)
+        for row in profiler.compare(baseline, current):
+            if row["stage"] == "telemetry_features":
+                print(f"compare: telemetry_features {row['before']:.2f}s -> {row['after']:.2f}s "
+                      f"({row['change']:+.0%}), regression={row['regression']}")
+                assert row["regression"]
@@ -0,0 +1,85 @@
+import argparse
+import filecmp
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+import preprocessing
+from storage import TableStore
+from synthetic_pdm import generate
+
+TABLES = ['telemetry', 'errors', 'maint', 'failures', 'machines', 'preprocessed']
+
+
+def list_files(root):
+    return sorted(os.path.relpath(os.path.join(d, f), root) for d, _, files in os.walk(root) for f in files)
+
+
+# One configuration in this process: featurize, write every table, report time and peak RSS
+def run(n_machines, n_days, workers, machines_per_shard, out_dir):
+    inputs = generate(n_machines, n_days)
+    stores = [TableStore(os.path.join(out_dir, fmt), format = fmt) for fmt in ("parquet", "csv")]
+    upload = lambda df, name: [store.write(df, name) for store in stores]
+
+    start = time.perf_counter()
+    if workers == 1:
+        telemetry_df = preprocessing.telemetry_features(inputs['telemetry'], upload = upload)
+        errors_df = preprocessing.errors_lag_features(inputs['errors'], inputs['telemetry'], upload = upload)
+        maint_df = preprocessing.maintenance_features(inputs['maint'], inputs['telemetry'], upload = upload)
+        failures_df = preprocessing.failure_features(inputs['failures'], upload = upload)
+        machines_df = preprocessing.machine_features(inputs['machines'])
+        preprocessing.label_construct(telemetry_df, errors_df, maint_df, machines_df, failures_df, upload = upload)
+    else:
+        preprocessing.sharded_features(inputs['telemetry'], inputs['errors'], inputs['maint'], inputs['failures'],
+                                       inputs['machines'], workers, machines_per_shard, upload = upload)
+    elapsed = time.perf_counter() - start
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return {"seconds": elapsed, "parent_mb": own, "worker_mb": children}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 400)
+    parser.add_argument("--days", type = int, default = 120)
+    parser.add_argument("--machines-per-shard", type = int, default = 25)
+    parser.add_argument("--workers", type = int, nargs = "+", default = [1, 2, 4, 8])
+    parser.add_argument("--run-one", type = str)
+    args = parser.parse_args()
+
+    if args.run_one:
+        workers, out_dir = args.run_one.split(":", 1)
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            result = run(args.machines, args.days, int(workers), args.machines_per_shard, out_dir)
+            sys.stdout = stdout
+        print(json.dumps(result))
+        sys.exit()
+
+    print(f"{args.machines} machines x {args.days} days, {args.machines_per_shard} machines per shard, "
+          f"{os.cpu_count()} CPUs")
+    print(f"{'workers':>7s} {'seconds':>8s} {'speedup':>8s} {'parent MB':>10s} {'worker MB':>10s} {'identical':>10s}")
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = None
+        for workers in args.workers:
+            out_dir = os.path.join(tmp, str(workers))
+            output = subprocess.run([sys.executable, "-W", "ignore", __file__, "--machines", str(args.machines),
+                                     "--days", str(args.days), "--machines-per-shard", str(args.machines_per_shard),
+                                     "--run-one", f"{workers}:{out_dir}"], capture_output = True, text = True, check = True)
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            if baseline is None:
+                baseline = (out_dir, result["seconds"])
+                identical = "-"
+            else:
+                files = list_files(baseline[0])
+                assert files == list_files(out_dir), "different table layout"
+                _, mismatch, errors = filecmp.cmpfiles(baseline[0], out_dir, files, shallow = False)
+                identical = "yes" if not mismatch and not errors else f"NO {mismatch[:3]}"
+            print(f"{workers:7d} {result['seconds']:8.2f} {baseline[1] / result['seconds']:7.2f}x "
+                  f"{result['parent_mb']:10.0f} {result['worker_mb']:10.0f} {identical:>10s}")
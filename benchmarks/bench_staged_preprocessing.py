@@ -0,0 +1,117 @@
+import argparse
+import functools
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+# --format csv uploads single CSV objects through the S3 client, which is swapped for a local one below
+os.environ["PDM_DATA_FORMAT"] = "csv"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import aws_clients
+import preprocessing
+from storage import LocalS3Client, TableStore, read_csv_object
+from synthetic_pdm import TABLES, write_dataset
+
+
+# LocalS3Client with the transfer time of a network link; the sleep releases the GIL like a socket read does
+class SlowS3Client(LocalS3Client):
+    def __init__(self, root, bandwidth):
+        super().__init__(root)
+        self.bandwidth = bandwidth
+
+    def transfer(self, size):
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+
+    def get_object(self, Bucket, Key):
+        response = super().get_object(Bucket, Key)
+        self.transfer(len(response["Body"].getbuffer()))
+        return response
+
+    def put_object(self, Bucket, Key, Body):
+        self.transfer(len(Body))
+        return super().put_object(Bucket, Key, Body)
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.transfer(len(Body))
+        return super().upload_part(Bucket, Key, UploadId, PartNumber, Body)
+
+
+# The previous __main__: five reads one after another, then the features with synchronous uploads
+def legacy_main(readers, steps):
+    def step(name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        steps[name] = time.perf_counter() - start
+        return result
+
+    raw = {name: step(f"read {name}", read) for name, read in readers.items()}
+    telemetry_df = step("telemetry_features", preprocessing.telemetry_features, raw['telemetry'])
+    errors_df = step("errors_lag_features", preprocessing.errors_lag_features, raw['errors'], raw['telemetry'])
+    maint_df = step("maintenance_features", preprocessing.maintenance_features, raw['maint'], raw['telemetry'])
+    failures_df = step("failure_features", preprocessing.failure_features, raw['failures'])
+    machines_df = preprocessing.machine_features(raw['machines'])
+    step("label_construct", preprocessing.label_construct, telemetry_df, errors_df, maint_df, machines_df, failures_df)
+
+
+def staged_main(readers):
+    uploads = preprocessing.UploadQueue(preprocessing.upload_file_s3)
+    preprocessing.staged_features(readers, upload = uploads)
+    uploads.close()
+
+
+def timed(function, *args):
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        start = time.perf_counter()
+        try:
+            function(*args)
+        finally:
+            sys.stdout = stdout
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 100)
+    parser.add_argument("--days", type = int, default = 365)
+    # MB/s of the simulated S3 link per request, 0 for disk speed
+    parser.add_argument("--bandwidth", type = float, default = 50)
+    # parquet: partitioned tables written through pyarrow to a local directory instead of the S3 client
+    parser.add_argument("--format", type = str, default = "csv", choices = ["csv", "parquet"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_prefix = f"{preprocessing.prefix}/data/raw"
+        write_dataset(os.path.join(tmp, "s3", preprocessing.bucket, *raw_prefix.split("/")), args.machines, args.days)
+        client = SlowS3Client(os.path.join(tmp, "s3"), args.bandwidth * 2**20)
+        aws_clients.set_client("s3", client)
+        readers = {name: functools.partial(read_csv_object, client, preprocessing.bucket, f"{raw_prefix}/PdM_{name}.csv")
+                   for name in TABLES}
+        s3_output = os.path.join(tmp, "s3", preprocessing.bucket, *preprocessing.prefix.split("/"), "data", "preprocessed")
+
+        def run(label, function, *function_args):
+            if args.format == "parquet":
+                preprocessing.preprocessed_store = TableStore(os.path.join(tmp, label), format = "parquet")
+                return timed(function, *function_args), preprocessing.preprocessed_store
+            seconds = timed(function, *function_args)
+            # the CSV objects are moved aside so the next run starts from an empty prefix
+            os.rename(s3_output, os.path.join(tmp, label))
+            return seconds, TableStore(os.path.join(tmp, label), format = "csv")
+
+        steps = {}
+        serial, serial_store = run("serial", legacy_main, readers, steps)
+        staged, staged_store = run("staged", staged_main, readers)
+        names = ['telemetry', 'errors', 'maint', 'failures', 'machines', 'preprocessed']
+        for name in names:
+            pd.testing.assert_frame_equal(serial_store.read(name), staged_store.read(name))
+
+        slowest = max(steps, key = steps.get)
+        print(f"{args.machines} machines x {args.days} days, {args.format}, {args.bandwidth:g} MB/s per S3 request, "
+              f"{os.cpu_count()} CPUs")
+        print(f"  sequential reads, features, synchronous uploads  {serial:8.2f}s")
+        print(f"  staged reads, features and background uploads    {staged:8.2f}s  ({serial / staged:.2f}x)")
+        print(f"  slowest single step: {slowest} {steps[slowest]:.2f}s; outputs identical ({', '.join(names)})")
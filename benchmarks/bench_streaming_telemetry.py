@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+import preprocessing
+from storage import TableStore
+from synthetic_pdm import generate
+
+# every table streaming_features writes chunk by chunk
+TABLES = ['telemetry', 'errors', 'maint', 'preprocessed']
+
+
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) / 1024
+
+
+# Raw tables as CSVs, telemetry in time order (all machines' readings of an hour, then the next hour) like a
+# live export
+def write_inputs(directory, n_machines, n_days):
+    raw = generate(n_machines, n_days)
+    raw['telemetry'] = raw['telemetry'].sort_values(['datetime', 'machineID'], kind = "stable")
+    for name, df in raw.items():
+        df.to_csv(os.path.join(directory, f"PdM_{name}.csv"), index = False, date_format = "%Y-%m-%d %H:%M:%S")
+    return len(raw['telemetry'])
+
+
+def read_chunks(path, chunk_rows):
+    for chunk in pd.read_csv(path, chunksize = chunk_rows):
+        chunk['datetime'] = pd.to_datetime(chunk['datetime'], format = "%Y-%m-%d %H:%M:%S")
+        yield chunk
+
+
+# The whole preprocessing in a fresh process: chunk_rows = 0 loads the whole telemetry file like the batch run
+def run(directory, chunk_rows, out_dir):
+    store = TableStore(out_dir, format = "parquet")
+    events = {name: pd.read_csv(os.path.join(directory, f"PdM_{name}.csv"))
+              for name in ('errors', 'maint', 'failures', 'machines')}
+    path = os.path.join(directory, "PdM_telemetry.csv")
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            if chunk_rows == 0:
+                batch_pipeline(pd.read_csv(path), events, store.write)
+            else:
+                preprocessing.streaming_features(read_chunks(path, chunk_rows), events['errors'], events['maint'],
+                                                 events['failures'], events['machines'], upload = store.write)
+        finally:
+            sys.stdout = stdout
+    return {"seconds": time.perf_counter() - start, "peak_mb": peak_rss_mb()}
+
+
+def batch_pipeline(telemetry, events, upload):
+    telemetry_df = preprocessing.telemetry_features(telemetry, upload = upload)
+    errors_df = preprocessing.errors_lag_features(events['errors'], telemetry, upload = upload)
+    maint_df = preprocessing.maintenance_features(events['maint'], telemetry, upload = upload)
+    failures_df = preprocessing.failure_features(events['failures'], upload = upload)
+    machines_df = preprocessing.machine_features(events['machines'])
+    preprocessing.label_construct(telemetry_df, errors_df, maint_df, machines_df, failures_df, upload = upload)
+
+
+# the stored features are float32; the window statistics of a chunk can round one float32 step apart
+def compare(full, streamed, name):
+    numeric = [c for c in full.columns if pd.api.types.is_float_dtype(full[c])]
+    others = [c for c in full.columns if c not in numeric]
+    assert full[others].equals(streamed[others]), name
+    np.testing.assert_allclose(streamed[numeric].to_numpy(), full[numeric].to_numpy(), rtol = 1e-6, err_msg = name)
+
+
+# streaming_features end to end against the batch pipeline, with 1000 row chunks
+def check_pipeline(tmp):
+    raw = generate(20, 30)
+    batch = TableStore(os.path.join(tmp, "batch"))
+    streamed = TableStore(os.path.join(tmp, "streamed"))
+    batch_pipeline(raw['telemetry'].copy(), {name: df.copy() for name, df in raw.items()}, batch.write)
+
+    ordered = raw['telemetry'].sort_values(['datetime', 'machineID'], kind = "stable")
+    chunks = (ordered.iloc[i:i + 1000].copy() for i in range(0, len(ordered), 1000))
+    preprocessing.streaming_features(chunks, raw['errors'].copy(), raw['maint'].copy(), raw['failures'].copy(),
+                                     raw['machines'].copy(), upload = streamed.write)
+    for name in TABLES:
+        compare(batch.read(name), streamed.read(name), name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 1000)
+    parser.add_argument("--days", type = int, default = 120)
+    parser.add_argument("--chunk-rows", type = int, nargs = "+", default = [0, 1000000, 250000, 50000])
+    parser.add_argument("--run-one", type = str)
+    args = parser.parse_args()
+
+    if args.run_one:
+        directory, chunk_rows, out_dir = args.run_one.split(":")
+        print(json.dumps(run(directory, int(chunk_rows), out_dir)))
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            check_pipeline(tmp)
+            sys.stdout = stdout
+        print(f"streaming_features matches the batch {', '.join(TABLES)} tables: OK")
+
+        n = write_inputs(tmp, args.machines, args.days)
+        print(f"{n:,} telemetry rows ({args.machines} machines x {args.days} days), "
+              f"{os.path.getsize(os.path.join(tmp, 'PdM_telemetry.csv')) / 2**20:.0f} MB CSV")
+        print(f"{'chunk rows':>10s} {'seconds':>8s} {'peak RSS MB':>12s}")
+        reference = None
+        for chunk_rows in args.chunk_rows:
+            out_dir = os.path.join(tmp, f"out-{chunk_rows}")
+            command = [sys.executable, "-W", "ignore", __file__, "--run-one", f"{tmp}:{chunk_rows}:{out_dir}"]
+            output = subprocess.run(command, capture_output = True, text = True, check = True)
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            store = TableStore(out_dir, format = "parquet")
+            if reference is None:
+                reference = store
+            else:
+                for name in TABLES:
+                    compare(reference.read(name), store.read(name), name)
+            label = "all" if chunk_rows == 0 else f"{chunk_rows:,}"
+            print(f"{label:>10s} {result['seconds']:8.2f} {result['peak_mb']:12.0f}")
+        print("streamed tables match the in-memory run for every chunk size: OK")
@@ -0,0 +1,113 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from feature_engine import TELEMETRY_FIELDS, telemetry_window_features
+from synthetic_pdm import generate
+
+
+# Previous implementation of preprocessing.telemetry_features (16 pivots), kept for comparison
+def legacy_telemetry_features(df):
+    fields = TELEMETRY_FIELDS
+    temp = []
+    for col in fields:
+        temp.append(pd.pivot_table(df, index = 'datetime', columns = 'machineID', values = col)
+                    .resample('3H', closed = 'left', label = 'right').mean().unstack())
+    telemetry_mean_3h = pd.concat(temp, axis = 1)
+    telemetry_mean_3h.columns = [i + 'mean_3h' for i in fields]
+    telemetry_mean_3h.reset_index(inplace = True)
+
+    temp = []
+    for col in fields:
+        temp.append(pd.pivot_table(df, index = 'datetime', columns = 'machineID', values = col)
+                    .resample('3H', closed = 'left', label = 'right').std().unstack())
+    telemetry_sd_3h = pd.concat(temp, axis = 1)
+    telemetry_sd_3h.columns = [i + 'sd_3h' for i in fields]
+    telemetry_sd_3h.reset_index(inplace = True)
+
+    temp = []
+    for col in fields:
+        temp.append(pd.pivot_table(df, index = 'datetime', columns = 'machineID', values = col)
+                    .resample('3H', closed = 'left', label = 'right').first().unstack()
+                    .rolling(window = 24, center = False).mean())
+    telemetry_mean_24h = pd.concat(temp, axis = 1)
+    telemetry_mean_24h.columns = [i + 'mean_24h' for i in fields]
+    telemetry_mean_24h.reset_index(inplace = True)
+    telemetry_mean_24h = telemetry_mean_24h.loc[-telemetry_mean_24h['voltmean_24h'].isnull()]
+
+    temp = []
+    for col in fields:
+        temp.append(pd.pivot_table(df, index = 'datetime', columns = 'machineID', values = col)
+                    .resample('3H', closed = 'left', label = 'right').first().unstack()
+                    .rolling(window = 24, center = False).std())
+    telemetry_sd_24h = pd.concat(temp, axis = 1)
+    telemetry_sd_24h.columns = [i + 'sd_24h' for i in fields]
+    telemetry_sd_24h = telemetry_sd_24h.loc[-telemetry_sd_24h['voltsd_24h'].isnull()]
+    telemetry_sd_24h.reset_index(inplace = True)
+
+    return pd.concat([telemetry_mean_3h,
+                      telemetry_sd_3h.iloc[:, 2:6],
+                      telemetry_mean_24h.iloc[:, 2:6],
+                      telemetry_sd_24h.iloc[:, 2:6]], axis = 1).dropna()
+
+
+# Per machine reference for the 24 x 3h statistics, computed with plain pandas
+def reference_rolling(df):
+    first = (df.set_index('datetime').groupby('machineID')[TELEMETRY_FIELDS]
+             .resample('3H', closed = 'left', label = 'right').first())
+    rolling = first.groupby(level = 'machineID').rolling(window = 24)
+    mean = rolling.mean().droplevel(0).add_suffix('mean_24h')
+    sd = rolling.std().droplevel(0).add_suffix('sd_24h')
+    return pd.concat([mean, sd], axis = 1).dropna().reset_index()
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def check(engine, legacy, reference):
+    keys = ['machineID', 'datetime']
+    assert list(engine.columns) == list(legacy.columns), "column mismatch"
+
+    # the 3h statistics are per bin and must agree on every shared row
+    both = engine.merge(legacy, on = keys, suffixes = ('', '_legacy'))
+    cols_3h = [c for c in engine.columns if c.endswith('_3h')]
+    for col in cols_3h:
+        np.testing.assert_allclose(both[col], both[col + '_legacy'], rtol = 1e-9)
+
+    # the 24h statistics are checked against a per machine rolling window
+    both = engine.merge(reference, on = keys, suffixes = ('', '_ref'))
+    assert len(both) == len(engine), "row mismatch against per machine reference"
+    cols_24h = [c for c in engine.columns if c.endswith('_24h')]
+    for col in cols_24h:
+        np.testing.assert_allclose(both[col], both[col + '_ref'], rtol = 1e-8)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 10000)
+    parser.add_argument("--days", type = int, default = 365)
+    parser.add_argument("--skip-legacy", action = "store_true")
+    parser.add_argument("--skip-check", action = "store_true")
+    args = parser.parse_args()
+
+    telemetry = generate(args.machines, args.days)['telemetry']
+    print(f"telemetry rows: {len(telemetry):,} ({args.machines} machines x {args.days} days)")
+
+    engine, engine_time = timed(telemetry_window_features, telemetry)
+    print(f"feature engine : {engine_time:8.2f} s  rows out: {len(engine):,}")
+
+    if not args.skip_legacy:
+        legacy, legacy_time = timed(legacy_telemetry_features, telemetry)
+        print(f"legacy pivots  : {legacy_time:8.2f} s  rows out: {len(legacy):,}")
+        print(f"speedup        : {legacy_time / engine_time:8.1f} x")
+        if not args.skip_check:
+            check(engine, legacy, reference_rolling(telemetry))
+            print("check          : OK")
@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from compact_forest import CompactForest
+from bench_feature_dtypes import feature_sample
+
+
+# Median wall time of fn(batch) over repeated calls on different rows
+def median_latency(fn, X, batch_size, repeats):
+    timings = []
+    for i in range(repeats):
+        start = (i * batch_size) % (len(X) - batch_size)
+        batch = X[start:start + batch_size]
+        begin = time.perf_counter()
+        fn(batch)
+        timings.append(time.perf_counter() - begin)
+    return float(np.median(timings))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type = int, default = 100000)
+    parser.add_argument("--n-estimators", type = int, default = 100)
+    parser.add_argument("--min-samples-leaf", type = int, default = 3)
+    parser.add_argument("--repeats", type = int, default = 30)
+    args = parser.parse_args()
+
+    X, y = feature_sample(args.rows)
+    X = X.to_numpy(np.float32)
+    model = RandomForestClassifier(n_estimators = args.n_estimators, min_samples_leaf = args.min_samples_leaf,
+                                   n_jobs = -1, random_state = 0).fit(X, y)
+    forest = CompactForest.from_model(model)
+    X_test = feature_sample(20000, seed = 1)[0].to_numpy(np.float32)
+
+    # parity with sklearn is checked by tests/test_compact_forest.py
+    print(f"{args.n_estimators} trees, max depth {forest.max_depth}")
+    print(f"{'batch':>6s} {'sklearn n_jobs=-1':>18s} {'sklearn n_jobs=1':>17s} {'numpy':>10s} {'speedup':>8s}")
+    for batch_size in (1, 32, 1024):
+        model.set_params(n_jobs = -1)
+        parallel = median_latency(model.predict_proba, X_test, batch_size, args.repeats)
+        model.set_params(n_jobs = 1)
+        serial = median_latency(model.predict_proba, X_test, batch_size, args.repeats)
+        vectorized = median_latency(forest.predict_proba, X_test, batch_size, args.repeats)
+        print(f"{batch_size:6d} {parallel * 1000:15.2f} ms {serial * 1000:14.2f} ms {vectorized * 1000:7.2f} ms "
+              f"{min(parallel, serial) / vectorized:7.1f}x")
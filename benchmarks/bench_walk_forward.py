@@ -0,0 +1,92 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from feature_schema import FEATURE_COLUMNS
+from train_test_split_data import THRESHOLD_DATES, read_walk_forward, train_test_split_script, walk_forward_folds
+from bench_feature_dtypes import labeled_table, legacy_table
+
+
+# Previous split loop: every fold rescans and one-hot encodes the whole table, only the last one is kept
+def legacy_split(labeled_features):
+    for last_train_date, first_test_date in THRESHOLD_DATES:
+        train_y = labeled_features.loc[labeled_features['datetime'] < last_train_date, 'failure']
+        train_data = pd.get_dummies(labeled_features.loc[labeled_features['datetime'] < last_train_date]
+                                    .drop(['datetime', 'machineID', 'failure'], axis = 1))
+        test_y = labeled_features.loc[labeled_features['datetime'] > last_train_date, 'failure']
+        test_data = pd.get_dummies(labeled_features.loc[labeled_features['datetime'] > first_test_date]
+                                   .drop(['datetime', 'machineID', 'failure'], axis = 1))
+    train_data['failure'] = train_y
+    test_data['failure'] = test_y
+    return train_data, test_data
+
+
+# Same rows and values as a fold: the legacy frames are re-sorted by datetime and the one-hot models decoded
+def check_fold(legacy, X, y):
+    legacy = legacy.iloc[np.argsort(labeled.loc[legacy.index, 'datetime'].to_numpy(), kind = "stable")]
+    model_columns = [col for col in legacy.columns if col.startswith('model_')]
+    model = np.argmax(legacy[model_columns].to_numpy(), axis = 1)
+    np.testing.assert_array_equal(model, X['model'].to_numpy())
+    other = [col for col in FEATURE_COLUMNS if col != 'model']
+    np.testing.assert_array_equal(legacy[other].to_numpy(np.float64), X[other].to_numpy(np.float64))
+    np.testing.assert_array_equal(legacy['failure'].astype(str).to_numpy(), y.astype(str).to_numpy())
+
+
+def root(array):
+    while array.base is not None:
+        array = array.base
+    return array
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 200)
+    parser.add_argument("--days", type = int, default = 300)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        labeled = labeled_table(args.machines, args.days)
+        sys.stdout = stdout
+    print(f"{args.machines} machines x {args.days} days: {len(labeled):,} labeled rows")
+
+    # the legacy loop ran on the float64 table label_construct wrote before the feature schema
+    (legacy_train, legacy_test), legacy_s = timed(legacy_split, legacy_table(labeled))
+    folds, folds_s = timed(lambda: list(walk_forward_folds(labeled)))
+    print(f"legacy loop (last fold only) {legacy_s:6.2f}s, walk-forward generator (all {len(folds)} folds) {folds_s:6.2f}s")
+
+    _, X, y, test_X, test_y = folds[-1]
+    check_fold(legacy_train, X, y)
+    check_fold(legacy_test, test_X, test_y)
+    print("last fold matches the legacy train/test split: OK")
+
+    for col in ('voltmean_3h', 'age'):
+        buffers = {id(root(fold_X[col].to_numpy())) for _, train_X, _, test_X, _ in folds for fold_X in (train_X, test_X)}
+        assert len(buffers) == 1, "folds are expected to be views of one feature matrix"
+    print("every fold is a view of one encoded matrix: OK")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, "train"))
+        os.makedirs(os.path.join(tmp, "test"))
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            _, write_s = timed(train_test_split_script, labeled, tmp)
+            sys.stdout = stdout
+        written, read_s = timed(lambda: list(read_walk_forward(os.path.join(tmp, "train"))))
+        for (_, X, y, test_X, test_y), (_, X2, y2, test_X2, test_y2) in zip(folds, written):
+            pd.testing.assert_frame_equal(X, X2)
+            pd.testing.assert_frame_equal(test_X, test_X2)
+            assert y.equals(y2) and test_y.equals(test_y2)
+        print(f"split written in {write_s:.2f}s, all folds read back in {read_s:.2f}s and equal the generator: OK")
@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(BENCH_DIR, "..", "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+import profiler
+from synthetic_pdm import generate
+
+# machines x days; 1000x365 and up need several GB of memory
+DEFAULT_SCALES = ["100x30", "100x365"]
+BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+# walk-forward folds at these fractions of the generated time span (the fixed 2015 dates need ~300 days)
+FOLD_FRACTIONS = [0.7, 0.8, 0.9]
+# a slower stage is only a regression when it lost at least this much time; sub-second stages
+# easily move by 20% between runs on a shared machine
+MIN_SECONDS = 0.1
+
+
+def parse_scale(scale):
+    machines, days = scale.lower().split("x")
+    return int(machines), int(days)
+
+
+def threshold_dates(start, n_days):
+    first_day = pd.Timestamp(start).normalize()
+    return [[first_day + pd.Timedelta(days = int(n_days * fraction), hours = 1),
+             first_day + pd.Timedelta(days = int(n_days * fraction) + 1, hours = 1)] for fraction in FOLD_FRACTIONS]
+
+
+def package_versions():
+    versions = {}
+    for name in ("numpy", "pandas", "pyarrow", "sklearn", "scipy"):
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            versions[name] = None
+    return versions
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = BENCH_DIR, capture_output = True,
+                                text = True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "commit": commit, "packages": package_versions()}
+
+
+# ------------------------------------ One scale (runs in its own process, so peak RSS is per scale)
+def run_scale(n_machines, n_days, seed, memory, work_dir):
+    import preprocessing
+    from train_test_split_data import train_test_split_script
+
+    trace = os.path.join(work_dir, "trace.json")
+    profiler.configure(trace = trace, memory = memory)
+    with profiler.profile_stage("generate"):
+        raw = generate(n_machines, n_days, seed)
+    start = raw['telemetry']['datetime'].iloc[0]
+    rows = {name: len(df) for name, df in raw.items()}
+
+    with open(os.path.join(work_dir, "stdout.log"), "w") as log:
+        stdout, sys.stdout = sys.stdout, log
+        try:
+            telemetry_df = preprocessing.telemetry_features(raw['telemetry'], upload = None)
+            errors_df = preprocessing.errors_lag_features(raw['errors'], raw['telemetry'], upload = None)
+            maint_df = preprocessing.maintenance_features(raw['maint'], raw['telemetry'], upload = None)
+            failures_df = preprocessing.failure_features(raw['failures'], upload = None)
+            with profiler.profile_stage("machine_features"):
+                machines_df = preprocessing.machine_features(raw['machines'])
+            labeled = preprocessing.label_construct(telemetry_df, errors_df, maint_df, machines_df, failures_df,
+                                                    upload = None)
+            del raw, telemetry_df, errors_df, maint_df, failures_df
+            rows['labeled'] = len(labeled)
+
+            for name in ("train", "test"):
+                os.makedirs(os.path.join(work_dir, name))
+            train_test_split_script(labeled, work_dir, threshold_dates(start, n_days))
+            del labeled
+        finally:
+            sys.stdout = stdout
+
+        # the training job as a subprocess; its stages land in the same trace
+        model_dir = os.path.join(work_dir, "model")
+        os.makedirs(model_dir)
+        env = profiler.child_env(PDM_PROFILE_TRACE = trace, PDM_PROFILE_MEMORY = "1" if memory else "0")
+        with profiler.profile_stage("rf_script"):
+            subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, "rf_script.py"), "--model-dir", model_dir,
+                            "--train-data", os.path.join(work_dir, "train"), "--test-data", os.path.join(work_dir, "test")],
+                           check = True, cwd = SCRIPTS_DIR, stdout = log, env = env)
+
+    profiler.write_trace()
+    with open(trace) as f:
+        trace_events = sorted(json.load(f)["traceEvents"], key = lambda event: event["ts"])
+    stages = {}
+    for name, entry in profiler.summarize(trace_events).items():
+        stages[name] = {"seconds": entry["mean_seconds"], "rss_mb": entry["max_rss_mb"],
+                        "max_rss_growth_mb": max(event["args"]["max_rss_growth_mb"] for event in trace_events
+                                                 if event["name"] == name),
+                        "py_peak_mb": entry["py_peak_mb"]}
+    # the harness only sees the training job from outside; its RSS is the largest one its own stages saw
+    stages["rf_script"]["rss_mb"] = max([event["args"]["rss_end_mb"] for event in trace_events
+                                         if event["pid"] != os.getpid()] or [0.0])
+    return {"machines": n_machines, "days": n_days, "seed": seed, "rows": rows, "stages": stages,
+            "peak_rss_mb": profiler.max_rss_bytes() / 2**20}
+
+
+def run_scale_process(scale, seed, memory):
+    with tempfile.TemporaryDirectory() as tmp:
+        result_path = os.path.join(tmp, "result.json")
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--child", scale, "--seed", str(seed),
+                        "--result", result_path, "--work-dir", tmp] + (["--memory"] if memory else []), check = True)
+        with open(result_path) as f:
+            return json.load(f)
+
+
+# Fastest time of the repeats per stage; memory figures from the first run
+def best_of(results):
+    best = results[0]
+    for result in results[1:]:
+        for name, entry in result["stages"].items():
+            best["stages"][name]["seconds"] = min(best["stages"][name]["seconds"], entry["seconds"])
+    best["repeats"] = len(results)
+    return best
+
+
+# ------------------------------------ Baseline comparison
+# Stages of every scale in both files whose time (or traced peak memory) grew by more than `threshold`
+def compare_results(baseline, current, threshold = profiler.REGRESSION_THRESHOLD, min_seconds = MIN_SECONDS):
+    rows = []
+    for scale in sorted(set(baseline["scales"]) & set(current["scales"])):
+        before_stages, after_stages = baseline["scales"][scale]["stages"], current["scales"][scale]["stages"]
+        for name in sorted(set(before_stages) | set(after_stages)):
+            before, after = before_stages.get(name, {}), after_stages.get(name, {})
+            for metric in ("seconds", "py_peak_mb"):
+                old, new = before.get(metric), after.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                rows.append({"scale": scale, "stage": name, "metric": metric, "before": old, "after": new,
+                             "change": change,
+                             "regression": change > threshold and (metric != "seconds" or new - old >= min_seconds)})
+    return rows
+
+
+def print_results(results):
+    for scale, result in results["scales"].items():
+        rows = ", ".join(f"{name} {count:,}" for name, count in result["rows"].items())
+        print(f"\n{scale}: {rows}; peak RSS {result['peak_rss_mb']:.0f} MB")
+        print(f"  {'stage':28s} {'seconds':>9s} {'RSS MB':>8s} {'RSS growth':>11s} {'py peak MB':>11s}")
+        for name, entry in result["stages"].items():
+            py_peak = "-" if entry["py_peak_mb"] is None else f"{entry['py_peak_mb']:.1f}"
+            print(f"  {name:28s} {entry['seconds']:9.3f} {entry['rss_mb']:8.0f} "
+                  f"{entry['max_rss_growth_mb']:11.1f} {py_peak:>11s}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type = str, nargs = "+", default = DEFAULT_SCALES)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--repeat", type = int, default = 3)
+    # peak Python allocations per stage with tracemalloc (slower); timings are only comparable within one mode
+    parser.add_argument("--memory", action = "store_true")
+    parser.add_argument("--baseline", type = str, default = BASELINE)
+    parser.add_argument("--threshold", type = float, default = profiler.REGRESSION_THRESHOLD)
+    parser.add_argument("--write-baseline", action = "store_true")
+    parser.add_argument("--output", type = str, default = None)
+    parser.add_argument("--child", type = str, default = None)
+    parser.add_argument("--result", type = str, default = None)
+    parser.add_argument("--work-dir", type = str, default = None)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_scale(*parse_scale(args.child), args.seed, args.memory, args.work_dir)
+        with open(args.result, "w") as f:
+            json.dump(result, f)
+        raise SystemExit(0)
+
+    results = {"environment": environment(), "memory_traced": args.memory, "scales": {}}
+    for scale in args.scales:
+        print(f"running {scale} ...", flush = True)
+        start = time.perf_counter()
+        results["scales"][scale] = best_of([run_scale_process(scale, args.seed, args.memory)
+                                            for _ in range(args.repeat)])
+        print(f"  done in {time.perf_counter() - start:.1f}s", flush = True)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 1)
+    if args.write_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent = 1)
+        print(f"\nBaseline written at {args.baseline}")
+        raise SystemExit(0)
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}, run with --write-baseline to store one")
+        raise SystemExit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("memory_traced") != args.memory:
+        print("\nBaseline was recorded with a different --memory setting, timings are not comparable")
+    rows = compare_results(baseline, results, args.threshold)
+    print(f"\nAgainst {args.baseline} (commit {baseline['environment'].get('commit')}):")
+    for row in rows:
+        unit = "s" if row["metric"] == "seconds" else " MB"
+        print(f"  {row['scale']:10s} {row['stage']:28s} {row['metric']:10s} {row['before']:9.3f}{unit} -> "
+              f"{row['after']:9.3f}{unit} {row['change']:+7.0%}" + ("  REGRESSION" if row["regression"] else ""))
+    raise SystemExit(1 if any(row["regression"] for row in rows) else 0)
@@ -0,0 +1,127 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Event rates per machine and year, from the 100 machine / 2015 Azure PdM sample this repo was built on
+ERROR_RATES = {'error1': 10.1, 'error2': 9.9, 'error3': 8.4, 'error4': 7.3, 'error5': 3.6}
+FAILURE_RATES = {'comp1': 1.9, 'comp2': 2.6, 'comp3': 1.9, 'comp4': 1.8}
+# scheduled replacements every 15 to 120 days (in 15 day steps), failures add an unscheduled one
+MAINTENANCE_INTERVALS = np.arange(15, 121, 15)
+MODEL_SHARES = {'model1': 0.16, 'model2': 0.17, 'model3': 0.35, 'model4': 0.32}
+MAX_AGE = 20
+
+# telemetry readings: mean and standard deviation
+TELEMETRY = {'volt': (170.8, 15.5), 'rotate': (446.6, 52.7), 'pressure': (100.9, 11.0), 'vibration': (40.4, 5.4)}
+# each component's failures are announced by drift of one sensor (and errors of one type) over the last days
+FAILURE_SIGNALS = {'comp1': ('volt', 1.0, 'error1'), 'comp2': ('rotate', -1.5, 'error2'),
+                   'comp3': ('pressure', 1.0, 'error3'), 'comp4': ('vibration', 1.0, 'error4')}
+SIGNAL_HOURS = 48
+SIGNAL_ERRORS = 2
+
+START = "2015-01-01 06:00:00"
+BLOCK_MACHINES = 500
+TABLES = ['telemetry', 'errors', 'maint', 'failures', 'machines']
+
+
+# Every machine draws from its own generator, so a machine's data does not depend on the block size
+def machine_rng(seed, machine_id):
+    return np.random.default_rng([seed, machine_id])
+
+
+def event_frame(machine_id, times, column, values):
+    return pd.DataFrame({'datetime': times, 'machineID': np.full(len(times), machine_id, dtype = np.int64),
+                         column: values})
+
+
+def machine_tables(machine_id, n_days, seed, start):
+    rng = machine_rng(seed, machine_id)
+    start = pd.Timestamp(start)
+    hours = n_days * 24
+    years = n_days / 365
+    readings = {name: rng.normal(mean, sd, hours) for name, (mean, sd) in TELEMETRY.items()}
+
+    # failures at 06:00 on random days (not on the first day), each with a replacement at the same time
+    failures, errors, maint = [], [], []
+    for comp, rate in FAILURE_RATES.items():
+        days = rng.choice(np.arange(1, n_days), size = min(rng.poisson(rate * years), n_days - 1), replace = False) \
+            if n_days > 1 else np.array([], dtype = int)
+        for day in np.sort(days):
+            hour = day * 24
+            sensor, shift, error = FAILURE_SIGNALS[comp]
+            window = np.arange(max(hour - SIGNAL_HOURS, 0), hour)
+            # the sensor drifts away from its mean over the hours before the failure
+            readings[sensor][window] += shift * TELEMETRY[sensor][1] * (window - hour + SIGNAL_HOURS) / SIGNAL_HOURS
+            failures.append((hour, comp))
+            maint.append((hour, comp))
+            errors.extend((h, error) for h in rng.choice(window, size = min(SIGNAL_ERRORS, len(window)), replace = False))
+
+    # background errors at random hours
+    for error, rate in ERROR_RATES.items():
+        errors.extend((h, error) for h in rng.integers(0, hours, rng.poisson(rate * years)))
+
+    # scheduled replacements, starting before the telemetry so "days since replacement" is always defined
+    for comp in FAILURE_RATES:
+        day = -int(rng.integers(1, MAINTENANCE_INTERVALS[-1]))
+        while day < n_days:
+            maint.append((day * 24, comp))
+            day += int(rng.choice(MAINTENANCE_INTERVALS))
+
+    def times(events):
+        return start + pd.to_timedelta(np.array([h for h, _ in events], dtype = np.int64), unit = "h")
+
+    errors.sort()
+    maint = sorted(set(maint))
+    failures.sort()
+    return {
+        'telemetry': pd.DataFrame({'datetime': start + pd.to_timedelta(np.arange(hours), unit = "h"),
+                                   'machineID': np.full(hours, machine_id, dtype = np.int64), **readings}),
+        'errors': event_frame(machine_id, times(errors), 'errorID', [e for _, e in errors]),
+        'maint': event_frame(machine_id, times(maint), 'comp', [c for _, c in maint]),
+        'failures': event_frame(machine_id, times(failures), 'failure', [c for _, c in failures]),
+        'machines': pd.DataFrame({'machineID': [machine_id],
+                                  'model': [rng.choice(list(MODEL_SHARES), p = list(MODEL_SHARES.values()))],
+                                  'age': [int(rng.integers(0, MAX_AGE + 1))]}),
+    }
+
+
+# The five raw tables for machines [first, last], sorted by machine and time like the sample files
+def machine_block(first, last, n_days, seed = 0, start = START):
+    parts = [machine_tables(machine_id, n_days, seed, start) for machine_id in range(first, last + 1)]
+    return {name: pd.concat([part[name] for part in parts], ignore_index = True) for name in TABLES}
+
+
+def machine_blocks(n_machines, n_days, seed = 0, start = START, block_machines = BLOCK_MACHINES):
+    for first in range(1, n_machines + 1, block_machines):
+        yield machine_block(first, min(first + block_machines - 1, n_machines), n_days, seed, start)
+
+
+# All tables in memory; telemetry takes ~44 bytes per machine-hour (100 x 365: 40 MB, 10,000 x 365: 3.9 GB)
+def generate(n_machines, n_days, seed = 0, start = START):
+    return machine_block(1, n_machines, n_days, seed, start)
+
+
+# PdM_<table>.csv files written block by block, for scales that do not fit in memory
+def write_dataset(directory, n_machines, n_days, seed = 0, start = START, block_machines = BLOCK_MACHINES):
+    os.makedirs(directory, exist_ok = True)
+    paths = {name: os.path.join(directory, f"PdM_{name}.csv") for name in TABLES}
+    for index, block in enumerate(machine_blocks(n_machines, n_days, seed, start, block_machines)):
+        for name, df in block.items():
+            df.to_csv(paths[name], mode = "w" if index == 0 else "a", header = index == 0, index = False,
+                      date_format = "%Y-%m-%d %H:%M:%S", float_format = "%.6f")
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type = int, default = 100)
+    parser.add_argument("--days", type = int, default = 365)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--start", type = str, default = START)
+    parser.add_argument("--out-dir", type = str, default = "synthetic")
+    args = parser.parse_args()
+
+    paths = write_dataset(args.out_dir, args.machines, args.days, args.seed, args.start)
+    for name, path in paths.items():
+        print(f"{name:10s} {os.path.getsize(path) / 2**20:9.1f} MB  {path}")
@@ -0,0 +1,74 @@
+import os
+import threading
+
+# One boto3 session and one client per service for the whole process: credentials are resolved once and
+# every call reuses the client's pooled (keep-alive) connections. Clients are thread-safe once created,
+# so uploads to different keys can share the S3 client from several threads.
+REGION = os.environ.get("PDM_AWS_REGION", os.environ.get("AWS_REGION", "us-east-1"))
+# connections kept open per client; at least the number of threads sharing it
+MAX_POOL_CONNECTIONS = int(os.environ.get("PDM_AWS_MAX_POOL_CONNECTIONS", "32"))
+# adaptive mode retries throttling and transient errors with backoff and rate limits the client
+RETRIES = {"max_attempts": int(os.environ.get("PDM_AWS_MAX_ATTEMPTS", "5")), "mode": "adaptive"}
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+
+sessions = {}
+clients = {}
+# clients set by set_client (a LocalS3Client, a stub) win over real ones, for every region
+overrides = {}
+lock = threading.Lock()
+
+
+def client_config(**options):
+    from botocore.config import Config
+    options = {"max_pool_connections": MAX_POOL_CONNECTIONS, "retries": RETRIES, "connect_timeout": CONNECT_TIMEOUT,
+               "read_timeout": READ_TIMEOUT, "tcp_keepalive": True, **options}
+    return Config(**options)
+
+
+# boto3 sessions are not thread-safe, so they are created under the lock; neither sessions nor clients
+# survive a fork, so both are kept per process
+def session(region = None):
+    region = region or REGION
+    key = (os.getpid(), region)
+    with lock:
+        if key not in sessions:
+            import boto3
+            sessions[key] = boto3.Session(region_name = region)
+        return sessions[key]
+
+
+# The shared client of a service, created on first use; options are botocore Config fields
+# (a different max_pool_connections, say) and get a client of their own
+def client(service, region = None, **options):
+    if service in overrides:
+        return overrides[service]
+    region = region or REGION
+    key = (os.getpid(), service, region, tuple(sorted(options.items())))
+    if key in clients:
+        return clients[key]
+    boto_session = session(region)
+    with lock:
+        if key not in clients:
+            clients[key] = boto_session.client(service, config = client_config(**options))
+        return clients[key]
+
+
+def s3_client(region = None):
+    return client("s3", region)
+
+
+# Swap in a fake for a service (None removes it again); code that asks the factory gets the fake
+def set_client(service, fake):
+    with lock:
+        if fake is None:
+            overrides.pop(service, None)
+        else:
+            overrides[service] = fake
+
+
+def clear_clients():
+    with lock:
+        sessions.clear()
+        clients.clear()
+        overrides.clear()
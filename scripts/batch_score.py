@@ -0,0 +1,242 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+import rf_script
+from feature_schema import FEATURE_COLUMNS, KEY_COLUMNS, LEGACY_FEATURE_COLUMNS, encode_features, positional_features
+
+CHUNK_ROWS = 100_000
+MANIFEST = "_batch_score.json"
+PART_PATTERN = "part-{:06d}.parquet"
+# progress line every this many chunks
+REPORT_EVERY = 10
+
+
+# ------------------------------------ Input
+def has_header(path):
+    with open(path) as f:
+        first_line = f.readline().strip()
+    return rf_script.is_header_row(first_line)
+
+
+# Column names and types of a CSV (with or without a header row), inferred from its first block like a
+# streaming read would; every chunk is read with them so the parts share one schema
+def csv_format(path):
+    header = has_header(path)
+    reader = pacsv.open_csv(path, read_options = pacsv.ReadOptions(block_size = 16 * 2**20,
+                                                                   autogenerate_column_names = not header))
+    schema = reader.schema
+    reader.close()
+    return {"header": header, "column_names": schema.names, "column_types": dict(zip(schema.names, schema.types))}
+
+
+# Fixed-size chunks (the last one shorter) numbered from 0, as (start, stop, rows): row ranges of a Parquet file,
+# byte ranges of a CSV. The CSV pass only counts line ends (one row per line, feature files have no quoted
+# newlines). The numbering does not depend on anything but chunk_rows, so a resumed run sees the same chunks.
+def chunk_ranges(path, chunk_rows = CHUNK_ROWS, header = False, block_size = 16 * 2**20):
+    if path.endswith(".parquet"):
+        n_rows = pq.ParquetFile(path).metadata.num_rows
+        return [(start, min(start + chunk_rows, n_rows), min(chunk_rows, n_rows - start))
+                for start in range(0, n_rows, chunk_rows)]
+    ranges = []
+    with open(path, "rb") as f:
+        start = offset = len(f.readline()) if header else 0
+        f.seek(start)
+        # rows of the chunk being counted
+        rows = 0
+        while block := f.read(block_size):
+            ends = np.flatnonzero(np.frombuffer(block, np.uint8) == ord("\n")) + offset + 1
+            for stop in ends[chunk_rows - rows - 1::chunk_rows].tolist():
+                ranges.append((start, stop, chunk_rows))
+                start = stop
+            rows = (rows + len(ends)) % chunk_rows
+            offset += len(block)
+            last = block[-1:]
+        if offset > start:
+            # the last line may have no line end
+            ranges.append((start, offset, rows + (last != b"\n")))
+    return ranges
+
+
+# The rows of one chunk; read by the worker that scores it
+def read_chunk(path, start, stop, csv = None):
+    if csv is None:
+        parquet = pq.ParquetFile(path)
+        sizes = np.array([parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)])
+        group_starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        groups = np.flatnonzero((group_starts < stop) & (group_starts + sizes > start))
+        return parquet.read_row_groups(groups.tolist()).slice(start - group_starts[groups[0]], stop - start)
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(stop - start)
+    return pacsv.read_csv(pa.BufferReader(data), read_options = pacsv.ReadOptions(column_names = csv["column_names"]),
+                          convert_options = pacsv.ConvertOptions(column_types = csv["column_types"]))
+
+
+# Feature matrix of a chunk: named columns go through the feature contract, unnamed ones are positional
+def chunk_features(table):
+    if all(col in table.column_names for col in FEATURE_COLUMNS):
+        return encode_features(table.to_pandas()).to_numpy(np.float32), \
+            {col: table.column(col) for col in KEY_COLUMNS if col in table.column_names}
+    if table.num_columns not in (len(FEATURE_COLUMNS), len(LEGACY_FEATURE_COLUMNS)):
+        raise ValueError(f"Input has {table.num_columns} unnamed columns, the feature contract has {len(FEATURE_COLUMNS)}")
+    X = np.column_stack([table.column(i).to_numpy() for i in range(table.num_columns)]).astype(np.float32)
+    return positional_features(X), {}
+
+
+# ------------------------------------ Workers
+worker_model = None
+
+
+# Pool initializer: the model is loaded once per worker process (the compact forest is memory-mapped,
+# so workers share its pages)
+def load_worker_model(model_dir):
+    global worker_model
+    worker_model = rf_script.model_fn(model_dir)
+    if hasattr(worker_model, "n_jobs"):
+        # one process per core already
+        worker_model.n_jobs = 1
+
+
+# Read, featurize and score one chunk and write its part file; the rename makes a part either complete or absent
+def score_chunk(index, first_row, path, start, stop, csv, out_dir):
+    began = time.perf_counter()
+    X, keys = chunk_features(read_chunk(path, start, stop, csv))
+    prediction = rf_script.predict_fn(X, worker_model)
+    columns = {"row": pa.array(np.arange(first_row, first_row + len(X), dtype = np.int64)), **keys,
+               "prediction": pa.array(prediction["predictions"].astype(str))}
+    for i, label in enumerate(prediction["classes"]):
+        columns[f"probability_{label}"] = pa.array(prediction["probabilities"][:, i].astype(np.float32))
+    path = os.path.join(out_dir, PART_PATTERN.format(index))
+    pq.write_table(pa.table(columns), path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return index, len(X), time.perf_counter() - began
+
+
+# ------------------------------------ Runs
+def model_fingerprint(model_dir):
+    digest = hashlib.sha256()
+    for name in ("model.joblib", os.path.join("forest", "meta.json")):
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+# What the parts in out_dir were scored from, and how many there are; a resumed run must match it
+def run_manifest(input_path, model_dir, chunk_rows, chunks):
+    stat = os.stat(input_path)
+    return {"input": os.path.abspath(input_path), "input_size": stat.st_size, "input_mtime_ns": stat.st_mtime_ns,
+            "model": model_fingerprint(model_dir), "chunk_rows": chunk_rows, "chunks": chunks}
+
+
+def completed_chunks(out_dir, manifest, overwrite = False):
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    if overwrite:
+        shutil.rmtree(out_dir, ignore_errors = True)
+    os.makedirs(out_dir, exist_ok = True)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous != manifest:
+            raise ValueError(f"{out_dir} holds parts of another run ({previous}); use --overwrite to start over")
+    else:
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent = 2)
+    return scored_chunks(out_dir)
+
+
+def scored_chunks(out_dir):
+    return {int(name[5:11]) for name in os.listdir(out_dir) if name.startswith("part-") and name.endswith(".parquet")}
+
+
+# This process only splits the input into chunks; `workers` processes read, featurize and score them, at most
+# 2 x workers chunks in flight. Chunks whose part file exists are skipped, so a crashed run resumes where it stopped.
+def batch_score(input_path, model_dir, out_dir, workers = os.cpu_count(), chunk_rows = CHUNK_ROWS, overwrite = False):
+    csv = None if input_path.endswith(".parquet") else csv_format(input_path)
+    ranges = chunk_ranges(input_path, chunk_rows, header = bool(csv and csv["header"]))
+    done = completed_chunks(out_dir, run_manifest(input_path, model_dir, chunk_rows, len(ranges)), overwrite)
+    if done:
+        print(f"Resuming: {len(done)} chunks already scored")
+    rows = scored_rows = chunks = 0
+    score_seconds = 0.0
+    start = time.perf_counter()
+
+    def collect(finished):
+        nonlocal scored_rows, chunks, score_seconds
+        for future in finished:
+            index, n_rows, seconds = future.result()
+            scored_rows += n_rows
+            chunks += 1
+            score_seconds += seconds
+            if chunks % REPORT_EVERY == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{chunks} chunks, {scored_rows} rows scored, {scored_rows / elapsed:.0f} rows/s")
+
+    with ProcessPoolExecutor(max_workers = workers, initializer = load_worker_model, initargs = (model_dir,)) as pool:
+        in_flight = set()
+        for index, (chunk_start, chunk_stop, n_rows) in enumerate(ranges):
+            first_row = rows
+            rows += n_rows
+            if index in done:
+                continue
+            if len(in_flight) >= 2 * workers:
+                finished, in_flight = wait(in_flight, return_when = FIRST_COMPLETED)
+                collect(finished)
+            in_flight.add(pool.submit(score_chunk, index, first_row, input_path, chunk_start, chunk_stop, csv, out_dir))
+        collect(wait(in_flight)[0])
+
+    elapsed = time.perf_counter() - start
+    report = {"rows": rows, "scored_rows": scored_rows, "skipped_chunks": len(done), "chunks": chunks,
+              "workers": workers, "seconds": elapsed, "rows_per_sec": scored_rows / elapsed if elapsed else 0.0,
+              # > 1 when the workers overlap, ideally close to `workers`
+              "parallelism": score_seconds / elapsed if elapsed else 0.0}
+    print(f"Scored {scored_rows} of {rows} rows in {elapsed:.1f}s -- {report['rows_per_sec']:.0f} rows/s "
+          f"on {workers} workers (parallelism {report['parallelism']:.1f})")
+    return report
+
+
+# The parts in row order as one Parquet or CSV file; every chunk of the run must have been scored
+def combine_parts(out_dir, output_path):
+    with open(os.path.join(out_dir, MANIFEST)) as f:
+        chunks = json.load(f)["chunks"]
+    missing = sorted(set(range(chunks)) - scored_chunks(out_dir))
+    if missing:
+        raise ValueError(f"{out_dir} is missing {len(missing)} of {chunks} chunks (first: {missing[0]}); "
+                         f"run batch_score again to score them")
+    writer = None
+    for index in range(chunks):
+        table = pq.read_table(os.path.join(out_dir, PART_PATTERN.format(index)))
+        if writer is None:
+            writer = pq.ParquetWriter(output_path, table.schema) if output_path.endswith(".parquet") \
+                else pacsv.CSVWriter(output_path, table.schema)
+        writer.write_table(table)
+    if writer is not None:
+        writer.close()
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", type = str, required = True)
+    parser.add_argument("--model-dir", type = str, required = True)
+    parser.add_argument("--out-dir", type = str, default = "batch_scores")
+    parser.add_argument("--output", type = str, default = None)
+    parser.add_argument("--workers", type = int, default = os.cpu_count())
+    parser.add_argument("--chunk-rows", type = int, default = CHUNK_ROWS)
+    parser.add_argument("--overwrite", action = "store_true")
+    args = parser.parse_args()
+
+    batch_score(args.data, args.model_dir, args.out_dir, args.workers, args.chunk_rows, args.overwrite)
+    if args.output:
+        print("Predictions written at " + combine_parts(args.out_dir, args.output))
@@ -0,0 +1,168 @@
+import json
+import os
+
+import numpy as np
+
+FORMAT_VERSION = 3
+ARRAYS = ['roots', 'depths', 'feature', 'threshold', 'children', 'missing_right', 'leaf_index', 'leaf_value']
+
+
+# Largest float32 not above each float64 threshold: for float32 inputs x <= t32 exactly when x <= t64
+def float32_thresholds(threshold):
+    t32 = threshold.astype(np.float32)
+    above = t32.astype(np.float64) > threshold
+    t32[above] = np.nextafter(t32[above], np.float32(-np.inf))
+    return t32
+
+
+# Flatten every tree of a fitted RandomForestClassifier into shared node arrays, in the layout the walk reads
+# them so a loaded forest can use the memory-mapped arrays as they are. Leaves point to themselves with an
+# infinite threshold, so a walk can run a fixed number of steps. NaN inputs follow the tree's
+# missing_go_to_left (sklearn 1.3+; earlier trees send them left, as NaN > threshold is false).
+def flatten_forest(model):
+    if getattr(model, "n_outputs_", 1) != 1:
+        raise ValueError("Only single-output forests can be flattened")
+
+    roots, depths, feature, threshold, left, right, missing_right, leaf_index, leaf_value = [], [], [], [], [], [], [], [], []
+    offset = 0
+    n_leaves = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        is_leaf = tree.children_left == -1
+        nodes = np.arange(n_nodes)
+
+        roots.append(offset)
+        depths.append(tree.max_depth)
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+        left.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+        right.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+        missing_left = getattr(tree, "missing_go_to_left", None)
+        missing_right.append(~is_leaf & (missing_left == 0) if missing_left is not None else np.zeros(n_nodes, dtype = bool))
+
+        index = np.full(n_nodes, -1)
+        index[is_leaf] = np.arange(n_leaves, n_leaves + is_leaf.sum())
+        leaf_index.append(index)
+        # per tree class distribution at the leaf, what DecisionTreeClassifier.predict_proba returns
+        value = tree.value[is_leaf, 0, :]
+        total = value.sum(axis = 1, keepdims = True)
+        total[total == 0] = 1.0
+        leaf_value.append(value / total)
+
+        offset += n_nodes
+        n_leaves += is_leaf.sum()
+
+    return {
+        'roots': np.asarray(roots, dtype = np.int32),
+        'depths': np.asarray(depths, dtype = np.int32),
+        'feature': np.concatenate(feature).astype(np.int32),
+        'threshold': float32_thresholds(np.concatenate(threshold)),
+        # left/right interleaved so one gather at 2 * node + (x > threshold) picks the child
+        'children': np.stack([np.concatenate(left), np.concatenate(right)], axis = 1).ravel().astype(np.int32),
+        'missing_right': np.concatenate(missing_right).astype(bool),
+        'leaf_index': np.concatenate(leaf_index).astype(np.int32),
+        # leaf distributions stay float64 so averaged probabilities (and argmax ties) match sklearn
+        'leaf_value': np.concatenate(leaf_value).astype(np.float64),
+    }
+
+
+def export_forest(model, path):
+    os.makedirs(path, exist_ok = True)
+    for name, array in flatten_forest(model).items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'classes': model.classes_.tolist(),
+        'n_features': int(model.n_features_in_),
+        'feature_names': [str(c) for c in getattr(model, "feature_names_in_", [])],
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return path
+
+
+# Memory-mapped arrays: pages are shared between workers and only read when touched
+def load_forest(path, mmap_mode = "r"):
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta['format_version'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported compact forest format {meta['format_version']}")
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode = mmap_mode) for name in ARRAYS}
+    return CompactForest(arrays, meta)
+
+
+# predict / predict_proba over the flattened arrays, same outputs as the sklearn forest
+class CompactForest:
+    # rows per block, bounds the (rows x trees x classes) leaf gather
+    BLOCK_ROWS = 4096
+    # how often the walk drops (row, tree) paths that already reached a leaf
+    LEAF_CHECK_STEPS = 4
+
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.classes_ = np.asarray(meta['classes'])
+        self.n_features_in_ = meta['n_features']
+        self.feature_names_in_ = np.asarray(meta['feature_names']) if meta['feature_names'] else None
+        self.n_estimators = len(arrays['roots'])
+        self.max_depth = int(np.max(arrays['depths'])) if self.n_estimators else 0
+
+    @classmethod
+    def from_model(cls, model):
+        meta = {
+            'classes': model.classes_.tolist(),
+            'n_features': int(model.n_features_in_),
+            'feature_names': [str(c) for c in getattr(model, "feature_names_in_", [])],
+        }
+        return cls(flatten_forest(model), meta)
+
+    def to_matrix(self, X):
+        if hasattr(X, "columns") and self.feature_names_in_ is not None:
+            X = X[list(self.feature_names_in_)]
+        X = np.ascontiguousarray(X, dtype = np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, the forest expects {self.n_features_in_}")
+        return X
+
+    # Level-synchronous walk: every (row, tree) path moves down one level per step for all trees at once.
+    # Paths that reached a leaf are dropped every few steps so deep, unbalanced trees do not keep the whole
+    # matrix busy until max_depth. Blocks without NaN skip the missing value lookup.
+    def leaf_nodes(self, X):
+        feature, threshold, children = self.arrays['feature'], self.arrays['threshold'], self.arrays['children']
+        leaf_index, missing_right = self.arrays['leaf_index'], self.arrays['missing_right']
+        flat = X.ravel()
+        has_missing = bool(np.isnan(flat).any())
+        n_trees = self.n_estimators
+        node = np.tile(np.asarray(self.arrays['roots']), len(X))
+        row_base = np.repeat(np.arange(len(X), dtype = np.int64) * X.shape[1], n_trees)
+        leaves = np.empty_like(node)
+        path = np.arange(len(node))
+        for step in range(self.max_depth):
+            if step and step % self.LEAF_CHECK_STEPS == 0:
+                inner = leaf_index.take(node) < 0
+                if not inner.all():
+                    leaves[path[~inner]] = node[~inner]
+                    path, node, row_base = path[inner], node[inner], row_base[inner]
+                    if not len(node):
+                        break
+            values = flat.take(row_base + feature.take(node))
+            go_right = values > threshold.take(node)
+            if has_missing:
+                go_right |= np.isnan(values) & missing_right.take(node)
+            node = children.take(2 * node + go_right)
+        leaves[path] = node
+        return leaves.reshape(len(X), n_trees)
+
+    def predict_proba(self, X):
+        X = self.to_matrix(X)
+        proba = np.empty((len(X), len(self.classes_)))
+        for start in range(0, len(X), self.BLOCK_ROWS):
+            block = X[start:start + self.BLOCK_ROWS]
+            leaves = self.arrays['leaf_index'].take(self.leaf_nodes(block))
+            proba[start:start + len(block)] = self.arrays['leaf_value'].take(leaves, axis = 0).sum(axis = 1) / self.n_estimators
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis = 1))
@@ -1,15 +1,175 @@
-
+import argparse
+import base64
 import json
+import os
+from functools import lru_cache
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.fs as pafs
+import pyarrow.json as pajson
+import pyarrow.parquet as pq
+
+# Column names the monitoring baseline was built with: feature0000000000, feature0000000001, ...
+FEATURE_PREFIX = "feature"
+PREDICTION_COLUMN = "prediction0"
+# JSON values are floats of any precision, float64 keeps them as the per-record handler returned them
+FEATURE_TYPE = pa.float64()
+
+# Only the captured fields that are decoded; everything else in a capture line is skipped by the parser
+CAPTURED_PAYLOAD = pa.struct([("data", pa.string()), ("encoding", pa.string())])
+CAPTURE_SCHEMA = pa.schema([
+    ("captureData", pa.struct([("endpointInput", CAPTURED_PAYLOAD), ("endpointOutput", CAPTURED_PAYLOAD)])),
+    ("eventMetadata", pa.struct([("eventId", pa.string()), ("inferenceTime", pa.string())])),
+])
+# capture files are parsed in blocks of this many bytes
+BLOCK_SIZE = 2**20
+
+
+@lru_cache(maxsize = None)
+def feature_names(n_columns):
+    return [f"{FEATURE_PREFIX}{str(i).zfill(10)}" for i in range(n_columns)]
+
+
+# ------------------------------------ Payloads
+# Captured data as text; payloads captured as BASE64 (content types outside the capture config) are decoded
+def payload_text(payload):
+    data = payload.field("data")
+    base64_rows = pc.equal(payload.field("encoding"), "BASE64")
+    if not pc.any(base64_rows).as_py():
+        return data
+    decoded = [base64.b64decode(value).decode("utf-8") if encoded else value
+               for value, encoded in zip(data.to_pylist(), base64_rows.to_pylist())]
+    return pa.array(decoded, pa.string())
+
+
+# One CSV line per feature row: "1,2" stays, "[1, 2]" -> "1, 2", "[[1, 2], [3, 4]]" -> "1, 2\n3, 4"
+def csv_rows(inputs):
+    inputs = pc.utf8_trim_whitespace(inputs)
+    if pc.any(pc.starts_with(inputs, "{")).as_py():
+        # {"instances": [...]} / {"features": [...]} requests, re-serialized as arrays
+        inputs = pa.array([json.dumps(json_rows(text)) if text.startswith("{") else text
+                           for text in inputs.to_pylist()], pa.string())
+    rows = pc.utf8_trim(inputs, "[]")
+    nested = pc.starts_with(inputs, "[[")
+    if pc.any(nested).as_py():
+        rows = pc.if_else(nested, pc.replace_substring_regex(rows, r"\]\s*,\s*\[", "\n"), rows)
+    return rows
+
+
+# Rows of a JSON request body, the shapes rf_script.input_fn accepts
+def json_rows(text):
+    payload = json.loads(text)
+    if isinstance(payload, dict):
+        payload = payload.get("instances", payload.get("features"))
+    return payload if payload and isinstance(payload[0], list) else [payload]
+
+
+def join_lines(strings):
+    joined = pc.binary_join(pa.ListArray.from_arrays(pa.array([0, len(strings)], pa.int32()), strings), "\n")
+    return joined[0].as_buffer()
+
 
+# All feature rows of a batch of captured inputs parsed at once; also returns the rows of each record
+def decode_inputs(inputs):
+    rows = csv_rows(inputs)
+    rows_per_record = pc.add(pc.count_substring(rows, "\n"), 1).to_numpy(zero_copy_only = False)
+    n_columns = rows[0].as_py().split("\n", 1)[0].count(",") + 1
+    names = feature_names(n_columns)
+    features = pacsv.read_csv(pa.BufferReader(join_lines(rows)),
+                              read_options = pacsv.ReadOptions(column_names = names),
+                              convert_options = pacsv.ConvertOptions(column_types = {name: FEATURE_TYPE for name in names}))
+    return features, rows_per_record
+
+
+# Predicted labels of every record in order: {"predictions": [...]}, a bare list or a single value
+def decode_outputs(outputs):
+    outputs = pc.utf8_trim_whitespace(outputs)
+    outputs = pc.if_else(pc.starts_with(outputs, "{"), outputs,
+                         pc.binary_join_element_wise('{"predictions":', outputs, '}', ""))
+    predictions = pajson.read_json(pa.BufferReader(join_lines(outputs))).column("predictions").combine_chunks()
+    if pa.types.is_list(predictions.type) or pa.types.is_large_list(predictions.type):
+        predictions = predictions.flatten()
+    return predictions.cast(pa.string())
+
+
+# ------------------------------------ Batch decoding
+# Captured records -> one row per feature row, with the prediction and the record's event metadata
+def decode_capture_table(capture):
+    capture_data = capture.column("captureData").combine_chunks()
+    features, rows_per_record = decode_inputs(payload_text(capture_data.field("endpointInput")))
+    columns = {name: features.column(name) for name in features.column_names}
+
+    predictions = decode_outputs(payload_text(capture_data.field("endpointOutput")))
+    if len(predictions) != features.num_rows:
+        raise ValueError(f"{len(predictions)} captured predictions for {features.num_rows} captured feature rows")
+    columns[PREDICTION_COLUMN] = predictions
+
+    record = np.repeat(np.arange(capture.num_rows), rows_per_record)
+    metadata = capture.column("eventMetadata").combine_chunks()
+    columns["event_id"] = metadata.field("eventId").take(record)
+    columns["inference_time"] = metadata.field("inferenceTime").take(record)
+    return pa.table(columns)
+
+
+def capture_files(path):
+    filesystem, root = pafs.FileSystem.from_uri(path if "://" in path else os.path.abspath(path))
+    info = filesystem.get_file_info(root)
+    if info.type == pafs.FileType.File:
+        return filesystem, [root]
+    selected = filesystem.get_file_info(pafs.FileSelector(root, recursive = True))
+    return filesystem, sorted(f.path for f in selected if f.type == pafs.FileType.File and f.path.endswith(".jsonl"))
+
+
+# One decoded table per capture file (a file or a local / s3:// directory of them), files are read one at a time.
+# Capture paths sort by capture hour, `after` skips the files up to and including that path.
+def decode_capture(path, block_size = BLOCK_SIZE, after = None):
+    filesystem, files = capture_files(path)
+    parse_options = pajson.ParseOptions(explicit_schema = CAPTURE_SCHEMA, unexpected_field_behavior = "ignore")
+    for name in files:
+        if after is not None and name <= after:
+            continue
+        with filesystem.open_input_stream(name) as f:
+            capture = pajson.read_json(f, read_options = pajson.ReadOptions(block_size = block_size),
+                                       parse_options = parse_options)
+        if capture.num_rows:
+            yield name, decode_capture_table(capture)
+
+
+def read_capture(path, block_size = BLOCK_SIZE):
+    tables = [table for _, table in decode_capture(path, block_size)]
+    return pa.concat_tables(tables) if tables else pa.table({})
+
+
+# ------------------------------------ Model Monitor record preprocessor
+# Per-record entry point called by the monitoring job: the record is decoded as a batch of one, so it gets the
+# same parsing and column names as the batch decoder. Returns the feature dict of the record, or a list of dicts
+# for a multi-row request.
 def preprocess_handler(inference_record):
-    input_data = json.loads(inference_record.endpoint_input.data)
-    input_data = {f"feature{str(i).zfill(10)}": val for i, val in enumerate(input_data)}
+    endpoint_input = inference_record.endpoint_input
+    payload = pa.StructArray.from_arrays([pa.array([endpoint_input.data], pa.string()),
+                                          pa.array([getattr(endpoint_input, "encoding", None)], pa.string())],
+                                         fields = list(CAPTURED_PAYLOAD))
+    features, _ = decode_inputs(payload_text(payload))
+    records = features.to_pylist()
+    return records[0] if len(records) == 1 else records
+
 
-    output_data = json.loads(inference_record.endpoint_output.data)
-#     output_data = json.loads(inference_record.endpoint_output.data)["predictions"][0][0]
-    output_data = {"prediction0": output_data}
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--capture", type = str, required = True)
+    parser.add_argument("--output", type = str, default = "capture_features.parquet")
+    args = parser.parse_args()
 
-    print(input_data)
-    print(type(input_data))
-    print(output_data)
-    return {**input_data}
+    writer = None
+    rows = 0
+    for name, table in decode_capture(args.capture):
+        writer = writer or pq.ParquetWriter(args.output, table.schema)
+        writer.write_table(table)
+        rows += table.num_rows
+        print(f"Decoded {name}: {table.num_rows} rows")
+    if writer is not None:
+        writer.close()
+    print(f"{rows} captured rows written to {args.output}")
@@ -1,10 +1,12 @@
 import argparse
+import os
 import time
 import sagemaker
 from sagemaker.model_monitor import DataCaptureConfig
 from sagemaker.sklearn.model import SKLearnModel
 from sagemaker.workflow.pipeline_context import PipelineSession
-import boto3
+
+import aws_clients
 
 # Parse argument variables passed via the DeployModel processing step
 parser = argparse.ArgumentParser()
@@ -20,13 +22,13 @@ parser.add_argument("--endpoint-name", type = str)
 args = parser.parse_args()
 
 region = args.region
-boto3.setup_default_session(region_name = region)
-sagemaker_boto_client = boto3.client("sagemaker")
+# one session for the SageMaker SDK and the boto3 client, credentials are resolved once
+boto_session = aws_clients.session(region)
+sagemaker_boto_client = aws_clients.client("sagemaker", region)
 
 # ------------------------------------------------------ 2
 sagemaker_role = sagemaker.get_execution_role()
 # pipeline_session = PipelineSession()
-boto_session = boto3.Session(region_name = region)
 sagemaker_session = sagemaker.session.Session(
     boto_session = boto_session, sagemaker_client = sagemaker_boto_client
 )
@@ -41,6 +43,8 @@ model = SKLearnModel(
     model_data = args.model_data,
     role = sagemaker_role,
     entry_point = "rf_script.py",
+    # rf_script imports compact_forest, so ship the whole scripts directory with the model
+    source_dir = os.path.dirname(os.path.abspath(__file__)),
     framework_version = "1.2-1",
     sagemaker_session = sagemaker_session,
 )
@@ -0,0 +1,309 @@
+import argparse
+import json
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+from datacapture_preprocessing import FEATURE_PREFIX, PREDICTION_COLUMN, decode_capture, feature_names
+from feature_schema import (FAILURE_CLASSES, FEATURE_COLUMNS, LABEL_COLUMN, LEGACY_FEATURE_COLUMNS, positional_features,
+                            read_training_csv)
+
+# Quantile sketch: log-spaced buckets with 1% relative accuracy, values below SKETCH_MIN_VALUE count as zero.
+# SKETCH_KEYS buckets per sign cover up to ~1e11, larger values land in the last bucket.
+SKETCH_ALPHA = 0.01
+SKETCH_GAMMA = (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA)
+SKETCH_MIN_VALUE = 1e-6
+SKETCH_KEYS = 2048
+SKETCH_WIDTH = 2 * SKETCH_KEYS + 1
+# PSI histograms: bins between baseline quantiles, plus one below and one above
+HISTOGRAM_BINS = 20
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+# PSI above these is a warning / drift. KS drifts above KS_DRIFT when it is also past its 5% critical value:
+# rolling-window features are autocorrelated, the test alone flags negligible shifts on large windows.
+PSI_WARNING = 0.1
+PSI_DRIFT = 0.25
+KS_DRIFT = 0.1
+KS_COEFFICIENT = 1.36
+PSI_EPSILON = 1e-4
+
+BASELINE_FILE = "drift_baseline.json"
+WINDOWS = 24
+
+
+def sketch_index(X):
+    magnitude = np.abs(X)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        keys = np.ceil(np.log(magnitude / SKETCH_MIN_VALUE) / np.log(SKETCH_GAMMA))
+    keys = np.where(magnitude < SKETCH_MIN_VALUE, 0, np.clip(keys, 1, SKETCH_KEYS))
+    return (SKETCH_KEYS + np.sign(X) * keys).astype(np.int64)
+
+
+# Representative value of every sketch bucket, the midpoint that keeps the relative error under SKETCH_ALPHA
+def sketch_values():
+    keys = np.arange(SKETCH_WIDTH) - SKETCH_KEYS
+    magnitude = SKETCH_MIN_VALUE * 2 * SKETCH_GAMMA ** np.abs(keys) / (SKETCH_GAMMA + 1)
+    return np.where(keys == 0, 0.0, np.sign(keys) * magnitude)
+
+
+# Count, mean and variance (merged with Chan's formula), min/max, a quantile sketch and a PSI histogram for
+# every feature. The size is fixed by the number of features, whatever the number of rows, and two
+# statistics over the same edges merge by adding them up.
+class FeatureStatistics:
+    def __init__(self, names, edges):
+        self.names = list(names)
+        # (features, bins - 1) interior edges, +inf padded where a feature has fewer distinct quantiles
+        self.edges = np.asarray(edges, dtype = np.float64)
+        n = len(self.names)
+        self.count = np.zeros(n)
+        self.missing = np.zeros(n)
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+        self.min = np.full(n, np.inf)
+        self.max = np.full(n, -np.inf)
+        self.sketch = np.zeros((n, SKETCH_WIDTH))
+        self.histogram = np.zeros((n, self.edges.shape[1] + 1))
+
+    def empty(self):
+        return FeatureStatistics(self.names, self.edges)
+
+    def update(self, X):
+        X = np.asarray(X, dtype = np.float64)
+        n_features = len(self.names)
+        present = ~np.isnan(X)
+        count = present.sum(axis = 0)
+        self.missing += len(X) - count
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            mean = np.where(count > 0, np.nansum(X, axis = 0) / np.maximum(count, 1), 0.0)
+            m2 = np.nansum((X - mean) ** 2, axis = 0)
+        self.merge_moments(count, mean, m2)
+        if count.any():
+            self.min = np.fmin(self.min, np.nanmin(np.where(present, X, np.inf), axis = 0))
+            self.max = np.fmax(self.max, np.nanmax(np.where(present, X, -np.inf), axis = 0))
+
+        # one bincount over (feature, bucket) pairs for the sketch, one for the histogram
+        column = np.broadcast_to(np.arange(n_features), X.shape)[present]
+        values = X[present]
+        buckets = sketch_index(values)
+        self.sketch += np.bincount(column * SKETCH_WIDTH + buckets, minlength = self.sketch.size).reshape(self.sketch.shape)
+        n_bins = self.histogram.shape[1]
+        bins = np.empty(X.shape, dtype = np.int64)
+        for feature in range(n_features):
+            bins[:, feature] = np.searchsorted(self.edges[feature], X[:, feature], side = "right")
+        bins = bins[present]
+        self.histogram += np.bincount(column * n_bins + bins, minlength = self.histogram.size).reshape(self.histogram.shape)
+        return self
+
+    def merge_moments(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            self.mean = np.where(total > 0, self.mean + delta * count / np.maximum(total, 1), 0.0)
+            self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / np.maximum(total, 1)
+        self.count = total
+
+    def merge(self, other):
+        self.merge_moments(other.count, other.mean, other.m2)
+        self.missing += other.missing
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.sketch += other.sketch
+        self.histogram += other.histogram
+        return self
+
+    def variance(self):
+        return np.where(self.count > 1, self.m2 / np.maximum(self.count - 1, 1), 0.0)
+
+    def quantiles(self, qs = QUANTILES):
+        cumulative = np.cumsum(self.sketch, axis = 1)
+        values = sketch_values()
+        result = np.full((len(self.names), len(qs)), np.nan)
+        for feature in np.flatnonzero(self.count):
+            ranks = np.asarray(qs) * (self.count[feature] - 1)
+            result[feature] = values[np.searchsorted(cumulative[feature], ranks, side = "right")]
+        return result
+
+    def to_dict(self):
+        return {
+            "names": self.names,
+            "edges": [[e for e in row if np.isfinite(e)] for row in self.edges.tolist()],
+            "count": self.count.tolist(), "missing": self.missing.tolist(), "mean": self.mean.tolist(),
+            "m2": self.m2.tolist(), "min": self.min.tolist(), "max": self.max.tolist(),
+            "histogram": self.histogram.tolist(),
+            # sparse: most of the sketch buckets are empty
+            "sketch": [{int(i): float(row[i]) for i in np.flatnonzero(row)} for row in self.sketch],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data["names"], padded_edges(data["edges"]))
+        for name in ("count", "missing", "mean", "m2", "min", "max", "histogram"):
+            setattr(stats, name, np.asarray(data[name], dtype = np.float64))
+        for feature, buckets in enumerate(data["sketch"]):
+            for index, count in buckets.items():
+                stats.sketch[feature, int(index)] = count
+        return stats
+
+
+def padded_edges(edges, n_bins = HISTOGRAM_BINS):
+    padded = np.full((len(edges), n_bins - 1), np.inf)
+    for feature, row in enumerate(edges):
+        padded[feature, :len(row)] = row
+    return padded
+
+
+# Histogram edges at the baseline's quantiles; ties (counts, codes) collapse into fewer bins
+def quantile_edges(X, n_bins = HISTOGRAM_BINS):
+    qs = np.linspace(0, 1, n_bins + 1)[1:-1]
+    edges = []
+    for column in np.asarray(X, dtype = np.float64).T:
+        column = column[~np.isnan(column)]
+        edges.append(np.unique(np.quantile(column, qs)).tolist() if len(column) else [])
+    return padded_edges(edges, n_bins)
+
+
+# ------------------------------------ Baseline
+# Statistics of the training features, computed once; the predicted classes are compared with the labels
+def build_baseline(features, labels = None, names = FEATURE_COLUMNS):
+    X = np.asarray(features, dtype = np.float64)
+    stats = FeatureStatistics(names, quantile_edges(X)).update(X)
+    baseline = {"features": stats.to_dict()}
+    if labels is not None:
+        baseline["classes"] = class_counts(np.asarray(labels).astype(str))
+    return baseline
+
+
+def class_counts(values, classes = FAILURE_CLASSES):
+    return {c: int(n) for c, n in zip(classes, (np.asarray(values)[:, None] == np.asarray(classes)).sum(axis = 0))}
+
+
+def write_baseline(baseline, path):
+    with open(path, "w") as f:
+        json.dump(baseline, f)
+    return path
+
+
+def read_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# ------------------------------------ Drift scores
+def psi(expected, actual):
+    expected = expected / max(expected.sum(), 1) + PSI_EPSILON
+    actual = actual / max(actual.sum(), 1) + PSI_EPSILON
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+# KS statistic between the two sketches' CDFs, exact up to the sketch's bucket resolution
+def ks_statistic(baseline_sketch, current_sketch):
+    base = np.cumsum(baseline_sketch) / max(baseline_sketch.sum(), 1)
+    current = np.cumsum(current_sketch) / max(current_sketch.sum(), 1)
+    return float(np.max(np.abs(base - current)))
+
+
+def drift_scores(baseline, current):
+    base_std = np.sqrt(baseline.variance())
+    base_q, current_q = baseline.quantiles(), current.quantiles()
+    scores = {}
+    for feature, name in enumerate(baseline.names):
+        n, m = baseline.count[feature], current.count[feature]
+        if not m:
+            continue
+        ks = ks_statistic(baseline.sketch[feature], current.sketch[feature])
+        score = psi(baseline.histogram[feature], current.histogram[feature])
+        ks_critical = KS_COEFFICIENT * np.sqrt((n + m) / (n * m))
+        scores[name] = {
+            "psi": score, "ks": ks, "ks_critical": float(ks_critical),
+            "mean_shift": float((current.mean[feature] - baseline.mean[feature]) / base_std[feature]) if base_std[feature] else 0.0,
+            "count": int(m), "missing": int(current.missing[feature]),
+            "median": float(current_q[feature, QUANTILES.index(0.5)]), "baseline_median": float(base_q[feature, QUANTILES.index(0.5)]),
+            "status": "drift" if score > PSI_DRIFT or ks > max(KS_DRIFT, ks_critical)
+                      else "warning" if score > PSI_WARNING or ks > ks_critical else "ok",
+        }
+    return scores
+
+
+# ------------------------------------ Monitor
+# Current statistics kept per window (one capture file = one capture hour); the report merges the last
+# `windows` of them, so memory stays at windows x one FeatureStatistics however long the stream runs
+class DriftMonitor:
+    def __init__(self, baseline, windows = WINDOWS):
+        self.baseline = FeatureStatistics.from_dict(baseline["features"])
+        self.baseline_classes = baseline.get("classes")
+        self.windows = deque(maxlen = windows)
+        self.total = self.baseline.empty()
+
+    def update(self, X, predictions = None, window = None):
+        stats = self.baseline.empty().update(X)
+        classes = class_counts(predictions) if predictions is not None else None
+        self.windows.append((window, stats, classes))
+        self.total.merge(stats)
+
+    def current(self):
+        merged = self.baseline.empty()
+        classes = dict.fromkeys(FAILURE_CLASSES, 0)
+        for _, stats, window_classes in self.windows:
+            merged.merge(stats)
+            for c, n in (window_classes or {}).items():
+                classes[c] += n
+        return merged, classes
+
+    def report(self):
+        current, classes = self.current()
+        report = {"windows": [window for window, _, _ in self.windows], "rows": int(current.count.max(initial = 0)),
+                  "features": drift_scores(self.baseline, current)}
+        if self.baseline_classes and sum(classes.values()):
+            report["prediction_psi"] = psi(np.array([self.baseline_classes[c] for c in FAILURE_CLASSES], dtype = float),
+                                            np.array([classes[c] for c in FAILURE_CLASSES], dtype = float))
+        report["drifting"] = sorted(name for name, s in report["features"].items() if s["status"] == "drift")
+        return report
+
+
+# Capture columns are named by position. Payloads in the legacy one-hot layout are mapped onto FEATURE_COLUMNS
+# the way the endpoint maps them; any other width cannot be compared with the baseline.
+def capture_features(table):
+    width = sum(name.startswith(FEATURE_PREFIX) for name in table.column_names)
+    if width not in (len(FEATURE_COLUMNS), len(LEGACY_FEATURE_COLUMNS)):
+        raise ValueError(f"Captured rows have {width} features, expected {len(FEATURE_COLUMNS)} "
+                         f"(or {len(LEGACY_FEATURE_COLUMNS)} in the legacy one-hot layout)")
+    return positional_features(np.column_stack([table.column(name).to_numpy() for name in feature_names(width)]))
+
+
+# Feed every capture file after `after` to the monitor, one window per file; returns the last file read
+def monitor_capture(monitor, capture, after = None, report_path = None):
+    for name, table in decode_capture(capture, after = after):
+        monitor.update(capture_features(table), table.column(PREDICTION_COLUMN).to_numpy(zero_copy_only = False), name)
+        report = monitor.report()
+        print(f"{name}: {table.num_rows} rows, drifting over the last {len(report['windows'])} windows: "
+              f"{', '.join(report['drifting']) or 'none'}")
+        if report_path:
+            with open(report_path, "a") as f:
+                f.write(json.dumps({"time": time.time(), "file": name, **report}) + "\n")
+        after = name
+    return after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--train-data", type = str, default = None)
+    parser.add_argument("--baseline", type = str, default = BASELINE_FILE)
+    parser.add_argument("--capture", type = str, default = None)
+    parser.add_argument("--windows", type = int, default = WINDOWS)
+    parser.add_argument("--report", type = str, default = "drift_report.jsonl")
+    # seconds between polls for new capture files, 0 reads what is there and exits
+    parser.add_argument("--follow", type = float, default = 0)
+    args = parser.parse_args()
+
+    if args.train_data:
+        train_df = read_training_csv(os.path.join(args.train_data, "train.csv"))
+        baseline = build_baseline(train_df[FEATURE_COLUMNS].to_numpy(), train_df[LABEL_COLUMN])
+        print("Baseline written at " + write_baseline(baseline, args.baseline))
+    if args.capture:
+        monitor = DriftMonitor(read_baseline(args.baseline), args.windows)
+        after = monitor_capture(monitor, args.capture, report_path = args.report)
+        while args.follow:
+            time.sleep(args.follow)
+            after = monitor_capture(monitor, args.capture, after, args.report)
@@ -0,0 +1,277 @@
+import numpy as np
+import pandas as pd
+
+TELEMETRY_FIELDS = ['volt', 'rotate', 'pressure', 'vibration']
+
+# 3 hour resample bins, 24 bins (3 days) for the long rolling window
+BIN_FREQ = pd.Timedelta(hours = 3)
+LONG_WINDOW = 24
+
+NS_PER_DAY = pd.Timedelta(days = 1).value
+
+
+# Output column order of telemetry_window_features, the same order the model was trained on
+def window_feature_names(fields = TELEMETRY_FIELDS):
+    return ([col + 'mean_3h' for col in fields] + [col + 'sd_3h' for col in fields] +
+            [col + 'mean_24h' for col in fields] + [col + 'sd_24h' for col in fields])
+
+
+# Resample origin used by pandas for 'start_day': midnight of the first timestamp
+def resample_origin(datetimes):
+    first = np.asarray(datetimes, dtype = 'datetime64[ns]').view('i8').min()
+    return int(first - first % NS_PER_DAY)
+
+
+# Sort rows by (machine, bin, time) once and return the flat group key of every row
+def group_by_machine_bin(df, origin, freq = BIN_FREQ):
+    freq_ns = pd.Timedelta(freq).value
+    machine_idx, machine_ids = pd.factorize(df['machineID'], sort = True)
+    ts = df['datetime'].to_numpy(dtype = 'datetime64[ns]').view('i8')
+    bins, offset = np.divmod(ts - origin, freq_ns)
+    first_bin = int(bins.min())
+    n_bins = int(bins.max()) - first_bin + 1
+
+    key = machine_idx.astype(np.int64) * n_bins + (bins - first_bin)
+    # one sort key: group first, then seconds into the bin
+    sort_key = key * (freq_ns // 10**9) + offset // 10**9
+    if (np.diff(sort_key) >= 0).all():
+        order = np.arange(len(key))
+    else:
+        order = np.argsort(sort_key, kind = 'stable')
+
+    if (np.diff(sort_key[order]) == 0).any():
+        # pivot_table averages repeated readings for the same machine and hour
+        df = df.groupby(['machineID', 'datetime'], as_index = False).mean(numeric_only = True)
+        return group_by_machine_bin(df, origin, freq)
+    return df, order, key[order], np.asarray(machine_ids), first_bin, n_bins
+
+
+# Mean, sample standard deviation and first reading of every (machine, bin) group
+def bin_statistics(values, key, size):
+    valid = ~np.isnan(values)
+    values = values[valid]
+    key = key[valid]
+
+    count = np.bincount(key, minlength = size).astype(np.float64)
+    total = np.bincount(key, weights = values, minlength = size)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        mean = total / count
+        # second pass on the deviations keeps the variance exact for large readings
+        dev = values - mean[key]
+        sq_dev = np.bincount(key, weights = dev * dev, minlength = size)
+        sd = np.sqrt(sq_dev / (count - 1))
+    sd[count < 2] = np.nan
+
+    first = np.full(size, np.nan)
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if len(key) else np.array([], dtype = np.int64)
+    first[key[starts]] = values[starts]
+    return mean, sd, first
+
+
+# Rolling mean and sample standard deviation over the last `window` bins of each machine
+def rolling_statistics(first, n_machines, n_bins, window = LONG_WINDOW):
+    grid = first.reshape(n_machines, n_bins)
+    present = ~np.isnan(grid)
+    # centring on each machine's mean keeps the cumulative sum of squares well conditioned, and keeps
+    # every machine's result independent of the other machines in the frame (sharded runs rely on it)
+    counts = present.sum(axis = 1, keepdims = True)
+    center = np.where(present, grid, 0.0).sum(axis = 1, keepdims = True) / np.maximum(counts, 1)
+    x = np.where(present, grid - center, 0.0)
+
+    zeros = np.zeros((n_machines, 1))
+    c1 = np.concatenate([zeros, np.cumsum(x, axis = 1)], axis = 1)
+    c2 = np.concatenate([zeros, np.cumsum(x * x, axis = 1)], axis = 1)
+    cn = np.concatenate([zeros, np.cumsum(present, axis = 1)], axis = 1)
+
+    mean = np.full((n_machines, n_bins), np.nan)
+    sd = np.full((n_machines, n_bins), np.nan)
+    if n_bins >= window:
+        s1 = c1[:, window:] - c1[:, :-window]
+        s2 = c2[:, window:] - c2[:, :-window]
+        full = (cn[:, window:] - cn[:, :-window]) == window
+        var = np.maximum((s2 - s1 * s1 / window) / (window - 1), 0.0)
+        mean[:, window - 1:] = np.where(full, s1 / window + center, np.nan)
+        sd[:, window - 1:] = np.where(full, np.sqrt(var), np.nan)
+    return mean.ravel(), sd.ravel()
+
+
+# Single pass telemetry window statistics: 3h mean/sd and 24 x 3h rolling mean/sd per machine
+def telemetry_window_features(df, fields = TELEMETRY_FIELDS, freq = BIN_FREQ, window = LONG_WINDOW, origin = None):
+    if origin is None:
+        origin = resample_origin(df['datetime'])
+    df, order, key, machine_ids, first_bin, n_bins = group_by_machine_bin(df, origin, freq)
+    n_machines = len(machine_ids)
+    size = n_machines * n_bins
+
+    stats = {}
+    for col in fields:
+        values = df[col].to_numpy(dtype = np.float64)[order]
+        mean, sd, first = bin_statistics(values, key, size)
+        stats[col + 'mean_3h'] = mean
+        stats[col + 'sd_3h'] = sd
+        stats[col + 'mean_24h'], stats[col + 'sd_24h'] = rolling_statistics(first, n_machines, n_bins, window)
+
+    columns = window_feature_names(fields)
+    keep = np.ones(size, dtype = bool)
+    for col in columns:
+        keep &= ~np.isnan(stats[col])
+
+    freq_ns = pd.Timedelta(freq).value
+    labels = origin + (first_bin + np.arange(n_bins, dtype = np.int64) + 1) * freq_ns
+    # fill one float block directly so the frame is not consolidated column by column
+    values = np.empty((int(keep.sum()), len(columns)))
+    for i, col in enumerate(columns):
+        values[:, i] = stats.pop(col)[keep]
+    telemetry_feat = pd.DataFrame(values, columns = columns, copy = False)
+    telemetry_feat.insert(0, 'datetime', np.tile(labels, n_machines)[keep].view('datetime64[ns]'))
+    telemetry_feat.insert(0, 'machineID', np.repeat(machine_ids, n_bins)[keep])
+    return telemetry_feat
+
+
+# Telemetry window features over time-ordered chunks. Raw rows of the bins that are still open and of the
+# window - 1 closed bins before them are carried into the next chunk, so memory depends on the chunk size and
+# window length rather than on the length of the history.
+class TelemetryWindowStream:
+    def __init__(self, origin = None, fields = TELEMETRY_FIELDS, freq = BIN_FREQ, window = LONG_WINDOW):
+        self.origin = origin
+        self.fields = fields
+        self.freq_ns = pd.Timedelta(freq).value
+        self.freq = freq
+        self.window = window
+        self.carry = None
+        # last bin whose features were emitted, and the raw rows they were computed from
+        self.emitted = None
+        self.rows = None
+
+    def bins(self, df):
+        return (df['datetime'].to_numpy(dtype = 'datetime64[ns]').view('i8') - self.origin) // self.freq_ns
+
+    # Label (end) of the last emitted bin, None before the first one
+    def emitted_label(self):
+        if self.emitted is None:
+            return None
+        return pd.Timestamp(self.origin + (self.emitted + 1) * self.freq_ns)
+
+    # Features of every bin closed by this chunk: later chunks can only add rows to the bin of its last reading
+    def update(self, chunk):
+        if self.origin is None:
+            self.origin = resample_origin(chunk['datetime'])
+        bins = self.bins(chunk)
+        if not len(bins):
+            return self.emit(self.carry, self.emitted)
+        if self.emitted is not None and bins.min() <= self.emitted:
+            raise ValueError("Telemetry chunks must be time ordered: a chunk has readings in an emitted bin")
+        frame = chunk if self.carry is None else pd.concat([self.carry, chunk], ignore_index = True)
+        return self.emit(frame, int(bins.max()) - 1)
+
+    # Features of the bins still open at the end of the stream
+    def flush(self):
+        if self.carry is None or not len(self.carry):
+            return self.emit(None, self.emitted)
+        return self.emit(self.carry, int(self.bins(self.carry).max()))
+
+    def emit(self, frame, closed):
+        if frame is None or not len(frame) or (self.emitted is not None and closed <= self.emitted):
+            self.carry = frame
+            return pd.DataFrame(columns = ['machineID', 'datetime'] + window_feature_names(self.fields))
+
+        features = telemetry_window_features(frame, self.fields, self.freq, self.window, self.origin)
+        label_bins = (features['datetime'].to_numpy(dtype = 'datetime64[ns]').view('i8') - self.origin) // self.freq_ns - 1
+        new = label_bins <= closed
+        if self.emitted is not None:
+            new &= label_bins > self.emitted
+        self.emitted = closed
+        self.rows = frame
+        self.carry = frame.loc[self.bins(frame) > closed - self.window + 1].reset_index(drop = True)
+        return features.loc[new].reset_index(drop = True)
+
+
+# ------------------------------------ Sparse event features
+# Error and maintenance events are looked up at the output timestamps from sorted per-machine event times
+# instead of being joined onto the hourly telemetry grid. Machine and time are packed into one int64 key,
+# machine index in the high bits and whole seconds since `epoch` below, so a single searchsorted on the
+# sorted keys answers the lookups of every machine at once.
+SECOND_BITS = 34
+SECOND_MASK = (1 << SECOND_BITS) - 1
+
+
+def pack_keys(machine_ids, df, epoch):
+    idx = np.searchsorted(machine_ids, df['machineID'].to_numpy())
+    known = idx < len(machine_ids)
+    known[known] = machine_ids[idx[known]] == df['machineID'].to_numpy()[known]
+    seconds = (df['datetime'].to_numpy(dtype = 'datetime64[ns]').view('i8') - epoch) // 10**9
+    return (idx.astype(np.int64) << SECOND_BITS) | seconds, known
+
+
+def packed_epoch(*frames):
+    return min(int(df['datetime'].to_numpy(dtype = 'datetime64[ns]').view('i8').min()) for df in frames if len(df))
+
+
+# Sorted packed keys of the events of each type; events of unknown machines or types are left out
+def event_index(events, column, types, machine_ids, epoch):
+    keys, known = pack_keys(machine_ids, events, epoch)
+    codes = pd.Categorical(events[column], categories = types).codes
+    return [np.sort(keys[known & (codes == i)]) for i in range(len(types))]
+
+
+# Number of events of each type at the first reading of every (machine, bin) of `readings`, summed over the
+# last `window` bins of the machine. Only windows with a reading in each of their bins are returned, the
+# rows errors_lag_features kept after its hourly merge, 3h resample and rolling sum.
+def event_window_counts(events, column, types, readings, freq = BIN_FREQ, window = LONG_WINDOW, origin = None):
+    if origin is None:
+        origin = resample_origin(readings['datetime'])
+    freq_ns = pd.Timedelta(freq).value
+    machine_ids = np.unique(readings['machineID'].to_numpy())
+    epoch = packed_epoch(readings, events)
+    keys, _ = pack_keys(machine_ids, readings, epoch)
+    index = event_index(events, column, types, machine_ids, epoch)
+
+    keys = np.sort(keys)
+    machine = keys >> SECOND_BITS
+    bins = (epoch + (keys & SECOND_MASK) * 10**9 - origin) // freq_ns
+    starts = np.flatnonzero(np.r_[True, (machine[1:] != machine[:-1]) | (bins[1:] != bins[:-1])])
+    first, machine, bins = keys[starts], machine[starts], bins[starts]
+
+    # the window ending at group i is complete when group i - window + 1 is the same machine window - 1 bins back
+    end = np.arange(window - 1, len(first))
+    full = (machine[end] == machine[end - window + 1]) & (bins[end] - bins[end - window + 1] == window - 1)
+    end = end[full]
+
+    counts = {}
+    for name, times in zip(types, index):
+        at_first = np.searchsorted(times, first, side = 'right') - np.searchsorted(times, first, side = 'left')
+        total = np.concatenate([[0], np.cumsum(at_first)])
+        counts[name] = (total[end + 1] - total[end + 1 - window]).astype(np.float64)
+
+    result = pd.DataFrame({'machineID': machine_ids[machine[end]],
+                           'datetime': (origin + (bins[end] + 1) * freq_ns).view('datetime64[ns]')})
+    for name in types:
+        result[name] = counts[name]
+    return result
+
+
+# Days since the last event of each type of the same machine, at every reading and every event time (one row
+# per distinct event time not already a reading), sorted by machine and time. NaN before a machine's first event.
+def days_since_events(events, column, types, readings):
+    machine_ids = np.unique(np.concatenate([readings['machineID'].to_numpy(), events['machineID'].to_numpy()]))
+    epoch = packed_epoch(readings, events)
+    keys, _ = pack_keys(machine_ids, readings, epoch)
+    event_keys, _ = pack_keys(machine_ids, events, epoch)
+    index = event_index(events, column, types, machine_ids, epoch)
+
+    event_keys = np.unique(event_keys)
+    extra = event_keys[~np.isin(event_keys, keys)]
+    rows = np.sort(np.concatenate([keys, extra]))
+    machine = rows >> SECOND_BITS
+    seconds = rows & SECOND_MASK
+
+    result = pd.DataFrame({'datetime': (epoch + seconds * 10**9).view('datetime64[ns]'),
+                           'machineID': machine_ids[machine]})
+    for name, times in zip(types, index):
+        last = np.searchsorted(times, rows, side = 'right') - 1
+        found = last >= 0
+        found[found] = (times[last[found]] >> SECOND_BITS) == machine[found]
+        elapsed = np.full(len(rows), np.nan)
+        elapsed[found] = ((seconds[found] - (times[last[found]] & SECOND_MASK)) * 10**9) / NS_PER_DAY
+        result[name] = elapsed
+    return result
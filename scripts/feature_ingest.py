@@ -0,0 +1,420 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+from botocore.exceptions import ClientError
+
+# Rows per unit of work; a chunk is the unit that gets checkpointed and retried
+CHUNK_ROWS = 1000
+THROTTLING_CODES = {"ThrottlingException", "Throttling", "TooManyRequestsException", "RequestLimitExceeded",
+                    "ProvisionedThroughputExceededException"}
+RETRYABLE_CODES = THROTTLING_CODES | {"ServiceUnavailable", "InternalFailure", "InternalServerError"}
+
+
+def error_code(e):
+    if isinstance(e, ClientError):
+        return e.response.get("Error", {}).get("Code")
+    return None
+
+
+# ------------------------------------ Feature definitions
+# Same mapping FeatureGroup.load_feature_definitions uses: Integral, Fractional or String
+def feature_definitions(df):
+    definitions = []
+    for col in df.columns:
+        if pd.api.types.is_integer_dtype(df[col]):
+            feature_type = "Integral"
+        elif pd.api.types.is_float_dtype(df[col]):
+            feature_type = "Fractional"
+        else:
+            feature_type = "String"
+        definitions.append({"FeatureName": col, "FeatureType": feature_type})
+    return definitions
+
+
+# Feature definitions only know Integral, Fractional and String.
+# Rows are stamped with their own datetime as event time, so the online store keeps each machine's latest row.
+def feature_store_types(df):
+    if 'datetime' in df.columns:
+        df['event_time'] = (df['datetime'] - pd.Timestamp(0)) / pd.Timedelta(seconds = 1)
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime("%Y-%m-%d %H:%M:%S")
+        elif isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(str)
+    return df
+
+
+# put_record payloads for a chunk; every column is stringified once, missing values are left out
+def chunk_records(chunk):
+    names = list(chunk.columns)
+    values = [chunk[col].astype(str).to_numpy() for col in names]
+    missing = chunk.isna().to_numpy()
+    records = []
+    for i in range(len(chunk)):
+        records.append([{"FeatureName": name, "ValueAsString": column[i]}
+                        for name, column, null in zip(names, values, missing[i]) if not null])
+    return records
+
+
+# Content digest of a chunk (column names and every value), so a resume only skips chunks whose rows are unchanged
+def chunk_digest(chunk):
+    digest = hashlib.sha1(json.dumps([str(col) for col in chunk.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(chunk, index = False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def chunk_digests(df, chunk_rows):
+    return [chunk_digest(df.iloc[start:start + chunk_rows]) for start in range(0, len(df), chunk_rows)]
+
+
+# ------------------------------------ Rate control
+# Paces calls across all workers; the rate halves on throttling and creeps back up on success (AIMD)
+class AdaptiveRateLimiter:
+    def __init__(self, rate = 200.0, min_rate = 5.0, max_rate = 5000.0, increase = 10.0, decrease = 0.5,
+                 cooldown = 0.5, clock = time.monotonic, sleep = time.sleep):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.clock = clock
+        self.sleep = sleep
+        self.next_slot = clock()
+        self.last_decrease = None
+        self.throttles = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = self.clock()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            self.sleep(slot - now)
+
+    def succeeded(self):
+        with self.lock:
+            if self.last_decrease is None:
+                # slow start: the rate roughly doubles every second until the first throttle
+                self.rate = min(self.max_rate, self.rate + 1.0)
+            else:
+                # then roughly +increase calls/s per second of successful traffic
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def throttled(self):
+        with self.lock:
+            self.throttles += 1
+            now = self.clock()
+            # one burst of throttles from many workers counts as a single congestion signal
+            if self.last_decrease is None or now - self.last_decrease >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.last_decrease = now
+                self.next_slot = max(self.next_slot, now + 1.0 / self.rate)
+
+
+# ------------------------------------ Checkpoint
+# Completed chunks per feature group with the digest of the rows they held, kept as one JSON object in S3
+# (or any client with put/get_object). The event time is stored too, so records re-sent after a resume are
+# identical to the first attempt.
+class IngestCheckpoint:
+    def __init__(self, s3_client, bucket, key, flush_interval = 5.0):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.last_flush = 0.0
+        self.dirty = False
+        self.state = self.load()
+
+    def load(self):
+        try:
+            body = self.s3_client.get_object(Bucket = self.bucket, Key = self.key)["Body"].read()
+        except FileNotFoundError:
+            return {"event_time": None, "groups": {}}
+        except ClientError as e:
+            if error_code(e) in ("NoSuchKey", "404"):
+                return {"event_time": None, "groups": {}}
+            raise
+        state = json.loads(body)
+        # checkpoints without chunk digests (a list of chunk numbers) cannot be checked and are dropped
+        state["groups"] = {name: dict(group, done = {int(chunk): digest for chunk, digest in group["done"].items()})
+                           for name, group in state["groups"].items() if isinstance(group.get("done"), dict)}
+        return state
+
+    def event_time(self, default):
+        with self.lock:
+            if self.state["event_time"] is None:
+                self.state["event_time"] = default
+                self.dirty = True
+            return self.state["event_time"]
+
+    # Chunks still to send: not done yet, or done with different rows. A group whose chunking changed starts over.
+    def pending_chunks(self, name, digests, chunk_rows):
+        with self.lock:
+            group = self.state["groups"].get(name)
+            if group is None or group["chunk_rows"] != chunk_rows:
+                if group is not None:
+                    print(f"Checkpoint for {name} was written with other chunks -- ingesting it from the start")
+                group = {"chunk_rows": chunk_rows, "done": {}}
+                self.state["groups"][name] = group
+                self.dirty = True
+            done = group["done"]
+            changed = [i for i, digest in enumerate(digests) if i in done and done[i] != digest]
+            if changed:
+                print(f"Checkpoint for {name}: {len(changed)} finished chunks hold different rows now -- "
+                      f"sending them again")
+            return [i for i, digest in enumerate(digests) if done.get(i) != digest]
+
+    def mark_done(self, name, chunk, digest):
+        with self.lock:
+            self.state["groups"][name]["done"][chunk] = digest
+            self.dirty = True
+            due = time.monotonic() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            state = dict(self.state, groups = {name: dict(group, done = {str(chunk): digest for chunk, digest
+                                                                         in sorted(group["done"].items())})
+                                               for name, group in self.state["groups"].items()})
+            self.s3_client.put_object(Bucket = self.bucket, Key = self.key, Body = json.dumps(state).encode())
+            self.dirty = False
+            self.last_flush = time.monotonic()
+
+
+# ------------------------------------ Ingestion
+class FeatureStoreIngester:
+    def __init__(self, sagemaker_client, runtime_client, checkpoint, max_workers = 16, limiter = None,
+                 chunk_rows = CHUNK_ROWS, max_attempts = 8, poll_interval = 2.0, max_poll_interval = 60.0,
+                 create_timeout = 1800.0, sleep = time.sleep):
+        self.sagemaker_client = sagemaker_client
+        self.runtime_client = runtime_client
+        self.checkpoint = checkpoint
+        self.max_workers = max_workers
+        self.limiter = limiter if limiter is not None else AdaptiveRateLimiter()
+        self.chunk_rows = chunk_rows
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.create_timeout = create_timeout
+        self.sleep = sleep
+        self.retries = 0
+
+    def create_group(self, name, df, record_identifier, event_time_feature, s3_uri, role_arn):
+        try:
+            self.sagemaker_client.create_feature_group(
+                FeatureGroupName = name,
+                RecordIdentifierFeatureName = record_identifier,
+                EventTimeFeatureName = event_time_feature,
+                FeatureDefinitions = feature_definitions(df),
+                OnlineStoreConfig = {"EnableOnlineStore": True},
+                OfflineStoreConfig = {"S3StorageConfig": {"S3Uri": s3_uri}},
+                RoleArn = role_arn,
+            )
+            print(f'Create "{name}" feature group: SUCCESS')
+        except ClientError as e:
+            if error_code(e) != "ResourceInUse":
+                raise
+            print(f'Using existing feature group "{name}"')
+
+    # Poll every group still creating with exponential backoff and jitter; yields names as they become ready
+    def wait_until_created(self, names):
+        pending = list(names)
+        interval = self.poll_interval
+        deadline = time.monotonic() + self.create_timeout
+        while pending:
+            still_creating = []
+            for name in pending:
+                description = self.sagemaker_client.describe_feature_group(FeatureGroupName = name)
+                status = description["FeatureGroupStatus"]
+                if status == "Created":
+                    yield name
+                elif status == "Creating":
+                    still_creating.append(name)
+                else:
+                    raise RuntimeError(f"Feature group {name} is {status}: {description.get('FailureReason')}")
+            pending = still_creating
+            if pending:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Feature groups still creating: {pending}")
+                print(f"Feature groups creating: {pending}")
+                self.sleep(interval * random.uniform(0.5, 1.0))
+                interval = min(self.max_poll_interval, interval * 2)
+
+    def put_record(self, name, record):
+        for attempt in range(self.max_attempts):
+            self.limiter.acquire()
+            try:
+                self.runtime_client.put_record(FeatureGroupName = name, Record = record)
+                self.limiter.succeeded()
+                return
+            except ClientError as e:
+                code = error_code(e)
+                if code not in RETRYABLE_CODES or attempt == self.max_attempts - 1:
+                    raise
+                if code in THROTTLING_CODES:
+                    self.limiter.throttled()
+                self.retries += 1
+                self.sleep(min(2.0, 0.05 * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+    def ingest_chunk(self, name, df, chunk, digest):
+        start = chunk * self.chunk_rows
+        for record in chunk_records(df.iloc[start:start + self.chunk_rows]):
+            self.put_record(name, record)
+        self.checkpoint.mark_done(name, chunk, digest)
+        return name, min(self.chunk_rows, len(df) - start)
+
+    # Create every group at once, then feed each group's pending chunks to one shared pool as soon as it is ready
+    def run(self, frames, record_identifier, event_time_feature, s3_uri, role_arn):
+        event_time = self.checkpoint.event_time(pd.Timestamp.now(tz = "UTC").timestamp())
+        # tables without their own event time column are stamped with the (checkpointed) ingest time
+        frames = {name: (df if event_time_feature in df.columns else df.assign(**{event_time_feature: event_time}))
+                  .reset_index(drop = True) for name, df in frames.items()}
+        ingested = {name: 0 for name in frames}
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers = self.max_workers) as pool:
+            try:
+                creates = [pool.submit(self.create_group, name, df, record_identifier, event_time_feature, s3_uri,
+                                       role_arn) for name, df in frames.items()]
+                for future in creates:
+                    future.result()
+
+                in_flight = set()
+                for name in self.wait_until_created(frames):
+                    df = frames[name]
+                    digests = chunk_digests(df, self.chunk_rows)
+                    chunks = self.checkpoint.pending_chunks(name, digests, self.chunk_rows)
+                    print(f"Ingesting {name}: {len(chunks)} of {len(digests)} chunks pending")
+                    in_flight.update(pool.submit(self.ingest_chunk, name, df, chunk, digests[chunk])
+                                     for chunk in chunks)
+                while in_flight:
+                    done, in_flight = wait(in_flight, return_when = FIRST_COMPLETED)
+                    for future in done:
+                        name, n_rows = future.result()
+                        ingested[name] += n_rows
+            except BaseException:
+                # stop queued chunks; whatever finished is still checkpointed below
+                pool.shutdown(wait = True, cancel_futures = True)
+                raise
+            finally:
+                self.checkpoint.flush()
+
+        elapsed = time.perf_counter() - start
+        print(f"Feature Data Ingested: {sum(ingested.values())} records in {elapsed:.1f}s, "
+              f"{self.retries} retries, {self.limiter.throttles} throttles, final rate {self.limiter.rate:.0f}/s")
+        return ingested
+
+
+# ------------------------------------ Local stand-in
+# In-process fake of the sagemaker and sagemaker-featurestore-runtime calls used above.
+# Groups report "Creating" for a few describes; put_record throttles above `capacity` calls per second.
+class LocalFeatureStoreClient:
+    def __init__(self, creating_polls = 2, capacity = None, latency = 0.0, fail_after = None):
+        self.creating_polls = creating_polls
+        self.capacity = capacity
+        self.latency = latency
+        self.fail_after = fail_after
+        self.groups = {}
+        self.online = {}
+        self.offline = {}
+        self.puts = 0
+        self.batch_gets = 0
+        self.throttled = 0
+        self.window = []
+        self.lock = threading.Lock()
+
+    def error(self, code, operation):
+        return ClientError({"Error": {"Code": code, "Message": code}, "ResponseMetadata": {"HTTPStatusCode": 400}},
+                           operation)
+
+    def create_feature_group(self, FeatureGroupName, RecordIdentifierFeatureName, EventTimeFeatureName,
+                             FeatureDefinitions, **kwargs):
+        with self.lock:
+            if FeatureGroupName in self.groups:
+                raise self.error("ResourceInUse", "CreateFeatureGroup")
+            self.groups[FeatureGroupName] = {
+                "record_identifier": RecordIdentifierFeatureName,
+                "event_time": EventTimeFeatureName,
+                "definitions": FeatureDefinitions,
+                "polls": 0,
+            }
+            self.online[FeatureGroupName] = {}
+            self.offline[FeatureGroupName] = []
+        return {"FeatureGroupArn": f"arn:local:feature-group/{FeatureGroupName}"}
+
+    def describe_feature_group(self, FeatureGroupName):
+        with self.lock:
+            if FeatureGroupName not in self.groups:
+                raise self.error("ResourceNotFound", "DescribeFeatureGroup")
+            group = self.groups[FeatureGroupName]
+            group["polls"] += 1
+            status = "Created" if group["polls"] > self.creating_polls else "Creating"
+        return {"FeatureGroupName": FeatureGroupName, "FeatureGroupStatus": status}
+
+    def put_record(self, FeatureGroupName, Record):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            if self.fail_after is not None and self.puts >= self.fail_after:
+                raise self.error("ValidationException", "PutRecord")
+            if self.capacity is not None:
+                now = time.monotonic()
+                self.window = [t for t in self.window if now - t < 1.0]
+                if len(self.window) >= self.capacity:
+                    self.throttled += 1
+                    raise self.error("ThrottlingException", "PutRecord")
+                self.window.append(now)
+            group = self.groups[FeatureGroupName]
+            values = {feature["FeatureName"]: feature["ValueAsString"] for feature in Record}
+            record_id = values[group["record_identifier"]]
+            current = self.online[FeatureGroupName].get(record_id)
+            # the online store keeps the latest event time per record, the offline store keeps everything
+            if current is None or float(values[group["event_time"]]) >= float(current[group["event_time"]]):
+                self.online[FeatureGroupName][record_id] = values
+            self.offline[FeatureGroupName].append(values)
+            self.puts += 1
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    def get_record(self, FeatureGroupName, RecordIdentifierValueAsString, FeatureNames = None):
+        with self.lock:
+            values = self.online.get(FeatureGroupName, {}).get(RecordIdentifierValueAsString)
+        if values is None:
+            return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+        record = [{"FeatureName": k, "ValueAsString": v} for k, v in values.items()
+                  if FeatureNames is None or k in FeatureNames]
+        return {"Record": record, "ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    # Records that do not exist are left out of Records, like the service does
+    def batch_get_record(self, Identifiers):
+        if self.latency:
+            time.sleep(self.latency)
+        records = []
+        with self.lock:
+            self.batch_gets += 1
+            for identifier in Identifiers:
+                name = identifier["FeatureGroupName"]
+                record_ids = identifier["RecordIdentifiersValueAsString"]
+                if not 1 <= len(record_ids) <= 100:
+                    raise self.error("ValidationException", "BatchGetRecord")
+                feature_names = identifier.get("FeatureNames")
+                for record_id in record_ids:
+                    values = self.online.get(name, {}).get(record_id)
+                    if values is None:
+                        continue
+                    record = [{"FeatureName": k, "ValueAsString": v} for k, v in values.items()
+                              if feature_names is None or k in feature_names]
+                    records.append({"FeatureGroupName": name, "RecordIdentifierValueAsString": record_id,
+                                    "Record": record})
+        return {"Records": records, "Errors": [], "UnprocessedIdentifiers": [],
+                "ResponseMetadata": {"HTTPStatusCode": 200}}
@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from feature_engine import window_feature_names
+from feature_schema import ERROR_FEATURES, FEATURE_COLUMNS, MAINTENANCE_FEATURES, category_code
+
+# Online feature groups written by featurestore.py and the features the model reads from each
+FEATURE_GROUPS = {
+    'telemetry_fg': window_feature_names(),
+    'errors_fg': ERROR_FEATURES,
+    'maintenance_fg': MAINTENANCE_FEATURES,
+    'machines_fg': ['model', 'age'],
+}
+# BatchGetRecord accepts at most 100 record identifiers per feature group
+MAX_IDS_PER_CALL = 100
+MAX_UNPROCESSED_RETRIES = 3
+# latency samples kept for the percentile metrics
+LATENCY_SAMPLES = 10000
+
+CACHE_TTL = float(os.environ.get("PDM_FEATURE_CACHE_TTL", "300"))
+CACHE_ENTRIES = int(os.environ.get("PDM_FEATURE_CACHE_ENTRIES", "50000"))
+
+
+# LRU cache whose entries also expire after ttl seconds; None is cached too so unknown machines are not refetched
+class TTLCache:
+    def __init__(self, max_entries = CACHE_ENTRIES, ttl = CACHE_TTL, clock = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > self.clock():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self.entries[key]
+                self.expired += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last = False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Builds the model's feature matrix from machine IDs: cached online records, misses fetched with BatchGetRecord
+class OnlineFeatureAssembler:
+    def __init__(self, runtime_client, cache = None, groups = FEATURE_GROUPS, max_ids_per_call = MAX_IDS_PER_CALL,
+                 log_every = 0):
+        self.runtime_client = runtime_client
+        self.cache = cache if cache is not None else TTLCache()
+        self.groups = groups
+        self.max_ids_per_call = max_ids_per_call
+        self.log_every = log_every
+        self.requests = 0
+        self.batch_get_calls = 0
+        self.fetch_latencies = deque(maxlen = LATENCY_SAMPLES)
+        self.assemble_latencies = deque(maxlen = LATENCY_SAMPLES)
+        self.lock = threading.Lock()
+
+    # One BatchGetRecord call covers every group, up to max_ids_per_call machines each
+    def batch_get(self, group_ids):
+        identifiers = [{"FeatureGroupName": name, "RecordIdentifiersValueAsString": ids,
+                        "FeatureNames": self.groups[name]} for name, ids in group_ids.items() if ids]
+        found = {}
+        for attempt in range(MAX_UNPROCESSED_RETRIES + 1):
+            start = time.perf_counter()
+            response = self.runtime_client.batch_get_record(Identifiers = identifiers)
+            with self.lock:
+                self.batch_get_calls += 1
+                self.fetch_latencies.append(time.perf_counter() - start)
+            for record in response.get("Records", []):
+                values = {feature["FeatureName"]: feature["ValueAsString"] for feature in record["Record"]}
+                found[(record["FeatureGroupName"], record["RecordIdentifierValueAsString"])] = values
+            for error in response.get("Errors", []):
+                print(f"BatchGetRecord error for {error.get('FeatureGroupName')}/"
+                      f"{error.get('RecordIdentifierValueAsString')}: {error.get('ErrorMessage')}")
+            identifiers = response.get("UnprocessedIdentifiers") or []
+            if not identifiers:
+                break
+        else:
+            raise RuntimeError(f"BatchGetRecord left identifiers unprocessed: {identifiers}")
+        return found
+
+    # {(group, machine id): feature values or None} for every group and machine
+    def fetch(self, machine_ids):
+        values = {}
+        missing = {name: [] for name in self.groups}
+        for machine_id in machine_ids:
+            for name in self.groups:
+                hit, value = self.cache.get((name, machine_id))
+                if hit:
+                    values[(name, machine_id)] = value
+                else:
+                    missing[name].append(machine_id)
+
+        for start in range(0, max(len(ids) for ids in missing.values()), self.max_ids_per_call):
+            group_ids = {name: ids[start:start + self.max_ids_per_call] for name, ids in missing.items()}
+            found = self.batch_get(group_ids)
+            for name, ids in group_ids.items():
+                for machine_id in ids:
+                    value = found.get((name, machine_id))
+                    self.cache.put((name, machine_id), value)
+                    values[(name, machine_id)] = value
+        return values
+
+    # instances: [{"machineID": 17, ...}], any feature given in an instance (e.g. fresh telemetry
+    # window statistics) overrides the stored value
+    def assemble(self, instances):
+        start = time.perf_counter()
+        machine_ids = [str(int(instance["machineID"])) for instance in instances]
+        values = self.fetch(list(dict.fromkeys(machine_ids)))
+
+        column = {name: i for i, name in enumerate(FEATURE_COLUMNS)}
+        data = np.full((len(instances), len(FEATURE_COLUMNS)), np.nan, dtype = np.float32)
+        unknown = set()
+        for row, (machine_id, instance) in enumerate(zip(machine_ids, instances)):
+            features = {}
+            for name in self.groups:
+                stored = values[(name, machine_id)]
+                if stored is None and not all(f in instance for f in self.groups[name]):
+                    unknown.add(machine_id)
+                features.update(stored or {})
+            features.update((k, v) for k, v in instance.items() if k != "machineID")
+            model = features.get('model')
+            if model is not None:
+                # the online store keeps the model name, the feature contract its integer code
+                try:
+                    features['model'] = category_code('model', model)
+                except ValueError as e:
+                    raise ValueError(f"{e} for machineID {machine_id}") from None
+            for name, value in features.items():
+                if name in column:
+                    data[row, column[name]] = float(value)
+        if unknown:
+            raise ValueError(f"No online features for machineID {sorted(unknown, key = int)}")
+        if np.isnan(data).any():
+            rows, cols = np.nonzero(np.isnan(data))
+            raise ValueError(f"Missing feature {FEATURE_COLUMNS[cols[0]]} for machineID {machine_ids[rows[0]]}")
+
+        with self.lock:
+            self.requests += 1
+            self.assemble_latencies.append(time.perf_counter() - start)
+            log = self.log_every and self.requests % self.log_every == 0
+        if log:
+            print(json.dumps({"online_features": self.metrics()}))
+        return data
+
+    def metrics(self):
+        cache = self.cache
+        lookups = cache.hits + cache.misses
+        with self.lock:
+            fetch_ms = np.asarray(self.fetch_latencies) * 1000
+            assemble_ms = np.asarray(self.assemble_latencies) * 1000
+        percentile = lambda ms, q: float(np.percentile(ms, q)) if len(ms) else None
+        return {
+            "requests": self.requests,
+            "cache_hit_rate": cache.hits / lookups if lookups else None,
+            "cache_hits": cache.hits,
+            "cache_misses": cache.misses,
+            "cache_expired": cache.expired,
+            "cache_evictions": cache.evictions,
+            "cache_entries": len(cache),
+            "batch_get_calls": self.batch_get_calls,
+            "batch_get_p50_ms": percentile(fetch_ms, 50),
+            "batch_get_p99_ms": percentile(fetch_ms, 99),
+            "assemble_p50_ms": percentile(assemble_ms, 50),
+            "assemble_p99_ms": percentile(assemble_ms, 99),
+        }
+
+
+_default_assembler = None
+
+
+# Shared assembler for the serving container, created on first use
+def default_assembler():
+    global _default_assembler
+    if _default_assembler is None:
+        import aws_clients
+        client = aws_clients.client("sagemaker-featurestore-runtime", os.environ.get("AWS_REGION"))
+        _default_assembler = OnlineFeatureAssembler(client, log_every = 1000)
+    return _default_assembler
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+from feature_engine import window_feature_names
+
+# ------------------------------------ Feature contract
+# Shared by preprocessing.py (labeled table), train_test_split_data.py (training matrix), rf_script.py
+# (training and the serving payload) and feature_lookup.py (online feature vectors)
+ERROR_FEATURES = ['error%dcount' % i for i in range(1, 6)]
+MAINTENANCE_FEATURES = ['comp1', 'comp2', 'comp3', 'comp4']
+MACHINE_MODELS = ['model1', 'model2', 'model3', 'model4']
+FAILURE_CLASSES = ['none', 'comp1', 'comp2', 'comp3', 'comp4']
+KEY_COLUMNS = ['datetime', 'machineID']
+LABEL_COLUMN = 'failure'
+
+# Model input columns in the order of the labeled table; the machine model is one integer code column
+FEATURE_COLUMNS = window_feature_names() + ERROR_FEATURES + MAINTENANCE_FEATURES + ['model', 'age']
+
+CATEGORIES = {'model': MACHINE_MODELS, 'failure': FAILURE_CLASSES}
+
+# The former pd.get_dummies training matrix: age, then one indicator column per machine model
+LEGACY_FEATURE_COLUMNS = FEATURE_COLUMNS[:-2] + ['age'] + MACHINE_MODELS
+
+# Storage dtype of every column of the feature and labeled tables. Counts and small integers are unsigned;
+# an integer column with missing values (a left merge found no row) is stored as float32 instead.
+TABLE_DTYPES = {
+    'datetime': 'datetime64[ns]',
+    'machineID': 'int32',
+    **{col: 'float32' for col in window_feature_names()},
+    **{col: 'uint8' for col in ERROR_FEATURES},
+    **{col: 'float32' for col in MAINTENANCE_FEATURES},
+    'model': 'category',
+    'age': 'uint8',
+    'failure': 'category',
+}
+
+# Model input dtypes: categoricals are replaced by their codes
+FEATURE_DTYPES = {col: 'uint8' if TABLE_DTYPES[col] == 'category' else TABLE_DTYPES[col] for col in FEATURE_COLUMNS}
+TRAINING_DTYPES = {**FEATURE_DTYPES, LABEL_COLUMN: 'category'}
+
+
+# Cast the columns of df named in dtypes, in place; other columns are left alone
+def apply_schema(df, dtypes = TABLE_DTYPES):
+    for col in df.columns:
+        dtype = dtypes.get(col)
+        if dtype is None:
+            continue
+        if dtype == 'category':
+            categories = CATEGORIES[col]
+            if not (isinstance(df[col].dtype, pd.CategoricalDtype) and list(df[col].cat.categories) == categories):
+                df[col] = pd.Categorical(df[col], categories = categories)
+        elif df[col].dtype == dtype:
+            continue
+        elif np.dtype(dtype).kind in 'iu':
+            values = df[col]
+            if values.isna().any():
+                df[col] = values.astype(np.float32)
+                continue
+            info = np.iinfo(dtype)
+            if len(values) and (values.min() < info.min or values.max() > info.max):
+                raise ValueError(f"Column {col} has values outside the {dtype} range of the feature schema")
+            df[col] = values.astype(dtype)
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+# Model input matrix of a labeled table or payload frame, in FEATURE_COLUMNS order with categorical codes
+def encode_features(df):
+    missing = [col for col in FEATURE_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing feature columns {missing}")
+    features = df[FEATURE_COLUMNS].copy()
+    for col in FEATURE_COLUMNS:
+        if col in CATEGORIES and not pd.api.types.is_numeric_dtype(features[col]):
+            codes = pd.Categorical(features[col], categories = CATEGORIES[col]).codes
+            if (codes < 0).any():
+                unknown = features[col][codes < 0].unique()[:5]
+                raise ValueError(f"Unknown {col} values {list(unknown)}, expected one of {CATEGORIES[col]}")
+            features[col] = codes
+    return apply_schema(features, FEATURE_DTYPES)
+
+
+# Positional rows of the former one-hot layout mapped onto FEATURE_COLUMNS (the model indicators become the
+# model code); rows of any other width are returned as they are for the model to check
+def positional_features(X):
+    if X.ndim != 2 or X.shape[1] != len(LEGACY_FEATURE_COLUMNS):
+        return X
+    one_hot = X[:, -len(MACHINE_MODELS):]
+    if not (((one_hot == 0) | (one_hot == 1)).all() and (one_hot.sum(axis = 1) == 1).all()):
+        raise ValueError(f"Rows with {len(LEGACY_FEATURE_COLUMNS)} columns must end in one indicator per machine "
+                         f"model {MACHINE_MODELS}")
+    n_shared = len(FEATURE_COLUMNS) - 2
+    return np.column_stack([X[:, :n_shared], one_hot.argmax(axis = 1), X[:, n_shared]]).astype(X.dtype)
+
+
+# Integer code of a categorical feature value, e.g. category_code('model', 'model3') == 2
+def category_code(col, value):
+    try:
+        return CATEGORIES[col].index(str(value))
+    except ValueError:
+        raise ValueError(f"Unknown {col} {value!r}, expected one of {CATEGORIES[col]}") from None
+
+
+# Training or test CSV written by train_test_split_data.py, read straight into the compact dtypes
+def read_training_csv(path):
+    dtypes = {col: np.float32 for col in FEATURE_COLUMNS}
+    dtypes[LABEL_COLUMN] = pd.CategoricalDtype(FAILURE_CLASSES)
+    return apply_schema(pd.read_csv(path, dtype = dtypes), TRAINING_DTYPES)
+
+
+# In-memory size of a frame, object columns included
+def memory_report(df):
+    usage = df.memory_usage(deep = True, index = False)
+    return {"rows": len(df), "bytes": int(usage.sum()), "bytes_per_row": float(usage.sum()) / max(len(df), 1)}
@@ -0,0 +1,119 @@
+import json
+import os
+import tarfile
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import f1_score
+
+# Training metadata saved next to model.joblib, read back by the next retraining run
+MODEL_META = "model_meta.json"
+
+
+# train_cutoff: rows before this datetime were in the training data (None when unknown)
+def write_model_meta(model_dir, model, feature_columns, params, train_cutoff = None):
+    meta = {
+        "feature_columns": list(feature_columns),
+        "classes": [str(c) for c in model.classes_],
+        "n_estimators": len(model.estimators_),
+        "params": params,
+        "train_cutoff": None if train_cutoff is None else str(train_cutoff),
+    }
+    path = os.path.join(model_dir, MODEL_META)
+    with open(path, "w") as f:
+        json.dump(meta, f, indent = 2)
+    return path
+
+
+# The previous model from a directory holding model.joblib, or the model.tar.gz of a training job
+def load_previous_model(model_dir):
+    if not os.path.exists(os.path.join(model_dir, "model.joblib")) and \
+            os.path.exists(os.path.join(model_dir, "model.tar.gz")):
+        extracted = tempfile.mkdtemp()
+        with tarfile.open(os.path.join(model_dir, "model.tar.gz")) as tar:
+            tar.extractall(extracted)
+        model_dir = extracted
+    model = joblib.load(os.path.join(model_dir, "model.joblib"))
+    meta = {}
+    if os.path.exists(os.path.join(model_dir, MODEL_META)):
+        with open(os.path.join(model_dir, MODEL_META)) as f:
+            meta = json.load(f)
+    return model, meta
+
+
+# New trees only make sense when they read the same columns in the same order as the old ones
+def check_feature_order(model, meta, feature_columns):
+    expected = list(feature_columns)
+    trained = meta.get("feature_columns")
+    if trained is None and hasattr(model, "feature_names_in_"):
+        trained = list(model.feature_names_in_)
+    if trained is None:
+        if model.n_features_in_ != len(expected):
+            raise ValueError(f"Previous model has {model.n_features_in_} features, the data has {len(expected)}")
+        return
+    if trained != expected:
+        moved = [f"{i}: {old} -> {new}" for i, (old, new) in enumerate(zip(trained, expected)) if old != new]
+        raise ValueError(f"Feature columns differ from the previous model ({len(trained)} vs {len(expected)} "
+                         f"columns; {', '.join(moved[:5])})")
+
+
+# Add n_new trees fitted on the new rows only, so the cost scales with the new data. With max_estimators
+# the oldest trees beyond that size are dropped (rolling forest). The model is changed in place.
+# Failures are rare, so a slice of new rows usually lacks some of the model's classes: the new trees are fitted
+# with the previous classes_ (see pad_missing_classes) and give the missing ones probability zero. Only classes
+# the previous model never saw make a warm start impossible, and so does an empty slice.
+def grow_forest(model, X_new, y_new, n_new, max_estimators = None):
+    if not len(y_new):
+        raise ValueError("No new training rows to grow the forest with")
+    old_classes = np.asarray(model.classes_)
+    unseen = np.setdiff1d(np.unique(np.asarray(y_new).astype(str)), old_classes.astype(str))
+    if len(unseen):
+        # the old trees have no output for these classes
+        raise ValueError(f"New data has classes {list(unseen)} the previous model {list(old_classes)} never saw")
+
+    began = time.perf_counter()
+    n_old = len(model.estimators_)
+    X_fit, y_fit, sample_weight = pad_missing_classes(X_new, y_new, old_classes)
+    model.set_params(warm_start = True, n_estimators = n_old + n_new)
+    model.fit(X_fit, y_fit, sample_weight = sample_weight)
+    model.classes_ = old_classes
+    dropped = 0
+    if max_estimators is not None and len(model.estimators_) > max_estimators:
+        dropped = len(model.estimators_) - max_estimators
+        model.estimators_ = model.estimators_[dropped:]
+    model.set_params(warm_start = False, n_estimators = len(model.estimators_))
+    return {"added": n_new, "dropped": dropped, "n_estimators": len(model.estimators_),
+            "fit_seconds": time.perf_counter() - began, "new_rows": len(y_new),
+            "missing_classes": int(len(y_fit) - len(y_new))}
+
+
+# warm_start refits classes_ from the labels it is given, so one row of each class missing from y_new is
+# appended (a copy of the first row) with sample weight zero: classes_ and every new tree's class columns
+# stay those of the previous model, and the trees, which only split on positively weighted rows, are the
+# ones y_new alone would give
+def pad_missing_classes(X_new, y_new, classes):
+    y = np.asarray(y_new).astype(classes.dtype)
+    missing = classes[~np.isin(classes.astype(str), y.astype(str))]
+    weight = np.ones(len(y) + len(missing))
+    weight[len(y):] = 0.0
+    if not len(missing):
+        return X_new, y, weight
+    if hasattr(X_new, "iloc"):
+        X_pad = pd.concat([X_new, X_new.iloc[[0] * len(missing)]], ignore_index = True)
+    else:
+        X_pad = np.concatenate([np.asarray(X_new), np.repeat(np.asarray(X_new)[:1], len(missing), axis = 0)])
+    return X_pad, np.concatenate([y, missing]), weight
+
+
+def macro_f1(model, X, y):
+    y = np.asarray(y).astype(str)
+    predictions = np.asarray(model.predict(X)).astype(str)
+    return float(f1_score(y, predictions, average = "macro", labels = np.unique(y), zero_division = 0))
+
+
+# Keep the update unless it scores more than max_drop below the previous model on the held-out rows
+def accept_update(previous_score, updated_score, max_drop):
+    return updated_score >= previous_score - max_drop
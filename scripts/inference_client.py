@@ -0,0 +1,220 @@
+import argparse
+import http.client
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+
+import aws_clients
+import rf_script
+
+CSV_CONTENT_TYPE = rf_script.CSV_CONTENT_TYPE
+JSON_CONTENT_TYPE = rf_script.JSON_CONTENT_TYPE
+
+
+# Stream the inference CSV and pack raw lines into micro-batches, nothing is parsed client side. Only the
+# first line of the file can be a header; a later line starting with "nan" is a row like any other.
+def read_batches(path, batch_size):
+    with open(path) as f:
+        batch = []
+        for line in f:
+            line = line.strip()
+            if line:
+                if not rf_script.is_header_row(line):
+                    batch.append(line)
+                break
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if len(batch) == batch_size:
+                yield len(batch), "\n".join(batch)
+                batch = []
+            batch.append(line)
+        if batch:
+            yield len(batch), "\n".join(batch)
+
+
+# ------------------------------------ Transports
+# Keep-alive HTTP connections, one per worker thread, to any endpoint speaking /invocations
+class HttpTransport:
+    def __init__(self, url, timeout = 60):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.path = parsed.path or "/invocations"
+        self.connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self):
+        if getattr(self.local, "connection", None) is None:
+            self.local.connection = self.connection_class(self.host, self.port, timeout = self.timeout)
+        return self.local.connection
+
+    def send(self, body, content_type, accept):
+        headers = {"Content-Type": content_type, "Accept": accept}
+        for attempt in range(2):
+            connection = self.connection()
+            try:
+                connection.request("POST", self.path, body = body, headers = headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # the server closed an idle keep-alive connection, reconnect once
+                connection.close()
+                self.local.connection = None
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise RuntimeError(f"Endpoint returned {response.status}: {data[:200]!r}")
+        return data
+
+
+# invoke_endpoint through one shared sagemaker-runtime client with a connection pool sized to the workers
+class SageMakerTransport:
+    def __init__(self, endpoint_name, client = None, max_pool_connections = 32, region_name = "us-east-1"):
+        self.endpoint_name = endpoint_name
+        if client is None:
+            client = aws_clients.client("sagemaker-runtime", region_name, max_pool_connections = max_pool_connections)
+        self.client = client
+
+    def send(self, body, content_type, accept):
+        response = self.client.invoke_endpoint(EndpointName = self.endpoint_name,
+                                               ContentType = content_type,
+                                               Accept = accept,
+                                               Body = body)
+        return response["Body"].read()
+
+
+# ------------------------------------ Driver
+def percentile_report(latencies, rows, requests, elapsed):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "requests": requests,
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_sec": rows / elapsed if elapsed else float("inf"),
+        "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+        "p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else None,
+        "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+    }
+
+
+# Send micro-batches through a bounded pool; at most 2 x concurrency batches are read ahead
+def run_batches(batches, transport, concurrency = 8, content_type = CSV_CONTENT_TYPE, accept = JSON_CONTENT_TYPE,
+                keep_responses = False):
+    latencies = []
+    responses = {}
+    rows = 0
+
+    def send(index, body):
+        start = time.perf_counter()
+        data = transport.send(body, content_type, accept)
+        return index, data, time.perf_counter() - start
+
+    def collect(done):
+        for future in done:
+            index, data, latency = future.result()
+            latencies.append(latency)
+            if keep_responses:
+                responses[index] = data
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = concurrency) as pool:
+        in_flight = set()
+        for index, (n_rows, body) in enumerate(batches):
+            if len(in_flight) >= 2 * concurrency:
+                done, in_flight = wait(in_flight, return_when = FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(pool.submit(send, index, body))
+            rows += n_rows
+        collect(wait(in_flight)[0])
+    report = percentile_report(latencies, rows, len(latencies), time.perf_counter() - start)
+    if keep_responses:
+        return report, [responses[i] for i in sorted(responses)]
+    return report
+
+
+# ------------------------------------ Local stand-in
+# /invocations served in-process by rf_script's model_fn and handlers
+class LocalEndpoint:
+    def __init__(self, model_dir, host = "127.0.0.1", port = 0):
+        model = rf_script.model_fn(model_dir)
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self.reply(200, b"", "text/plain")
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    data = rf_script.input_fn(body, self.headers.get("Content-Type"))
+                    output, content_type = rf_script.output_fn(rf_script.predict_fn(data, model),
+                                                                self.headers.get("Accept", JSON_CONTENT_TYPE))
+                    self.reply(200, output.encode(), content_type)
+                except ValueError as e:
+                    self.reply(415, str(e).encode(), "text/plain")
+
+            def reply(self, status, payload, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target = self.server.serve_forever, daemon = True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/invocations"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def print_report(report):
+    print(f"{report['requests']} requests, {report['rows']} rows in {report['seconds']:.2f}s "
+          f"-- {report['rows_per_sec']:.0f} rows/s, latency p50 {report['p50_ms']:.1f} ms, "
+          f"p95 {report['p95_ms']:.1f} ms, p99 {report['p99_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", type = str, default = "datasets/PdM_inference_data.csv")
+    parser.add_argument("--batch-size", type = int, default = 64)
+    parser.add_argument("--concurrency", type = int, default = 8)
+    parser.add_argument("--endpoint-name", type = str)
+    parser.add_argument("--url", type = str)
+    parser.add_argument("--local-model-dir", type = str)
+    parser.add_argument("--region", type = str, default = "us-east-1")
+    args = parser.parse_args()
+
+    batches = read_batches(args.data, args.batch_size)
+    if args.local_model_dir:
+        with LocalEndpoint(args.local_model_dir) as endpoint:
+            print_report(run_batches(batches, HttpTransport(endpoint.url), args.concurrency))
+    elif args.url:
+        print_report(run_batches(batches, HttpTransport(args.url), args.concurrency))
+    else:
+        transport = SageMakerTransport(args.endpoint_name, max_pool_connections = args.concurrency,
+                                       region_name = args.region)
+        print_report(run_batches(batches, transport, args.concurrency))
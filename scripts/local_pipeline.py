@@ -0,0 +1,358 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import time
+
+import pandas as pd
+
+from profiler import child_env, profile_stage
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+RAW_TABLES = ['telemetry', 'errors', 'maint', 'failures', 'machines']
+
+DEFAULT_ARTIFACT_DIR = os.path.join(SCRIPTS_DIR, "..", ".pipeline-cache")
+# 0 keeps every cached output
+DEFAULT_MAX_CACHE_BYTES = 5 * 2**30
+MANIFEST = "_manifest.json"
+HASH_BLOCK = 2**20
+
+
+# ------------------------------------ Fingerprints
+def file_digest(path, digest = None):
+    digest = digest or hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest
+
+
+# Content hash of a directory: every file's relative path and bytes, in sorted order
+def directory_digest(path, skip = (MANIFEST,)):
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name in skip:
+                continue
+            full = os.path.join(root, name)
+            digest.update(os.path.relpath(full, path).encode() + b"\0")
+            file_digest(full, digest)
+    return digest.hexdigest()
+
+
+# The script and every module of scripts/ it imports, transitively
+def local_sources(script, seen = None):
+    seen = set() if seen is None else seen
+    path = os.path.join(SCRIPTS_DIR, script)
+    if script in seen or not os.path.exists(path):
+        return seen
+    seen.add(script)
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename = path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            local_sources(name.split(".")[0] + ".py", seen)
+    return seen
+
+
+def source_digest(scripts):
+    digest = hashlib.sha256()
+    for script in sorted(set().union(*(local_sources(s) for s in scripts))):
+        digest.update(script.encode() + b"\0")
+        file_digest(os.path.join(SCRIPTS_DIR, script), digest)
+    return digest.hexdigest()
+
+
+# Stage key: stage name, parameters, source code and the content hash of every input
+def stage_key(name, params, sources, input_digests):
+    payload = json.dumps({"stage": name, "params": params, "sources": sources, "inputs": input_digests},
+                         sort_keys = True, default = str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+
+# ------------------------------------ Artifact store
+# One directory per (stage, key) holding the stage outputs and a manifest; completed entries are moved
+# into place atomically, so an interrupted stage never leaves a half-written cache hit behind
+class ArtifactStore:
+    def __init__(self, root = DEFAULT_ARTIFACT_DIR, max_bytes = DEFAULT_MAX_CACHE_BYTES):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok = True)
+
+    def path(self, stage, key):
+        return os.path.join(self.root, stage, key)
+
+    def lookup(self, stage, key):
+        manifest_path = os.path.join(self.path(stage, key), MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        manifest["last_used"] = time.time()
+        self.write_manifest(self.path(stage, key), manifest)
+        return manifest
+
+    def write_manifest(self, path, manifest):
+        with open(os.path.join(path, MANIFEST + ".tmp"), "w") as f:
+            json.dump(manifest, f, indent = 2)
+        os.replace(os.path.join(path, MANIFEST + ".tmp"), os.path.join(path, MANIFEST))
+
+    def staging(self, stage, key):
+        path = self.path(stage, key) + f".tmp-{os.getpid()}"
+        shutil.rmtree(path, ignore_errors = True)
+        os.makedirs(path)
+        return path
+
+    def commit(self, stage, key, staging, manifest):
+        final = self.path(stage, key)
+        manifest["output_digest"] = directory_digest(staging)
+        manifest["bytes"] = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(staging)
+                                for f in files)
+        manifest["created"] = manifest["last_used"] = time.time()
+        self.write_manifest(staging, manifest)
+        shutil.rmtree(final, ignore_errors = True)
+        os.replace(staging, final)
+        return manifest
+
+    def entries(self):
+        for stage in sorted(os.listdir(self.root)):
+            stage_dir = os.path.join(self.root, stage)
+            if not os.path.isdir(stage_dir):
+                continue
+            for key in os.listdir(stage_dir):
+                manifest_path = os.path.join(stage_dir, key, MANIFEST)
+                if os.path.exists(manifest_path):
+                    with open(manifest_path) as f:
+                        yield json.load(f)
+
+    # Least recently used entries go first until the store fits max_bytes; entries of this run are kept
+    def evict(self, keep = ()):
+        if not self.max_bytes:
+            return []
+        entries = sorted(self.entries(), key = lambda m: m["last_used"])
+        total = sum(m["bytes"] for m in entries)
+        evicted = []
+        for manifest in entries:
+            if total <= self.max_bytes:
+                break
+            if (manifest["stage"], manifest["key"]) in keep:
+                continue
+            shutil.rmtree(self.path(manifest["stage"], manifest["key"]), ignore_errors = True)
+            total -= manifest["bytes"]
+            evicted.append(f"{manifest['stage']}/{manifest['key']}")
+        return evicted
+
+
+# ------------------------------------ Stages
+# Each stage reads its input directories and writes everything it produces under out_dir
+def run_preprocess(inputs, params, out_dir):
+    import preprocessing
+    from storage import TableStore
+    raw = {name: pd.read_csv(os.path.join(inputs['raw'], f"PdM_{name}.csv")) for name in RAW_TABLES}
+    store = TableStore(os.path.join(out_dir, "preprocessed"), format = params.get("data_format", "parquet"))
+    upload = store.write
+    if params.get("workers", 1) > 1:
+        preprocessing.sharded_features(raw['telemetry'], raw['errors'], raw['maint'], raw['failures'], raw['machines'],
+                                       params["workers"], upload = upload)
+        return
+    telemetry_df = preprocessing.telemetry_features(raw['telemetry'], upload = upload)
+    errors_df = preprocessing.errors_lag_features(raw['errors'], raw['telemetry'], upload = upload)
+    maint_df = preprocessing.maintenance_features(raw['maint'], raw['telemetry'], upload = upload)
+    failures_df = preprocessing.failure_features(raw['failures'], upload = upload)
+    machines_df = preprocessing.machine_features(raw['machines'])
+    preprocessing.label_construct(telemetry_df, errors_df, maint_df, machines_df, failures_df, upload = upload)
+
+
+# Feature groups ingested into the local Feature Store stand-in; the online records are kept as JSON
+def run_featurestore(inputs, params, out_dir):
+    from feature_ingest import FeatureStoreIngester, IngestCheckpoint, LocalFeatureStoreClient, feature_store_types
+    from storage import LocalS3Client, TableStore
+    store = TableStore(os.path.join(inputs['preprocess'], "preprocessed"), format = params.get("data_format", "parquet"))
+    groups = {'telemetry_fg': "telemetry", 'errors_fg': "errors", 'maintenance_fg': "maint",
+              'failures_fg': "failures", 'machines_fg': "machines"}
+    client = LocalFeatureStoreClient(creating_polls = 0)
+    checkpoint = IngestCheckpoint(LocalS3Client(os.path.join(out_dir, "s3")), "local", "checkpoint.json")
+    ingester = FeatureStoreIngester(client, client, checkpoint, max_workers = params.get("workers", 8), poll_interval = 0.01)
+    ingester.run({group: feature_store_types(store.read(table)) for group, table in groups.items()},
+                 "machineID", "event_time", "s3://local/offline", "local-role")
+    with open(os.path.join(out_dir, "online_store.json"), "w") as f:
+        json.dump(client.online, f, sort_keys = True)
+
+
+def run_split(inputs, params, out_dir):
+    from feature_schema import apply_schema
+    from storage import TableStore
+    from train_test_split_data import train_test_split_script
+    for name in ("train", "test"):
+        os.makedirs(os.path.join(out_dir, name))
+    store = TableStore(os.path.join(inputs['preprocess'], "preprocessed"), format = params.get("data_format", "parquet"))
+    train_test_split_script(apply_schema(store.read("preprocessed")), out_dir)
+
+
+# rf_script.py as the training job runs it; params are passed as its command line flags
+def run_train(inputs, params, out_dir):
+    model_dir = os.path.join(out_dir, "model")
+    os.makedirs(model_dir)
+    command = [sys.executable, os.path.join(SCRIPTS_DIR, "rf_script.py"), "--model-dir", model_dir,
+               "--train-data", os.path.join(inputs['split'], "train"),
+               "--test-data", os.path.join(inputs['split'], "test")]
+    for name, value in sorted(params.items()):
+        flag = "--" + name.replace("_", "-")
+        if value is True:
+            command.append(flag)
+        elif value not in (False, None):
+            command += [flag, value if isinstance(value, str) else json.dumps(value)]
+    # the training job's stages go into this run's trace
+    subprocess.run(command, check = True, cwd = SCRIPTS_DIR, stdout = sys.stdout, env = child_env())
+
+
+# The model.tar.gz deploy_model.py would hand to SKLearnModel, smoke tested through the serving handlers
+def run_deploy(inputs, params, out_dir):
+    import numpy as np
+    import rf_script
+    model_dir = os.path.join(inputs['train'], "model")
+    with tarfile.open(os.path.join(out_dir, "model.tar.gz"), "w:gz") as tar:
+        for name in sorted(os.listdir(model_dir)):
+            tar.add(os.path.join(model_dir, name), arcname = name)
+
+    test = pd.read_csv(os.path.join(inputs['split'], "test", "test.csv"), nrows = params.get("smoke_rows", 100))
+    payload = test.drop(columns = ["failure"]).to_csv(index = False, header = False)
+    model = rf_script.model_fn(model_dir)
+    prediction = rf_script.predict_fn(rf_script.input_fn(payload, "text/csv"), model)
+    body, content_type = rf_script.output_fn(prediction, "application/json")
+    smoke = {"rows": len(test), "content_type": content_type,
+             "accuracy": float(np.mean(prediction["predictions"] == test["failure"].to_numpy()))}
+    with open(os.path.join(out_dir, "smoke_test.json"), "w") as f:
+        json.dump(smoke, f, indent = 2)
+
+
+# name -> (function, upstream stages, entry scripts whose sources are fingerprinted)
+STAGES = {
+    'preprocess': (run_preprocess, [], ['preprocessing.py']),
+    'featurestore': (run_featurestore, ['preprocess'], ['feature_ingest.py']),
+    'split': (run_split, ['preprocess'], ['train_test_split_data.py']),
+    'train': (run_train, ['split'], ['rf_script.py']),
+    'deploy': (run_deploy, ['train', 'split'], ['rf_script.py']),
+}
+STAGE_ORDER = ['preprocess', 'featurestore', 'split', 'train', 'deploy']
+# the feature store stage puts every record through the local fake one by one, so it only runs when asked for
+DEFAULT_STAGES = ['preprocess', 'split', 'train', 'deploy']
+
+
+# The raw CSVs of every table; missing ones are reported up front instead of failing inside a stage
+def raw_paths(raw_dir):
+    paths = {name: os.path.join(raw_dir, f"PdM_{name}.csv") for name in RAW_TABLES}
+    missing = [os.path.basename(path) for path in paths.values() if not os.path.isfile(path)]
+    if missing:
+        raise FileNotFoundError(f"Raw data directory {raw_dir} is missing {', '.join(missing)}. "
+                                f"benchmarks/synthetic_pdm.py --out-dir DIR writes a synthetic set of all "
+                                f"{len(RAW_TABLES)} tables")
+    return paths
+
+
+def raw_digest(raw_dir):
+    digest = hashlib.sha256()
+    for path in raw_paths(raw_dir).values():
+        file_digest(path, digest)
+    return digest.hexdigest()
+
+
+# Run the stages in order (with the upstream stages they need); a stage whose key is already in the store
+# is skipped and its stored outputs are used downstream. Returns {stage: (status, seconds, output path)}.
+# raw_dir holds PdM_<table>.csv for every table of RAW_TABLES.
+def run_pipeline(raw_dir, stages = DEFAULT_STAGES, params = None, force = (), store = None):
+    params = params or {}
+    store = store or ArtifactStore()
+    needed = set()
+    for stage in stages:
+        pending = [stage]
+        while pending:
+            name = pending.pop()
+            if name not in needed:
+                needed.add(name)
+                pending += STAGES[name][1]
+    unknown = set(force) - set(STAGE_ORDER)
+    if unknown:
+        raise ValueError(f"Unknown stage(s) {sorted(unknown)}, expected some of {STAGE_ORDER}")
+
+    outputs, digests, results, used = {}, {'raw': raw_digest(raw_dir)}, {}, set()
+    for name in [stage for stage in STAGE_ORDER if stage in needed]:
+        function, upstream, scripts = STAGES[name]
+        stage_params = params.get(name, {})
+        input_digests = {up: digests[up] for up in upstream} if upstream else {'raw': digests['raw']}
+        key = stage_key(name, stage_params, source_digest(scripts), input_digests)
+        inputs = {up: outputs[up] for up in upstream} if upstream else {'raw': raw_dir}
+
+        began = time.perf_counter()
+        manifest = None if name in force else store.lookup(name, key)
+        status = "cache hit"
+        if manifest is None:
+            status = "forced" if name in force else "ran"
+            print(f"===== {name}: running (key {key})")
+            staging = store.staging(name, key)
+            try:
+                with profile_stage(f"pipeline.{name}", key = key):
+                    function(inputs, stage_params, staging)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors = True)
+                raise
+            manifest = store.commit(name, key, staging, {"stage": name, "key": key, "params": stage_params,
+                                                         "inputs": input_digests})
+        outputs[name] = store.path(name, key)
+        digests[name] = manifest["output_digest"]
+        used.add((name, key))
+        results[name] = (status, time.perf_counter() - began, outputs[name])
+        print(f"===== {name}: {status} in {results[name][1]:.1f}s -> {outputs[name]}")
+
+    for entry in store.evict(keep = used):
+        print(f"Evicted {entry}")
+    return results
+
+
+# --set train.n_estimators=50: the value is parsed as JSON when it can be, kept as a string otherwise
+def parse_params(assignments):
+    params = {}
+    for assignment in assignments:
+        target, _, value = assignment.partition("=")
+        stage, _, name = target.partition(".")
+        if stage not in STAGES or not name:
+            raise ValueError(f"Expected STAGE.NAME=VALUE with a stage of {STAGE_ORDER}, got {assignment!r}")
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        params.setdefault(stage, {})[name] = value
+    return params
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", nargs = "+", default = DEFAULT_STAGES, choices = STAGE_ORDER)
+    parser.add_argument("--force", nargs = "+", default = [], choices = STAGE_ORDER)
+    parser.add_argument("--set", dest = "params", action = "append", default = [])
+    # datasets/ does not ship the telemetry, see benchmarks/synthetic_pdm.py for a generated set
+    parser.add_argument("--raw-dir", type = str, required = True)
+    parser.add_argument("--artifact-dir", type = str, default = DEFAULT_ARTIFACT_DIR)
+    parser.add_argument("--max-cache-bytes", type = int, default = DEFAULT_MAX_CACHE_BYTES)
+    args = parser.parse_args()
+    try:
+        raw_paths(args.raw_dir)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+
+    results = run_pipeline(args.raw_dir, args.stages, parse_params(args.params), args.force,
+                           ArtifactStore(args.artifact_dir, args.max_cache_bytes))
+    for name, (status, seconds, path) in results.items():
+        print(f"{name:12s} {status:9s} {seconds:7.1f}s  {path}")
@@ -0,0 +1,115 @@
+import itertools
+import json
+import math
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score
+
+# Hyperparameters tried when --search-space is not given
+DEFAULT_SEARCH_SPACE = {
+    "n_estimators": [50, 100, 200],
+    "min_samples_leaf": [1, 3, 10],
+    "max_features": ["sqrt", 0.5],
+    "max_depth": [None, 20],
+}
+# successive halving keeps the best 1 / HALVING_FACTOR configurations after every rung
+HALVING_FACTOR = 3
+# smallest share of each fold's training rows a configuration is first evaluated on
+MIN_TRAIN_FRACTION = 0.05
+
+
+# Every combination of the space, or `samples` of them drawn without replacement
+def search_configurations(space, samples = None, seed = 0):
+    names = sorted(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    if samples is not None and samples < len(grid):
+        picks = np.random.default_rng(seed).choice(len(grid), size = samples, replace = False)
+        grid = [grid[i] for i in sorted(picks)]
+    return grid
+
+
+# ------------------------------------ Shared training matrix
+# The matrix and label codes are saved once as .npy files; every worker maps them read-only, so the
+# pool holds one copy of the data in the page cache instead of one pickled copy per task
+_shared = {}
+
+
+def share_arrays(features, labels, directory):
+    paths = {"X": os.path.join(directory, "X.npy"), "y": os.path.join(directory, "y.npy")}
+    np.save(paths["X"], np.ascontiguousarray(features, dtype = np.float32))
+    np.save(paths["y"], np.asarray(labels, dtype = np.int16))
+    return paths
+
+
+def attach_arrays(paths):
+    _shared.update({name: np.load(path, mmap_mode = "r") for name, path in paths.items()})
+
+
+# Train one configuration on the most recent `fraction` of a fold's training rows and score its test rows
+def evaluate(config, fold, fraction, seed):
+    X, y = _shared["X"], _shared["y"]
+    train_end, test_start = fold["train_end"], fold["test_start"]
+    start = train_end - max(1, int(round(train_end * fraction)))
+    began = time.perf_counter()
+    model = RandomForestClassifier(**config, n_jobs = 1, random_state = seed)
+    model.fit(X[start:train_end], y[start:train_end])
+    y_test = y[test_start:]
+    predictions = model.predict(X[test_start:])
+    return {
+        "f1_macro": float(f1_score(y_test, predictions, average = "macro", labels = np.unique(y_test),
+                                   zero_division = 0)),
+        "accuracy": float(accuracy_score(y_test, predictions)),
+        "fit_seconds": time.perf_counter() - began,
+    }
+
+
+# Successive halving over the walk-forward folds: every rung trains the surviving configurations on all
+# folds with HALVING_FACTOR times more training rows than the last rung, ranks them by mean macro F1
+# and keeps the best 1 / HALVING_FACTOR. Returns the leaderboard, best first.
+def successive_halving(features, labels, folds, configurations, workers = None, halving_factor = HALVING_FACTOR,
+                       min_fraction = MIN_TRAIN_FRACTION, seed = 0):
+    workers = workers or os.cpu_count()
+    n_rungs = 1
+    if halving_factor > 1 and len(configurations) > 1:
+        n_rungs = 1 + math.ceil(math.log(len(configurations), halving_factor))
+    board = [{"config": config, "rung": -1} for config in configurations]
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            ProcessPoolExecutor(max_workers = workers, initializer = attach_arrays,
+                                initargs = (share_arrays(features, labels, tmp),)) as pool:
+        survivors = list(range(len(configurations)))
+        for rung in range(n_rungs):
+            fraction = max(min_fraction, float(halving_factor) ** (rung - n_rungs + 1))
+            began = time.perf_counter()
+            tasks = {(i, f): pool.submit(evaluate, configurations[i], fold, fraction, seed)
+                     for i in survivors for f, fold in enumerate(folds)}
+            for i in survivors:
+                scores = [tasks[(i, f)].result() for f in range(len(folds))]
+                board[i].update({
+                    "rung": rung,
+                    "train_fraction": fraction,
+                    "f1_macro": float(np.mean([s["f1_macro"] for s in scores])),
+                    "accuracy": float(np.mean([s["accuracy"] for s in scores])),
+                    "fold_f1_macro": [s["f1_macro"] for s in scores],
+                    "fit_seconds": float(sum(s["fit_seconds"] for s in scores)),
+                })
+            survivors.sort(key = lambda i: -board[i]["f1_macro"])
+            print(f"Search rung {rung}: {len(survivors)} configurations x {len(folds)} folds on "
+                  f"{fraction:.0%} of the training rows in {time.perf_counter() - began:.1f}s, "
+                  f"best mean macro F1 {board[survivors[0]]['f1_macro']:.4f}")
+            if rung < n_rungs - 1:
+                survivors = survivors[:max(1, math.ceil(len(survivors) / halving_factor))]
+
+    # later rungs first (they saw more data), then by score
+    return sorted(board, key = lambda row: (-row["rung"], -row.get("f1_macro", -1.0)))
+
+
+def write_leaderboard(leaderboard, path):
+    with open(path, "w") as f:
+        json.dump(leaderboard, f, indent = 2)
+    return path
@@ -1,28 +1,51 @@
+import argparse
+import functools
+import json
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
 import numpy as np
 import pandas as pd
-import boto3
-from io import StringIO
 import awswrangler as wr
 
+import aws_clients
+from feature_engine import (BIN_FREQ, LONG_WINDOW, TelemetryWindowStream, days_since_events, event_window_counts,
+                            resample_origin, telemetry_window_features)
+from feature_schema import FAILURE_CLASSES, MACHINE_MODELS, apply_schema
+from profiler import current_run, join_run, stage
+from storage import TableStore, read_csv_object, upload_csv_multipart
+
 base_dir = "/opt/ml/processing"
 bucket = "ideaaiml-demo"
 prefix = "mlops/predictive-maintenance"
 
-def upload_file_s3(df, name):
-    boto3.setup_default_session(region_name = "us-east-1")
-    s3_client = boto3.client("s3", region_name = "us-east-1")
-    with StringIO() as csv_buffer:
-        df.to_csv(csv_buffer, index = False)
+ERROR_IDS = ['error1', 'error2', 'error3', 'error4', 'error5']
+COMPONENTS = ['comp1', 'comp2', 'comp3', 'comp4']
+# machines per shard in sharded mode; the 100 machine fleet splits into 4 shards
+MACHINES_PER_SHARD = 25
+
+# Typed intermediate tables read back by featurestore.py and train_test_split_data.py
+preprocessed_store = TableStore(f"s3://{bucket}/{prefix}/data/preprocessed")
+
+# part is set when a table is written chunk by chunk (streaming mode), which needs parquet or arrow
+@stage()
+def upload_file_s3(df, name, part = None):
+    if preprocessed_store.format != "csv" or part is not None:
+        uri = preprocessed_store.write(df, name, part = part)
+        print(f"Written {preprocessed_store.format} table {uri}" + ("" if part is None else f" part {part}"))
+        return
 
-        response = s3_client.put_object(
-            Bucket = bucket, Key = f"{prefix}/data/preprocessed/{name}.csv", Body = csv_buffer.getvalue()
-        )
-        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    # the shared client: no new session, credential lookup or TLS handshake per upload
+    s3_client = aws_clients.s3_client()
+    # streamed in row batches as multipart parts, the full CSV is never held in memory
+    response = upload_csv_multipart(df, s3_client, bucket, f"{prefix}/data/preprocessed/{name}.csv")
+    status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
 
-        if status == 200:
-            print(f"Successful S3 put_object response. Status - {status}")
-        else:
-            print(f"Unsuccessful S3 put_object response. Status - {status}")
+    if status == 200:
+        print(f"Successful S3 upload response. Status - {status}")
+    else:
+        print(f"Unsuccessful S3 upload response. Status - {status}")
 
 # Convert to datetime datatype
 def datetime_datatype(df):
@@ -32,159 +55,83 @@ def datetime_datatype(df):
 
 
 # Convert to category datatype
-def category_datatype(df, column_name):
+def category_datatype(df, column_name, categories = None):
     print("Converting to type category")
-    df[column_name] = df[column_name].astype('category')
+    if categories is None:
+        df[column_name] = df[column_name].astype('category')
+    else:
+        df[column_name] = pd.Categorical(df[column_name], categories = categories)
     return df
 
 
 # Lag Features from Telemetry
-def telemetry_features(df):
+@stage()
+def telemetry_features(df, upload = upload_file_s3, origin = None):
     df = datetime_datatype(df)
-    # Calculate mean values for telemetry features -- 3 hours rolling window
-    print("Calculate mean values for telemetry features -- 3 hours rolling window")
-    temp = []
-    fields = ['volt', 'rotate', 'pressure', 'vibration']
-    for col in fields:
-        temp.append(pd.pivot_table(df,
-                                   index = 'datetime',
-                                   columns = 'machineID',
-                                   values = col).resample('3H', closed = 'left', label = 'right').mean().unstack())
-    telemetry_mean_3h = pd.concat(temp, axis = 1)
-    telemetry_mean_3h.columns = [i + 'mean_3h' for i in fields]
-    telemetry_mean_3h.reset_index(inplace = True)
-
-    # repeat for standard deviation
-    print("Calculate standard deviation for telemetry features -- 3 hours rolling window")
-    temp = []
-    for col in fields:
-        temp.append(pd.pivot_table(df,
-                                   index = 'datetime',
-                                   columns = 'machineID',
-                                   values = col).resample('3H', closed = 'left', label = 'right').std().unstack())
-    telemetry_sd_3h = pd.concat(temp, axis = 1)
-    telemetry_sd_3h.columns = [i + 'sd_3h' for i in fields]
-    telemetry_sd_3h.reset_index(inplace = True)
-    
-    # Calculate mean values for telemetry features -- 24 hours rolling window
-    print("Calculate mean values for telemetry features -- 24 hours rolling window")
-    temp = []
-    fields = ['volt', 'rotate', 'pressure', 'vibration']
-    for col in fields:
-        temp.append(pd.pivot_table(df,
-                                   index = 'datetime',
-                                   columns = 'machineID',
-                                   values = col)
-                    .resample('3H', closed = 'left', label = 'right')
-                    .first()
-                    .unstack()
-                    .rolling(window = 24, center = False).mean())
-    telemetry_mean_24h = pd.concat(temp, axis = 1)
-    telemetry_mean_24h.columns = [i + 'mean_24h' for i in fields]
-    telemetry_mean_24h.reset_index(inplace = True)
-    telemetry_mean_24h = telemetry_mean_24h.loc[-telemetry_mean_24h['voltmean_24h'].isnull()]
-
-    # repeat for standard deviation
-    print("Calculate standard deviation for telemetry features -- 24 hours rolling window")
-    temp = []
-    fields = ['volt', 'rotate', 'pressure', 'vibration']
-    for col in fields:
-        temp.append(pd.pivot_table(df,
-                                   index = 'datetime',
-                                   columns = 'machineID',
-                                   values = col)
-                    .resample('3H', closed='left', label='right')
-                    .first()
-                    .unstack()
-                    .rolling(window = 24, center = False).std())
-    telemetry_sd_24h = pd.concat(temp, axis = 1)
-    telemetry_sd_24h.columns = [i + 'sd_24h' for i in fields]
-    telemetry_sd_24h = telemetry_sd_24h.loc[-telemetry_sd_24h['voltsd_24h'].isnull()]
-    telemetry_sd_24h.reset_index(inplace = True)
-    
-    telemetry_feat = pd.concat([telemetry_mean_3h,
-                            telemetry_sd_3h.iloc[:, 2:6],
-                            telemetry_mean_24h.iloc[:, 2:6],
-                            telemetry_sd_24h.iloc[:, 2:6]], axis = 1).dropna()
+    # 3 hours mean/sd and 24 x 3 hours rolling mean/sd, all computed in one pass per machine
+    print("Calculate mean and standard deviation for telemetry features -- 3 and 24 hours rolling windows")
+    telemetry_feat = apply_schema(telemetry_window_features(df, origin = origin))
 
-    upload_file_s3(telemetry_feat, "telemetry")
+    if upload:
+        upload(telemetry_feat, "telemetry")
     
     return telemetry_feat
 
 
 # Lag Features for Errors
-def errors_lag_features(df):
+@stage()
+def errors_lag_features(df, telemetry_df, upload = upload_file_s3):
     df = datetime_datatype(df)
-    df = category_datatype(df, 'errorID')
     print("Lag features for errors")
-    error_count = pd.get_dummies(df.set_index('datetime')).reset_index()
-    error_count.columns = ['datetime', 'machineID', 'error1', 'error2', 'error3', 'error4', 'error5']
-    error_count = error_count.groupby(['machineID', 'datetime']).sum().reset_index()
-    error_count = telemetry[['datetime', 'machineID']].merge(error_count, on = ['machineID', 'datetime'], how = 'left').fillna(0.0)
-    temp = []
-    fields = ['error%d' % i for i in range(1, 6)]
-    for col in fields:
-        temp.append(pd.pivot_table(error_count,
-                                   index = 'datetime',
-                                   columns = 'machineID',
-                                   values = col)
-                    .resample('3H', closed='left', label='right')
-                    .first()
-                    .unstack()
-                    .rolling(window = 24, center = False).sum())
-    error_count = pd.concat(temp, axis = 1)
-    error_count.columns = [i + 'count' for i in fields]
-    error_count.reset_index(inplace = True)
-    error_count = error_count.dropna()
+    # errors at the first telemetry reading of each 3 hours bin, summed over 24 x 3 hours bins, looked up
+    # from the sorted error times of each machine
+    error_count = event_window_counts(df, 'errorID', ERROR_IDS, telemetry_df[['datetime', 'machineID']])
+    error_count.columns = ['machineID', 'datetime'] + [i + 'count' for i in ERROR_IDS]
+    error_count = apply_schema(error_count)
     
-    upload_file_s3(error_count, "errors")
+    if upload:
+        upload(error_count, "errors")
     
     return error_count
 
 
 # Maintenance Features
-def maintenance_features(df):
+@stage()
+def maintenance_features(df, telemetry_df, upload = upload_file_s3):
     df = datetime_datatype(df)
-    df = category_datatype(df, 'comp')
     print("Maintenance Features -- Days since last replacement")
-    comp_rep = pd.get_dummies(df.set_index('datetime')).reset_index()
-    comp_rep.columns = ['datetime', 'machineID', 'comp1', 'comp2', 'comp3', 'comp4']
-
-    # combine repairs for a given machine in a given hour
-    comp_rep = comp_rep.groupby(['machineID', 'datetime']).sum().reset_index()
-
-    # add timepoints where no components were replaced
-    comp_rep = telemetry[['datetime', 'machineID']].merge(comp_rep,
-                                                          on=['datetime', 'machineID'],
-                                                          how='outer').fillna(0).sort_values(by=['machineID', 'datetime'])
-    components = ['comp1', 'comp2', 'comp3', 'comp4']
-    for comp in components:
-        comp_rep.loc[comp_rep[comp] < 1, comp] = None
-        comp_rep.loc[-comp_rep[comp].isnull(),
-                     comp] = comp_rep.loc[-comp_rep[comp].isnull(), 'datetime']
-        comp_rep[comp] = comp_rep[comp].fillna(method = 'ffill')
-
-    comp_rep = comp_rep.loc[comp_rep['datetime'] > pd.to_datetime('2015-01-01')]
-    for comp in components:
-        comp_rep[comp] = (comp_rep["datetime"] - pd.to_datetime(comp_rep[comp])) / np.timedelta64(1, "D")
+    # days since the last replacement of each component at every telemetry and maintenance timepoint
+    comp_rep = days_since_events(df, 'comp', COMPONENTS, telemetry_df[['datetime', 'machineID']])
+    comp_rep = comp_rep.loc[comp_rep['datetime'] > pd.to_datetime('2015-01-01')].reset_index(drop = True)
+    comp_rep = apply_schema(comp_rep)
         
-    upload_file_s3(comp_rep, "maint")
+    if upload:
+        upload(comp_rep, "maint")
     
     return comp_rep
 
 
 # Failures Features
-def failure_features(df):
+@stage()
+def failure_features(df, upload = upload_file_s3):
     print("Failure features")
     df = datetime_datatype(df)
-    df = category_datatype(df, 'failure')
-    upload_file_s3(df, "failures")
+    df = apply_schema(category_datatype(df, 'failure', FAILURE_CLASSES))
+    if upload:
+        upload(df, "failures")
     return df
 
 
+# Machine Features -- model as a categorical, age as a small integer
+def machine_features(df):
+    return apply_schema(category_datatype(df, 'model', MACHINE_MODELS))
+
+
 # Final Features
-def final_features(telemetry_df, errors_df, maint_df, machines_df):
-    upload_file_s3(machines_df, "machines")
+@stage()
+def final_features(telemetry_df, errors_df, maint_df, machines_df, upload = upload_file_s3):
+    if upload:
+        upload(machines_df, "machines")
     print("Final features")
     final_feat = telemetry_df.merge(errors_df, on = ['datetime', 'machineID'], how = 'left')
     final_feat = final_feat.merge(maint_df, on = ['datetime', 'machineID'], how = 'left')
@@ -193,41 +140,371 @@ def final_features(telemetry_df, errors_df, maint_df, machines_df):
 
 
 # Label Construction
-def label_construct(tele_df, error_df, maint_df, machine_df, failure_df):
+@stage()
+def label_construct(tele_df, error_df, maint_df, machine_df, failure_df, upload = upload_file_s3):
     print("----- Final Features -----")
-    final_feat = final_features(tele_df, error_df, maint_df, machine_df)
+    final_feat = final_features(tele_df, error_df, maint_df, machine_df, upload)
     
     print("----- Label Construction -----")
     labeled_features = pd.DataFrame()
     labeled_features = final_feat.merge(
         failure_df, on = ['datetime', 'machineID'], how = 'left')
-    labeled_features['failure'] = labeled_features['failure'].astype(str)
-    labeled_features['failure'] = labeled_features['failure'].fillna(method = 'bfill', limit = 7)
-    labeled_features['failure'] = labeled_features['failure'].replace('nan', 'none')
+    # rows without a failure are labeled 'none' (the bfill of the former string column never filled
+    # anything, the missing values were already 'nan' strings by then)
+    labeled_features['failure'] = pd.Categorical(labeled_features['failure'], categories = FAILURE_CLASSES).fillna('none')
+    # the left merges turn integer columns with unmatched rows into float64
+    labeled_features = apply_schema(labeled_features)
     print("----- Preprocessing completed -----")
     
-    upload_file_s3(labeled_features, "preprocessed")
+    if upload:
+        upload(labeled_features, "preprocessed")
 #     pd.DataFrame(labeled_features).to_csv(f"{base_dir}/preprocessed/final_data.csv", index = False)
+    return labeled_features
+
+
+# ------------------------------------ Incremental mode
+# Raw rows carried between runs: the trailing 24 x 3h window of telemetry and errors,
+# the last replacement of every machine/component, and events not yet reached by telemetry
+STATE_FRAMES = ['telemetry', 'errors', 'maint', 'failures']
+
+
+def load_window_state(state_dir):
+    meta_path = os.path.join(state_dir, "state.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    state = {name: pd.read_pickle(os.path.join(state_dir, f"{name}.pkl")) for name in STATE_FRAMES}
+    state['origin'] = meta['origin']
+    state['watermark'] = pd.Timestamp(meta['watermark'])
+    return state
+
+
+def save_window_state(state_dir, state):
+    os.makedirs(state_dir, exist_ok = True)
+    for name in STATE_FRAMES:
+        state[name].to_pickle(os.path.join(state_dir, f"{name}.pkl"))
+    # state.json is written last so an interrupted save keeps the previous watermark
+    meta_path = os.path.join(state_dir, "state.json")
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump({'origin': int(state['origin']), 'watermark': str(state['watermark'])}, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def rows_after(df, watermark):
+    if watermark is None:
+        return df
+    return df.loc[df['datetime'] > watermark]
+
+
+def rows_between(df, start, end):
+    df = rows_after(df, start)
+    if end is not None:
+        df = df.loc[df['datetime'] <= end]
+    return df.reset_index(drop = True)
+
+
+# Only featurize rows newer than the stored watermark, using the carried window state
+@stage()
+def incremental_features(telemetry, errors, maint, failures, machines, state_dir, upload = upload_file_s3):
+    for df in (telemetry, errors, maint, failures):
+        datetime_datatype(df)
+
+    state = load_window_state(state_dir)
+    if state is None:
+        print("No window state found -- bootstrapping from the full history")
+        origin, watermark = resample_origin(telemetry['datetime']), None
+        state = {'telemetry': telemetry.iloc[:0], 'errors': errors.iloc[:0],
+                 'maint': maint.iloc[:0], 'failures': failures.iloc[:0]}
+    else:
+        origin, watermark = state['origin'], state['watermark']
+        print(f"Window state loaded -- watermark {watermark}")
+
+    new_telemetry = rows_after(telemetry, watermark)
+    if new_telemetry.empty:
+        print("No new telemetry since the last run")
+        return None
+    new_watermark = new_telemetry['datetime'].max()
+    print(f"Incremental run over {len(new_telemetry)} new telemetry rows up to {new_watermark}")
+
+    telemetry_all = pd.concat([state['telemetry'], new_telemetry], ignore_index = True)
+    errors_all = pd.concat([state['errors'], rows_after(errors, watermark)], ignore_index = True)
+    maint_all = pd.concat([state['maint'], rows_after(maint, watermark)], ignore_index = True)
+    failures_all = pd.concat([state['failures'], rows_after(failures, watermark)], ignore_index = True)
+
+    # only 3h bins closed by the new watermark are emitted; the open one waits for the next run
+    telemetry_df = rows_between(telemetry_features(telemetry_all.copy(), upload = None, origin = origin),
+                                watermark, new_watermark)
+    errors_df = rows_between(errors_lag_features(errors_all.copy(), telemetry_all, upload = None),
+                             watermark, new_watermark)
+    maint_df = rows_between(maintenance_features(maint_all.copy(), new_telemetry, upload = None),
+                            watermark, new_watermark)
+    failures_df = rows_between(failure_features(failures_all.copy(), upload = None), watermark, new_watermark)
+    machines_df = machine_features(machines)
+
+    run_upload = None
+    if upload:
+        run_name = f"incremental/{new_watermark:%Y%m%d%H%M}"
+        run_upload = lambda df, name: upload(df, f"{run_name}/{name}")
+        run_upload(telemetry_df, "telemetry")
+        run_upload(errors_df, "errors")
+        run_upload(maint_df, "maint")
+        run_upload(failures_df, "failures")
+    labeled_features = label_construct(telemetry_df, errors_df, maint_df, machines_df, failures_df, run_upload)
+
+    # the next run's first bin needs the 23 bins before it
+    freq = BIN_FREQ.value
+    last_label = origin + (new_watermark.value - origin) // freq * freq
+    cutoff = pd.Timestamp(last_label - (LONG_WINDOW - 1) * freq)
+    replaced = maint_all.loc[maint_all['datetime'] <= new_watermark].sort_values('datetime')
+    save_window_state(state_dir, {
+        'origin': origin,
+        'watermark': new_watermark,
+        'telemetry': telemetry_all.loc[telemetry_all['datetime'] >= cutoff].reset_index(drop = True),
+        'errors': errors_all.loc[errors_all['datetime'] >= cutoff].reset_index(drop = True),
+        'maint': pd.concat([replaced.groupby(['machineID', 'comp'], observed = True).tail(1),
+                            maint_all.loc[maint_all['datetime'] > new_watermark]], ignore_index = True),
+        'failures': failures_all.loc[failures_all['datetime'] > new_watermark].reset_index(drop = True),
+    })
+    return labeled_features
+
+
+# ------------------------------------ Sharded mode
+# Every feature only looks at rows of its own machine, so contiguous machineID ranges are featurized
+# in separate processes and concatenated in range order, which is the order of the serial tables
+def shard_ranges(machine_ids, machines_per_shard = MACHINES_PER_SHARD):
+    ids = np.unique(machine_ids)
+    starts = ids[::machines_per_shard]
+    # ranges cover every ID so rows of machines without telemetry still land in a shard
+    lower = np.concatenate([[np.iinfo(np.int64).min], starts[1:]])
+    upper = np.concatenate([starts[1:], [np.iinfo(np.int64).max]])
+    return list(zip(lower.tolist(), upper.tolist()))
+
+
+# Rows of each [lower, upper) machineID range, located with one stable sort instead of a scan per shard
+def machine_slices(df, ranges):
+    machine_ids = df['machineID'].to_numpy()
+    if not (machine_ids[1:] >= machine_ids[:-1]).all():
+        df = df.iloc[np.argsort(machine_ids, kind = "stable")]
+        machine_ids = df['machineID'].to_numpy()
+    bounds = np.searchsorted(machine_ids, [lower for lower, _ in ranges[1:]])
+    edges = np.concatenate([[0], bounds, [len(df)]])
+    return [df.iloc[edges[i]:edges[i + 1]] for i in range(len(ranges))]
+
+
+# The serial pipeline over one shard; nothing is uploaded from the workers
+def shard_features(telemetry, errors, maint, failures_df, machines_df, origin):
+    telemetry_df = telemetry_features(telemetry, upload = None, origin = origin)
+    errors_df = errors_lag_features(errors, telemetry, upload = None)
+    maint_df = maintenance_features(maint, telemetry, upload = None)
+    labeled_features = label_construct(telemetry_df, errors_df, maint_df, machines_df, failures_df, upload = None)
+    return {'telemetry': telemetry_df, 'errors': errors_df, 'maint': maint_df, 'preprocessed': labeled_features}
+
+
+# At most `workers` shards are in flight, so only that many shard-sized working sets exist at once
+@stage()
+def sharded_features(telemetry, errors, maint, failures, machines, workers,
+                     machines_per_shard = MACHINES_PER_SHARD, upload = upload_file_s3):
+    telemetry = datetime_datatype(telemetry)
+    # one resample origin for every shard, the one the serial run would use
+    origin = resample_origin(telemetry['datetime'])
+    failures_df = failure_features(failures, upload = None)
+    machines_df = machine_features(machines)
+
+    ranges = shard_ranges(telemetry['machineID'], machines_per_shard)
+    print(f"Sharded run: {len(ranges)} shards of {machines_per_shard} machines on {workers} workers")
+    shards = zip(*(machine_slices(df, ranges) for df in (telemetry, errors, maint, failures_df, machines_df)))
+
+    results = {}
+    with ProcessPoolExecutor(max_workers = workers, initializer = join_run, initargs = (current_run(),)) as pool:
+        in_flight = {}
+        for index, frames in enumerate(shards):
+            if len(in_flight) >= workers:
+                done, _ = wait(in_flight, return_when = FIRST_COMPLETED)
+                for future in done:
+                    results[in_flight.pop(future)] = future.result()
+            future = pool.submit(shard_features, *(df.reset_index(drop = True) for df in frames), origin)
+            in_flight[future] = index
+        for future in wait(in_flight)[0]:
+            results[in_flight.pop(future)] = future.result()
+
+    tables = {name: pd.concat([results[i][name] for i in range(len(ranges))], ignore_index = True)
+              for name in ('telemetry', 'errors', 'maint', 'preprocessed')}
+    tables['failures'] = failures_df
+    tables['machines'] = machines_df
+    if upload:
+        for name in ('telemetry', 'errors', 'maint', 'failures', 'machines', 'preprocessed'):
+            upload(tables[name], name)
+    return tables
+
+
+# ------------------------------------ Streaming mode
+# Telemetry is read in time-ordered chunks and every table is written chunk by chunk. The error and
+# maintenance features of a chunk are looked up from the (small) event tables at the readings the telemetry
+# stream holds for it, so memory depends on the chunk size and window length, not on the length of the history.
+@stage()
+def streaming_features(telemetry_chunks, errors, maint, failures, machines, upload = upload_file_s3):
+    errors = datetime_datatype(errors)
+    maint = datetime_datatype(maint)
+    failures_df = failure_features(failures, upload = upload)
+    machines_df = machine_features(machines)
+    if upload:
+        upload(machines_df, "machines")
+
+    stream = TelemetryWindowStream()
+    # part 0 of a table replaces it, so every table counts its own non-empty parts
+    parts = dict.fromkeys(['telemetry', 'errors', 'maint', 'preprocessed'], 0)
+    for telemetry_df, readings, start, end in feature_chunks(telemetry_chunks, stream):
+        errors_df, maint_df = chunk_event_features(errors, maint, readings, stream.origin, start, end)
+        tables = {'telemetry': telemetry_df, 'errors': errors_df, 'maint': maint_df}
+        if len(telemetry_df):
+            tables['preprocessed'] = label_construct(telemetry_df, errors_df, maint_df, machines_df, failures_df,
+                                                     upload = None)
+            print(f"Streaming part {parts['preprocessed']}: {len(telemetry_df)} telemetry feature rows up to "
+                  f"{telemetry_df['datetime'].max()}")
+        for name, df in tables.items():
+            if upload and len(df):
+                upload(df, name, part = parts[name])
+            parts[name] += bool(len(df))
+    return parts['preprocessed']
+
+
+# Feature chunks of every raw chunk that closed bins, then of the bins still open at the end, with the raw
+# readings they were computed from and the (start, end] range of their labels; the last range is open ended
+def feature_chunks(telemetry_chunks, stream):
+    for chunk in telemetry_chunks:
+        start = stream.emitted_label()
+        features = stream.update(datetime_datatype(chunk))
+        if stream.emitted_label() != start:
+            yield apply_schema(features), stream.rows, start, stream.emitted_label()
+    start = stream.emitted_label()
+    features = stream.flush()
+    if stream.rows is not None:
+        yield apply_schema(features), stream.rows, start, None
+
+
+# Error counts and days since replacement for the labels in (start, end], from the readings of their windows.
+# Only errors at those readings can be counted; replacements are looked up over the whole (small) table.
+def chunk_event_features(errors, maint, readings, origin, start, end):
+    keys = readings[['datetime', 'machineID']]
+    first, last = keys['datetime'].min(), keys['datetime'].max()
+    errors = errors.loc[(errors['datetime'] >= first) & (errors['datetime'] <= last)]
+    error_count = event_window_counts(errors, 'errorID', ERROR_IDS, keys, origin = origin)
+    error_count.columns = ['machineID', 'datetime'] + [i + 'count' for i in ERROR_IDS]
+    comp_rep = days_since_events(maint, 'comp', COMPONENTS, keys)
+    comp_rep = comp_rep.loc[comp_rep['datetime'] > pd.to_datetime('2015-01-01')]
+    return apply_schema(rows_between(error_count, start, end)), apply_schema(rows_between(comp_rep, start, end))
+
+
+# ------------------------------------ Staged mode
+# Uploads run on background threads while the remaining features are computed. Uploads of the same
+# table keep their order (part 0 replaces a table, later parts add to it), at most `max_pending` tables
+# wait at a time, and close() waits for all of them and raises the first failure.
+class UploadQueue:
+    def __init__(self, upload = upload_file_s3, workers = 4, max_pending = 8):
+        self.upload = upload
+        self.pool = ThreadPoolExecutor(max_workers = workers, thread_name_prefix = "upload")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.last = {}
+        self.futures = []
+
+    def run(self, previous, df, name, part):
+        try:
+            if previous is not None:
+                wait([previous])
+            if part is None:
+                self.upload(df, name)
+            else:
+                self.upload(df, name, part = part)
+        finally:
+            self.slots.release()
+
+    def __call__(self, df, name, part = None):
+        self.slots.acquire()
+        future = self.pool.submit(self.run, self.last.get(name), df, name, part)
+        self.last[name] = future
+        self.futures.append(future)
+
+    def close(self):
+        self.pool.shutdown(wait = True)
+        errors = [future.exception() for future in self.futures if future.exception() is not None]
+        for error in errors[1:]:
+            print(f"Upload failed: {error!r}")
+        if errors:
+            raise errors[0]
+
+
+# Raw tables read concurrently, readers: name -> function returning the frame
+def read_tables(readers):
+    with ThreadPoolExecutor(max_workers = len(readers), thread_name_prefix = "read") as pool:
+        futures = {name: pool.submit(read) for name, read in readers.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+# Reads every raw table concurrently (readers: name -> function returning the frame) and starts each
+# feature function once its inputs have arrived; the labels are built when all of them are done.
+# Errors and maintenance only take the telemetry keys, the telemetry frame itself is converted once.
+@stage()
+def staged_features(readers, upload = upload_file_s3):
+    # every task below can block on the ones before it, one thread each rules out a deadlock
+    with ThreadPoolExecutor(max_workers = len(readers) + 5, thread_name_prefix = "stage") as pool:
+        raw = {name: pool.submit(read) for name, read in readers.items()}
+
+        def telemetry_keys():
+            telemetry = datetime_datatype(raw['telemetry'].result())
+            return telemetry, telemetry[['datetime', 'machineID']].copy()
+
+        keys = pool.submit(telemetry_keys)
+        telemetry_df = pool.submit(lambda: telemetry_features(keys.result()[0], upload = upload))
+        errors_df = pool.submit(lambda: errors_lag_features(raw['errors'].result(), keys.result()[1], upload = upload))
+        maint_df = pool.submit(lambda: maintenance_features(raw['maint'].result(), keys.result()[1], upload = upload))
+        failures_df = pool.submit(lambda: failure_features(raw['failures'].result(), upload = upload))
+        machines_df = machine_features(raw['machines'].result())
+        return label_construct(telemetry_df.result(), errors_df.result(), maint_df.result(), machines_df,
+                               failures_df.result(), upload = upload)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--raw-prefix", type = str, default = "data/raw")
+    parser.add_argument("--incremental", action = "store_true")
+    parser.add_argument("--state-dir", type = str, default = f"{base_dir}/state")
+    parser.add_argument("--workers", type = int, default = 1)
+    parser.add_argument("--stream-chunk-rows", type = int, default = 0)
+    parser.add_argument("--machines-per-shard", type = int, default = MACHINES_PER_SHARD)
+    parser.add_argument("--upload-workers", type = int, default = 4)
+    args = parser.parse_args()
 
-    telemetry_data_uri = f"s3://{bucket}/{prefix}/data/raw/PdM_telemetry.csv"
-    errors_data_uri = f"s3://{bucket}/{prefix}/data/raw/PdM_errors.csv"
-    maint_data_uri = f"s3://{bucket}/{prefix}/data/raw/PdM_maint.csv"
-    failures_data_uri = f"s3://{bucket}/{prefix}/data/raw/PdM_failures.csv"
-    machines_data_uri = f"s3://{bucket}/{prefix}/data/raw/PdM_machines.csv"
-    
-    telemetry = wr.s3.read_csv(telemetry_data_uri)
-    errors = wr.s3.read_csv(errors_data_uri)
-    maint = wr.s3.read_csv(maint_data_uri)
-    failures = wr.s3.read_csv(failures_data_uri)
-    machines = wr.s3.read_csv(machines_data_uri)
-    
-    telemetry_df = telemetry_features(telemetry)
-    errors_df = errors_lag_features(errors)
-    maint_df = maintenance_features(maint)
-    failures_df = failure_features(failures)
-    machines_df = category_datatype(machines, 'model')
-    
-    label_construct(telemetry_df, errors_df, maint_df, machines_df, failures_df)
+    # the raw CSVs are read through the shared S3 client, which every reader thread can use at once
+    s3_client = aws_clients.s3_client()
+
+    def reader(name, **read_csv_options):
+        return functools.partial(read_csv_object, s3_client, bucket, f"{prefix}/{args.raw_prefix}/PdM_{name}.csv",
+                                 **read_csv_options)
+
+    readers = {name: reader(name) for name in ('telemetry', 'errors', 'maint', 'failures', 'machines')}
+    # --upload-workers 0 uploads synchronously inside the feature functions
+    uploads = UploadQueue(upload_file_s3, workers = args.upload_workers) if args.upload_workers else upload_file_s3
+
+    if args.stream_chunk_rows:
+        # the full telemetry file is never loaded, it is read in one chunked pass
+        del readers['telemetry']
+        raw = read_tables(readers)
+        telemetry_chunks = wr.s3.read_csv(f"s3://{bucket}/{prefix}/{args.raw_prefix}/PdM_telemetry.csv",
+                                          chunksize = args.stream_chunk_rows, boto3_session = aws_clients.session())
+        streaming_features(telemetry_chunks, raw['errors'], raw['maint'], raw['failures'], raw['machines'],
+                           upload = uploads)
+    elif args.incremental:
+        raw = read_tables(readers)
+        # synchronous uploads: the window state is only saved once the run's tables are written
+        incremental_features(raw['telemetry'], raw['errors'], raw['maint'], raw['failures'], raw['machines'],
+                             args.state_dir)
+    elif args.workers > 1:
+        raw = read_tables(readers)
+        sharded_features(raw['telemetry'], raw['errors'], raw['maint'], raw['failures'], raw['machines'],
+                         args.workers, args.machines_per_shard, upload = uploads)
+    else:
+        staged_features(readers, upload = uploads)
+    if isinstance(uploads, UploadQueue):
+        # waits for the uploads still running and raises the first failure
+        uploads.close()
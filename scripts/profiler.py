@@ -0,0 +1,253 @@
+import argparse
+import atexit
+import cProfile
+import fcntl
+import functools
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# PDM_PROFILE_TRACE: JSON trace written at exit; worker processes and subprocesses of the same run
+# (child_env and join_run hand them the run id) add their events to the same file
+# PDM_PROFILE_RUN: run id set by a parent process, read on first use
+# PDM_PROFILE_MEMORY=1: peak Python allocations per stage with tracemalloc, which slows the run down; stages that
+# overlap stages of other threads only get the process-wide peak (process_py_peak_mb)
+# PDM_PROFILE_DIR: a cProfile dump per top-level stage call, plus a tracemalloc snapshot with PDM_PROFILE_MEMORY
+# With neither PDM_PROFILE_TRACE nor PDM_PROFILE_DIR set, stages are not instrumented and nothing is kept
+TRACE_PATH = os.environ.get("PDM_PROFILE_TRACE")
+TRACE_MEMORY = os.environ.get("PDM_PROFILE_MEMORY", "") not in ("", "0")
+DUMP_DIR = os.environ.get("PDM_PROFILE_DIR")
+
+# a stage whose mean time grows by more than this fraction counts as a regression in `compare`
+REGRESSION_THRESHOLD = 0.2
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+run_id = None
+# stages recorded for the trace, only while PDM_PROFILE_TRACE is set
+events = []
+dumps = itertools.count()
+state = threading.local()
+lock = threading.Lock()
+# frames of the memory-traced stages open in any thread of this process
+open_frames = []
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return max_rss_bytes()
+
+
+def max_rss_bytes():
+    # KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def configure(trace = None, memory = None, dump_dir = None):
+    global TRACE_PATH, TRACE_MEMORY, DUMP_DIR
+    TRACE_PATH = trace if trace is not None else TRACE_PATH
+    TRACE_MEMORY = memory if memory is not None else TRACE_MEMORY
+    DUMP_DIR = dump_dir if dump_dir is not None else DUMP_DIR
+
+
+# ------------------------------------ Run id
+# The run the trace belongs to: the one a parent process passed down, else a new one for this process
+def current_run():
+    global run_id
+    if run_id is None:
+        run_id = os.environ.get("PDM_PROFILE_RUN") or f"{os.getpid()}-{int(time.time())}"
+    return run_id
+
+
+# Environment for a subprocess whose stages go into this run's trace; extra variables are added to it
+def child_env(**variables):
+    return dict(os.environ, PDM_PROFILE_RUN = current_run(), **variables)
+
+
+# Pool initializer for worker processes whose stages go into this run's trace
+def join_run(parent_run):
+    global run_id
+    run_id = parent_run
+
+
+# Open stages of this thread; a forked worker starts with an empty stack, not a copy of its parent's
+def stack():
+    if getattr(state, "pid", None) != os.getpid():
+        state.pid, state.stack = os.getpid(), []
+    return state.stack
+
+
+# ------------------------------------ Instrumentation
+# Time, RSS and (optionally) peak traced memory of a block; nested stages record their parent.
+# tracemalloc has one peak per process, so each stage resets it and hands its own peak up to its parent.
+# While stages of other threads are open (the staged thread pool) a reset would lose their peaks and the
+# peak is theirs as much as this stage's: no stage resets it then, and all of them report it as process-wide.
+@contextmanager
+def profile_stage(name, **attrs):
+    if not (TRACE_PATH or DUMP_DIR):
+        yield {"name": name}
+        return
+    frames = stack()
+    parent = frames[-1] if frames else None
+    frame = {"name": name, "child_peak": 0}
+    top_level = parent is None
+    if TRACE_MEMORY:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        with lock:
+            others = [other for other in open_frames if other["thread"] != threading.get_ident()]
+            frame.update(thread = threading.get_ident(), shared = bool(others), outer_peak = 0)
+            for other in others:
+                other["shared"] = True
+            if not others:
+                frame["outer_peak"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.reset_peak()
+            open_frames.append(frame)
+    profile = None
+    if DUMP_DIR and top_level:
+        profile = cProfile.Profile()
+    frames.append(frame)
+    rss_start, max_rss_start = rss_bytes(), max_rss_bytes()
+    wall_start, start = time.time(), time.perf_counter()
+    if profile:
+        profile.enable()
+    try:
+        yield frame
+    finally:
+        if profile:
+            profile.disable()
+        seconds = time.perf_counter() - start
+        frames.pop()
+        event = {"name": name, "ts": wall_start * 1e6, "dur": seconds * 1e6, "ph": "X",
+                 "pid": os.getpid(), "tid": threading.get_ident(),
+                 "args": {**attrs, "seconds": seconds, "parent": parent["name"] if parent else None,
+                          "rss_start_mb": rss_start / 2**20, "rss_end_mb": rss_bytes() / 2**20,
+                          # > 0 when the stage raised the process's peak RSS
+                          "max_rss_growth_mb": (max_rss_bytes() - max_rss_start) / 2**20}}
+        if "shared" in frame:
+            with lock:
+                open_frames.remove(frame)
+            peak = max(tracemalloc.get_traced_memory()[1], frame["child_peak"])
+            event["args"]["process_py_peak_mb" if frame["shared"] else "py_peak_mb"] = peak / 2**20
+            if parent is not None:
+                parent["child_peak"] = max(parent["child_peak"], peak, frame["outer_peak"])
+        if DUMP_DIR and top_level:
+            os.makedirs(DUMP_DIR, exist_ok = True)
+            base = os.path.join(DUMP_DIR, f"{name}-{os.getpid()}-{next(dumps)}")
+            profile.dump_stats(base + ".prof")
+            if TRACE_MEMORY:
+                tracemalloc.take_snapshot().dump(base + ".tracemalloc")
+        if TRACE_PATH:
+            with lock:
+                events.append(event)
+        if TRACE_PATH and top_level and multiprocessing.parent_process() is not None:
+            # pool workers end with os._exit, the atexit hook never runs there
+            write_trace()
+
+
+# Decorator form of profile_stage; the stage is named after the function unless given a name
+def stage(name = None):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profile_stage(name or function.__name__):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ------------------------------------ Trace
+# Per-stage count, total, mean and max seconds, and the largest memory figures seen
+def summarize(trace_events):
+    stages = {}
+    for event in trace_events:
+        args = event["args"]
+        entry = stages.setdefault(event["name"], {"count": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                                  "max_rss_mb": 0.0, "py_peak_mb": None,
+                                                  "process_py_peak_mb": None})
+        entry["count"] += 1
+        entry["seconds"] += args["seconds"]
+        entry["max_seconds"] = max(entry["max_seconds"], args["seconds"])
+        entry["max_rss_mb"] = max(entry["max_rss_mb"], args["rss_end_mb"])
+        for key in ("py_peak_mb", "process_py_peak_mb"):
+            if key in args:
+                entry[key] = max(entry[key] or 0.0, args[key])
+    for entry in stages.values():
+        entry["mean_seconds"] = entry["seconds"] / entry["count"]
+    return stages
+
+
+# Chrome trace event format (opens in chrome://tracing or Perfetto) with the per-stage summary alongside.
+# Events other processes of this run already wrote are kept; a trace of an earlier run is replaced.
+def write_trace(path = None):
+    path = path or TRACE_PATH
+    if not path:
+        return None
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok = True)
+    with lock:
+        own_events = list(events)
+    with open(path, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            previous = json.loads(f.read() or "{}")
+        except ValueError:
+            previous = {}
+        trace_events = [event for event in previous.get("traceEvents", []) if event["pid"] != os.getpid()] \
+            if previous.get("run") == current_run() else []
+        trace_events += own_events
+        f.seek(0)
+        f.truncate()
+        json.dump({"run": current_run(), "traceEvents": trace_events, "stages": summarize(trace_events),
+                   "memory_traced": TRACE_MEMORY}, f, indent = 1)
+    return path
+
+
+def read_stages(path):
+    with open(path) as f:
+        return json.load(f)["stages"]
+
+
+# Stages whose mean time grew by more than `threshold` between two traces
+def compare(baseline_path, current_path, threshold = REGRESSION_THRESHOLD):
+    baseline, current = read_stages(baseline_path), read_stages(current_path)
+    rows = []
+    for name in sorted(set(baseline) | set(current)):
+        before = baseline.get(name, {}).get("mean_seconds")
+        after = current.get(name, {}).get("mean_seconds")
+        change = (after - before) / before if before and after is not None else None
+        rows.append({"stage": name, "before": before, "after": after, "change": change,
+                     "regression": change is not None and change > threshold})
+    return rows
+
+
+@atexit.register
+def write_trace_at_exit():
+    if TRACE_PATH and events:
+        write_trace()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline", type = str)
+    parser.add_argument("current", type = str)
+    parser.add_argument("--threshold", type = float, default = REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    rows = compare(args.baseline, args.current, args.threshold)
+    for row in rows:
+        before = "-" if row["before"] is None else f"{row['before']:.3f}s"
+        after = "-" if row["after"] is None else f"{row['after']:.3f}s"
+        change = "" if row["change"] is None else f"{row['change']:+.0%}"
+        print(f"{row['stage']:32s} {before:>10s} {after:>10s} {change:>7s}" + ("  REGRESSION" if row["regression"] else ""))
+    raise SystemExit(1 if any(row["regression"] for row in rows) else 0)
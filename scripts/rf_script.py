@@ -1,6 +1,9 @@
 import argparse
+import io
 import joblib
+import json
 import os
+import warnings
 
 import numpy as np
 import pandas as pd
@@ -8,14 +11,180 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import mean_squared_error
 from sklearn.metrics import accuracy_score
 
+# the serving handlers only need these; training modules are imported where they are used, so the endpoint
+# does not load storage/pyarrow or the POSIX-only profiler
+from compact_forest import load_forest
+from feature_lookup import default_assembler
+from feature_schema import FEATURE_COLUMNS, LABEL_COLUMN, positional_features, read_training_csv
+
 
 # inference functions ---------------
+CSV_CONTENT_TYPE = "text/csv"
+JSON_CONTENT_TYPE = "application/json"
+JSONLINES_CONTENT_TYPE = "application/jsonlines"
+NPY_CONTENT_TYPE = "application/x-npy"
+
+
+# "numpy" scores with the memory-mapped compact forest, "sklearn" unpickles the RandomForestClassifier
+INFERENCE_ENGINE = os.environ.get("PDM_INFERENCE_ENGINE", "numpy")
+
+
 def model_fn(model_dir):
+    # the compact export is memory-mapped instead of unpickled; older artifacts only have model.joblib
+    forest_dir = os.path.join(model_dir, "forest")
+    if INFERENCE_ENGINE == "numpy" and os.path.exists(os.path.join(forest_dir, "meta.json")):
+        return load_forest(forest_dir)
     clf = joblib.load(os.path.join(model_dir, "model.joblib"))
     return clf
 
 
+def to_text(request_body):
+    return request_body.decode("utf-8") if isinstance(request_body, (bytes, bytearray)) else request_body
+
+
+def media_type(content_type):
+    return (content_type or JSON_CONTENT_TYPE).split(";")[0].strip().lower()
+
+
+# A CSV header starts with a column name; a row starts with a number, nan, inf or an empty (missing) field
+def is_header_row(line):
+    field = line.split(",", 1)[0].strip().lower()
+    return bool(field) and not (field[0].isdigit() or field[0] in "+-." or field in ("nan", "inf", "infinity"))
+
+
+# CSV rows as one float32 matrix. np.fromstring stops at the first field that is not a number, so every
+# line must have n_columns fields and every field must have been read.
+def csv_matrix(text, n_columns):
+    lines = text.split("\n")
+    ragged = next((i for i, line in enumerate(lines) if line.count(",") != n_columns - 1), None)
+    if ragged is not None:
+        raise ValueError(f"CSV line {ragged + 1} has {lines[ragged].count(',') + 1} fields, expected {n_columns}")
+    with warnings.catch_warnings():
+        # the early stop is reported below
+        warnings.simplefilter("ignore", DeprecationWarning)
+        rows = np.fromstring(text.replace("\n", ","), dtype = np.float32, sep = ",")
+    if rows.size != len(lines) * n_columns:
+        raise ValueError(f"CSV payload has an empty or non-numeric field after {rows.size} values "
+                         f"(line {rows.size // n_columns + 1})")
+    return rows.reshape(len(lines), n_columns)
+
+
+# Multi-row payloads are parsed straight into one contiguous float32 matrix, no pandas
+def input_fn(request_body, request_content_type):
+    content_type = media_type(request_content_type)
+
+    if content_type == CSV_CONTENT_TYPE:
+        text = to_text(request_body).strip()
+        first_line = text.split("\n", 1)[0]
+        if is_header_row(first_line):
+            text = text[len(first_line):].strip()
+        if not text:
+            raise ValueError("CSV payload has no rows")
+        data = csv_matrix(text, first_line.count(",") + 1)
+    elif content_type == JSON_CONTENT_TYPE:
+        payload = json.loads(to_text(request_body))
+        if isinstance(payload, dict) and "machines" in payload:
+            # {"machines": [{"machineID": 17, ...}]}: the feature vector is assembled from the online store
+            return default_assembler().assemble(payload["machines"])
+        if isinstance(payload, dict):
+            payload = payload.get("instances", payload.get("features"))
+        data = np.asarray(payload, dtype = np.float32)
+    elif content_type in (JSONLINES_CONTENT_TYPE, "application/x-jsonlines"):
+        lines = [line for line in to_text(request_body).splitlines() if line.strip()]
+        data = np.asarray(json.loads("[" + ",".join(lines) + "]"), dtype = np.float32)
+    elif content_type == NPY_CONTENT_TYPE:
+        data = np.load(io.BytesIO(request_body), allow_pickle = False).astype(np.float32, copy = False)
+    else:
+        raise ValueError(f"Unsupported content type: {request_content_type}")
+
+    if data.size == 0:
+        raise ValueError("Request has no feature rows")
+    if data.ndim == 1:
+        data = data.reshape(1, -1)
+    # payloads still in the one-hot layout the notebooks send are mapped onto the model code column
+    return np.ascontiguousarray(positional_features(data))
+
+
+# One predict_proba call for the whole batch, labels are the argmax classes like predict()
+def predict_fn(input_data, model):
+    probabilities = model.predict_proba(input_data)
+    labels = model.classes_.take(np.argmax(probabilities, axis = 1))
+    return {"predictions": labels, "probabilities": probabilities, "classes": model.classes_}
+
+
+def output_fn(prediction, accept):
+    accept = media_type(accept)
+    labels = prediction["predictions"].tolist()
+    probabilities = np.round(prediction["probabilities"], 6).tolist()
+    classes = prediction["classes"].tolist()
+
+    if accept in (JSON_CONTENT_TYPE, "*/*"):
+        return json.dumps({"predictions": labels, "probabilities": probabilities, "classes": classes}), JSON_CONTENT_TYPE
+    if accept in (JSONLINES_CONTENT_TYPE, "application/x-jsonlines"):
+        lines = (json.dumps({"prediction": label, "probabilities": probs}) for label, probs in zip(labels, probabilities))
+        return "\n".join(lines) + "\n", accept
+    if accept == CSV_CONTENT_TYPE:
+        lines = (",".join([str(label)] + [repr(p) for p in probs]) for label, probs in zip(labels, probabilities))
+        return "\n".join(lines) + "\n", CSV_CONTENT_TYPE
+    raise ValueError(f"Unsupported accept type: {accept}")
+
+
+# Search data: every walk-forward fold when the split step wrote them, otherwise the single train/test split
+def search_data(train_dir, X_train, y_train, X_test, y_test):
+    from train_test_split_data import WALK_FORWARD_FOLDS, load_walk_forward
+
+    if train_dir and os.path.exists(os.path.join(train_dir, WALK_FORWARD_FOLDS)):
+        features, labels, folds = load_walk_forward(train_dir)
+    else:
+        features = pd.concat([X_train, X_test], ignore_index = True)
+        labels = pd.concat([y_train, y_test], ignore_index = True)
+        folds = [{"fold": 0, "train_end": len(X_train), "test_start": len(X_train)}]
+    return features[FEATURE_COLUMNS].to_numpy(np.float32), labels.cat.codes.to_numpy(), folds
+
+
+def walk_forward_folds_file(train_dir):
+    from train_test_split_data import WALK_FORWARD_FOLDS
+
+    path = os.path.join(train_dir, WALK_FORWARD_FOLDS) if train_dir else None
+    return path if path and os.path.exists(path) else None
+
+
+# Datetime before which every training row lies: the last walk-forward fold's training cutoff, when known
+def train_cutoff(train_dir):
+    path = walk_forward_folds_file(train_dir)
+    if path is None:
+        return None
+    with open(path) as f:
+        return pd.Timestamp(json.load(f)[-1]["last_train_date"])
+
+
+# Training rows the previous model has not seen: walk-forward rows from its cutoff up to the current one,
+# or train.csv of the --new-data channel
+def new_training_rows(train_dir, new_data, previous_cutoff):
+    from train_test_split_data import load_walk_forward, walk_forward_datetimes
+
+    if new_data:
+        new_df = read_training_csv(f"{new_data}/train.csv")
+        return new_df[FEATURE_COLUMNS], new_df[LABEL_COLUMN]
+    cutoff = train_cutoff(train_dir)
+    if cutoff is None or previous_cutoff is None:
+        raise ValueError("Retraining needs the walk-forward table and a previous model with a train_cutoff, "
+                         "or --new-data")
+    features, labels, folds = load_walk_forward(train_dir)
+    datetimes = walk_forward_datetimes(train_dir).to_numpy()
+    start = int(np.searchsorted(datetimes, np.datetime64(pd.Timestamp(previous_cutoff)), side = "left"))
+    end = folds[-1]["train_end"]
+    print(f"new training rows {start}:{end} ({previous_cutoff} to {cutoff})")
+    return features.iloc[start:end], labels.iloc[start:end]
+
+
 if __name__ == "__main__":
+    from compact_forest import export_forest
+    from incremental_forest import (accept_update, check_feature_order, grow_forest, load_previous_model, macro_f1,
+                                    write_model_meta)
+    from model_search import (DEFAULT_SEARCH_SPACE, HALVING_FACTOR, search_configurations, successive_halving,
+                              write_leaderboard)
+    from profiler import profile_stage
 
     print("extracting arguments")
     parser = argparse.ArgumentParser()
@@ -25,6 +194,22 @@ if __name__ == "__main__":
     parser.add_argument("--n-estimators", type=int, default=10)
     parser.add_argument("--min-samples-leaf", type=int, default=3)
 
+    # hyperparameter search over the walk-forward folds; the best configuration replaces the values above
+    parser.add_argument("--search", type=str, default="none", choices=["none", "grid", "random"])
+    parser.add_argument("--search-space", type=str, default=json.dumps(DEFAULT_SEARCH_SPACE))
+    parser.add_argument("--search-samples", type=int, default=12)
+    parser.add_argument("--search-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--halving-factor", type=int, default=HALVING_FACTOR)
+    parser.add_argument("--seed", type=int, default=0)
+
+    # retraining: grow the previous model with trees fitted on the new rows only
+    parser.add_argument("--retrain", action="store_true")
+    parser.add_argument("--previous-model", type=str, default=os.environ.get("SM_CHANNEL_MODEL"))
+    parser.add_argument("--new-data", type=str, default=os.environ.get("SM_CHANNEL_NEW"))
+    parser.add_argument("--new-estimators", type=int, default=10)
+    parser.add_argument("--max-estimators", type=int, default=None)
+    parser.add_argument("--max-score-drop", type=float, default=0.01)
+
     # Data, model, and output directories
     parser.add_argument("--model-dir", type=str, default=os.environ.get("SM_MODEL_DIR"))
     parser.add_argument("--train-data", type=str, default=os.environ.get("SM_CHANNEL_TRAIN"))
@@ -43,8 +228,9 @@ if __name__ == "__main__":
     print(args.train_file)
 
     print("reading data")
-    train_df = pd.read_csv(f"{args.train_data}/train.csv")
-    test_df = pd.read_csv(f"{args.test_data}/test.csv")
+    # float32 / uint8 columns of the feature contract, the label as a categorical
+    train_df = read_training_csv(f"{args.train_data}/train.csv")
+    test_df = read_training_csv(f"{args.test_data}/test.csv")
 
     print("building training and testing datasets")
 #     X_train = train_df[args.features.split()]
@@ -52,19 +238,61 @@ if __name__ == "__main__":
 #     y_train = train_df[args.target]
 #     y_test = test_df[args.target]
     
-    X_train = train_df.drop("failure", axis = 1)
-    X_test = test_df.drop("failure", axis = 1)
-    y_train = train_df["failure"]
-    y_test = test_df["failure"]
-
-    # train
-    print("training model")
-    model = RandomForestClassifier(
-        n_estimators=args.n_estimators, min_samples_leaf=args.min_samples_leaf, n_jobs=-1
-    )
-
-    model.fit(X_train, y_train)
-    predictions = model.predict(X_test)
+    # the serving payload has the same columns in the same order
+    X_train = train_df[FEATURE_COLUMNS]
+    X_test = test_df[FEATURE_COLUMNS]
+    y_train = train_df[LABEL_COLUMN]
+    y_test = test_df[LABEL_COLUMN]
+
+    params = {"n_estimators": args.n_estimators, "min_samples_leaf": args.min_samples_leaf}
+    cutoff = train_cutoff(args.train_data)
+    model = None
+    if args.retrain:
+        previous, meta = load_previous_model(args.previous_model)
+        check_feature_order(previous, meta, FEATURE_COLUMNS)
+        params = meta.get("params", params)
+        X_new, y_new = new_training_rows(args.train_data, args.new_data, meta.get("train_cutoff"))
+        if not len(X_new):
+            # same (or an earlier) cutoff as the previous run: nothing to learn, the previous model stays
+            print("no training rows newer than the previous model, keeping it")
+            model, cutoff = previous, meta.get("train_cutoff")
+        else:
+            previous_score = macro_f1(previous, X_test, y_test)
+            try:
+                with profile_stage("grow_forest", rows=len(X_new)):
+                    report = grow_forest(previous, X_new, y_new, args.new_estimators, args.max_estimators)
+            except ValueError as e:
+                print(f"warm start not possible ({e}), training from scratch")
+            else:
+                updated_score = macro_f1(previous, X_test, y_test)
+                print(f"grew forest: {report}; held-out macro F1 {previous_score:.4f} -> {updated_score:.4f}")
+                if accept_update(previous_score, updated_score, args.max_score_drop):
+                    model = previous
+                else:
+                    print("update rejected, keeping the previous model")
+                    model, meta = load_previous_model(args.previous_model)
+                    cutoff = meta.get("train_cutoff")
+    elif args.search != "none":
+        configurations = search_configurations(json.loads(args.search_space),
+                                               args.search_samples if args.search == "random" else None, args.seed)
+        print(f"searching {len(configurations)} configurations with {args.search_workers} workers")
+        features, labels, folds = search_data(args.train_data, X_train, y_train, X_test, y_test)
+        with profile_stage("search", configurations=len(configurations)):
+            leaderboard = successive_halving(features, labels, folds, configurations, args.search_workers,
+                                             args.halving_factor, seed = args.seed)
+        del features, labels
+        params = leaderboard[0]["config"]
+        print(f"best configuration {params}: mean macro F1 {leaderboard[0]['f1_macro']:.4f}")
+        print("Leaderboard written at " + write_leaderboard(leaderboard, os.path.join(args.model_dir, "leaderboard.json")))
+
+    if model is None:
+        # train
+        print("training model")
+        model = RandomForestClassifier(**params, n_jobs=-1)
+        with profile_stage("fit", rows=len(X_train), **params):
+            model.fit(X_train, y_train)
+    with profile_stage("predict", rows=len(X_test)):
+        predictions = model.predict(X_test)
     accuracy = accuracy_score(y_test, predictions)
     print(f"Accuracy Score: {accuracy}")
 
@@ -72,4 +300,8 @@ if __name__ == "__main__":
     path = os.path.join(args.model_dir, "model.joblib")
     joblib.dump(model, path)
     print("Model persisted at " + path)
+    with profile_stage("export_forest"):
+        forest_path = export_forest(model, os.path.join(args.model_dir, "forest"))
+    print("Compact forest exported at " + forest_path)
+    write_model_meta(args.model_dir, model, FEATURE_COLUMNS, params, cutoff)
     print(args.min_samples_leaf)
\ No newline at end of file
@@ -0,0 +1,284 @@
+import io
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+# Intermediate tables format: "parquet", "arrow" (IPC) or "csv" (single file, the original layout)
+DEFAULT_FORMAT = os.environ.get("PDM_DATA_FORMAT", "parquet")
+FORMATS = {"parquet": "parquet", "arrow": "ipc", "csv": "csv"}
+
+# machineID partitions hold a contiguous range of machines so large fleets do not explode into tiny files
+MACHINES_PER_PARTITION = 100
+PARTITION_COLUMNS = ['machine_range', 'month']
+
+
+# Typed, partitioned tables under a local directory or an s3:// prefix
+class TableStore:
+    def __init__(self, root, format = DEFAULT_FORMAT, machines_per_partition = MACHINES_PER_PARTITION):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown table format {format!r}, expected one of {sorted(FORMATS)}")
+        self.root = root
+        self.format = format
+        self.machines_per_partition = machines_per_partition
+        self._filesystem = None
+        self._base_path = None
+
+    # resolved on first use: an s3:// root looks up the bucket region
+    def resolve(self):
+        if self._filesystem is None:
+            if "://" in self.root:
+                self._filesystem, self._base_path = pafs.FileSystem.from_uri(self.root)
+            else:
+                self._filesystem, self._base_path = pafs.LocalFileSystem(), os.path.abspath(self.root)
+        return self._filesystem, self._base_path
+
+    @property
+    def filesystem(self):
+        return self.resolve()[0]
+
+    @property
+    def base_path(self):
+        return self.resolve()[1]
+
+    def path(self, name):
+        if self.format == "csv":
+            return f"{self.base_path}/{name}.csv"
+        return f"{self.base_path}/{name}"
+
+    def uri(self, name):
+        return f"{self.root.rstrip('/')}/{name}" + (".csv" if self.format == "csv" else "")
+
+    def partition_values(self, df):
+        parts = {}
+        if 'machineID' in df.columns:
+            parts['machine_range'] = (df['machineID'] // self.machines_per_partition).astype('int64')
+        if 'datetime' in df.columns and pd.api.types.is_datetime64_any_dtype(df['datetime']):
+            parts['month'] = (df['datetime'].dt.year * 100 + df['datetime'].dt.month).astype('int64')
+        return parts
+
+    # part = 0, 1, ... writes a table chunk by chunk: part 0 replaces the table, later parts add files to it
+    def write(self, df, name, part = None):
+        path = self.path(name)
+        if self.format == "csv":
+            if part is not None:
+                raise ValueError("Chunked table writes need the parquet or arrow format")
+            self.filesystem.create_dir(self.base_path, recursive = True)
+            with self.filesystem.open_output_stream(path) as f:
+                df.to_csv(f, index = False)
+            return self.uri(name)
+
+        parts = self.partition_values(df)
+        table = pa.Table.from_pandas(df.assign(**parts), preserve_index = False)
+        if threading.current_thread() is not threading.main_thread():
+            # from_pandas shares the numpy buffers; the dataset writer can drop its last reference to one
+            # on an Arrow IO thread after returning, which needs the GIL and aborts the process when that
+            # happens during interpreter shutdown. A copy owned by Arrow needs no GIL to be freed.
+            table = table.take(pa.array(np.arange(len(table))))
+        partitioning = ds.partitioning(pa.schema([(col, pa.int64()) for col in parts]), flavor = "hive")
+        # replace the whole table so partitions from an earlier, larger run do not linger
+        if not part:
+            self.filesystem.delete_dir_contents(path, missing_dir_ok = True)
+        basename = "part-{i}" if part is None else f"part-{part:05d}-{{i}}"
+        ds.write_dataset(table,
+                         base_dir = path,
+                         filesystem = self.filesystem,
+                         format = FORMATS[self.format],
+                         partitioning = partitioning if parts else None,
+                         basename_template = basename + "." + FORMATS[self.format],
+                         file_options = self.file_options(),
+                         existing_data_behavior = "overwrite_or_ignore")
+        return self.uri(name)
+
+    def file_options(self):
+        file_format = ds.ParquetFileFormat() if self.format == "parquet" else ds.IpcFileFormat()
+        return file_format.make_write_options(compression = "zstd")
+
+    # machines is an inclusive (first, last) machineID range, start/end bound the datetime column
+    def read(self, name, columns = None, machines = None, start = None, end = None):
+        if self.format == "csv":
+            return self.read_csv(name, columns, machines, start, end)
+
+        dataset = ds.dataset(self.path(name),
+                             filesystem = self.filesystem,
+                             format = FORMATS[self.format],
+                             partitioning = "hive")
+        names = dataset.schema.names
+        condition = None
+
+        def both(expr):
+            return expr if condition is None else condition & expr
+
+        if machines is not None:
+            first, last = machines
+            if 'machine_range' in names:
+                condition = both((ds.field('machine_range') >= first // self.machines_per_partition) &
+                                 (ds.field('machine_range') <= last // self.machines_per_partition))
+            condition = both((ds.field('machineID') >= first) & (ds.field('machineID') <= last))
+        for bound, op in ((start, '>='), (end, '<=')):
+            if bound is None:
+                continue
+            bound = pd.Timestamp(bound)
+            month = bound.year * 100 + bound.month
+            if 'month' in names:
+                condition = both(ds.field('month') >= month if op == '>=' else ds.field('month') <= month)
+            value = pa.scalar(np.datetime64(bound.value, 'ns')).cast(dataset.schema.field('datetime').type)
+            condition = both(ds.field('datetime') >= value if op == '>=' else ds.field('datetime') <= value)
+
+        if columns is not None:
+            columns = list(columns)
+        df = dataset.to_table(columns = columns, filter = condition).to_pandas()
+        df = df.drop(columns = [col for col in PARTITION_COLUMNS if col in df.columns])
+        return self.restore_order(df)
+
+    def read_csv(self, name, columns, machines, start, end):
+        usecols = None
+        if columns is not None:
+            # filter columns are read too and dropped again below
+            filters = [col for col, bound in (('machineID', machines), ('datetime', start), ('datetime', end))
+                       if bound is not None]
+            usecols = list(dict.fromkeys(list(columns) + filters))
+        with self.filesystem.open_input_stream(self.path(name)) as f:
+            df = pd.read_csv(f, usecols = usecols)
+        if 'datetime' in df.columns:
+            df['datetime'] = pd.to_datetime(df['datetime'], format = "%Y-%m-%d %H:%M:%S")
+        if machines is not None:
+            df = df.loc[df['machineID'].between(*machines)]
+        if start is not None:
+            df = df.loc[df['datetime'] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df.loc[df['datetime'] <= pd.Timestamp(end)]
+        if columns is not None:
+            df = df[list(columns)]
+        return df.reset_index(drop = True)
+
+    # partitions come back grouped by directory, the pipeline tables are ordered by machine then time
+    def restore_order(self, df):
+        keys = [col for col in ('machineID', 'datetime') if col in df.columns]
+        if keys:
+            df = df.sort_values(keys, kind = "stable")
+        return df.reset_index(drop = True)
+
+
+# ------------------------------------ Streaming CSV uploads
+# S3 rejects parts under 5 MiB (except the last) and objects over 5 GB in a single PUT
+MIN_PART_SIZE = 5 * 1024 * 1024
+PART_SIZE = 16 * 1024 * 1024
+ROWS_PER_BATCH = 50000
+
+
+# CSV text of the frame in row batches, header on the first one only
+def csv_batches(df, rows_per_batch = ROWS_PER_BATCH):
+    if len(df) == 0:
+        yield df.to_csv(index = False).encode()
+        return
+    for start in range(0, len(df), rows_per_batch):
+        yield df.iloc[start:start + rows_per_batch].to_csv(index = False, header = start == 0).encode()
+
+
+# Serialize df batch by batch and send every full buffer as a multipart part, so at most
+# one part plus one batch is held in memory; small tables still go out as a single put_object
+def upload_csv_multipart(df, s3_client, bucket, key, part_size = PART_SIZE, rows_per_batch = ROWS_PER_BATCH):
+    part_size = max(part_size, MIN_PART_SIZE)
+    buffer = bytearray()
+    upload_id = None
+    parts = []
+
+    try:
+        for chunk in csv_batches(df, rows_per_batch):
+            buffer += chunk
+            if len(buffer) < part_size:
+                continue
+            if upload_id is None:
+                upload_id = s3_client.create_multipart_upload(Bucket = bucket, Key = key)["UploadId"]
+            response = s3_client.upload_part(Bucket = bucket, Key = key, UploadId = upload_id,
+                                             PartNumber = len(parts) + 1, Body = bytes(buffer))
+            parts.append({"PartNumber": len(parts) + 1, "ETag": response["ETag"]})
+            buffer.clear()
+
+        if upload_id is None:
+            return s3_client.put_object(Bucket = bucket, Key = key, Body = bytes(buffer))
+        if buffer:
+            response = s3_client.upload_part(Bucket = bucket, Key = key, UploadId = upload_id,
+                                             PartNumber = len(parts) + 1, Body = bytes(buffer))
+            parts.append({"PartNumber": len(parts) + 1, "ETag": response["ETag"]})
+        return s3_client.complete_multipart_upload(Bucket = bucket, Key = key, UploadId = upload_id,
+                                                   MultipartUpload = {"Parts": parts})
+    except Exception:
+        if upload_id is not None:
+            s3_client.abort_multipart_upload(Bucket = bucket, Key = key, UploadId = upload_id)
+        raise
+
+
+# One CSV object read through an S3 client; the response body is parsed as it streams in
+def read_csv_object(s3_client, bucket, key, **read_csv_options):
+    body = s3_client.get_object(Bucket = bucket, Key = key)["Body"]
+    try:
+        return pd.read_csv(body, **read_csv_options)
+    finally:
+        body.close()
+
+
+# Filesystem-backed stand-in for the boto3 S3 client calls used by the pipeline
+class LocalS3Client:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.uploads = {}
+
+    def object_path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def response(self, **fields):
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}, **fields}
+
+    def put_object(self, Bucket, Key, Body):
+        path = self.object_path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, "wb") as f:
+            f.write(Body.encode() if isinstance(Body, str) else Body)
+        return self.response(ETag = f'"{len(Body)}"')
+
+    def get_object(self, Bucket, Key):
+        with open(self.object_path(Bucket, Key), "rb") as f:
+            return self.response(Body = io.BytesIO(f.read()))
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = uuid.uuid4().hex
+        # parts are spooled to disk like the service does, not kept in memory
+        self.uploads[upload_id] = os.path.join(self.root, ".uploads", upload_id)
+        os.makedirs(self.uploads[upload_id])
+        return self.response(Bucket = Bucket, Key = Key, UploadId = upload_id)
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if not 1 <= PartNumber <= 10000:
+            raise ValueError(f"Invalid part number {PartNumber}")
+        with open(os.path.join(self.uploads[UploadId], str(PartNumber)), "wb") as f:
+            f.write(Body)
+        return self.response(ETag = f'"{UploadId}-{PartNumber}"')
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        spool = self.uploads.pop(UploadId)
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        for number in numbers[:-1]:
+            if os.path.getsize(os.path.join(spool, str(number))) < MIN_PART_SIZE:
+                raise ValueError(f"Part {number} is smaller than the 5 MiB minimum")
+        path = self.object_path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, "wb") as f:
+            for number in numbers:
+                with open(os.path.join(spool, str(number)), "rb") as part:
+                    shutil.copyfileobj(part, f)
+        shutil.rmtree(spool)
+        return self.response(Bucket = Bucket, Key = Key)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        spool = self.uploads.pop(UploadId, None)
+        if spool is not None:
+            shutil.rmtree(spool, ignore_errors = True)
+        return self.response()
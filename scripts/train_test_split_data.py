@@ -1,56 +1,111 @@
+import json
+import os
+
+import numpy as np
 import pandas as pd
-import boto3
-from io import StringIO
-import awswrangler as wr
+
+from feature_schema import LABEL_COLUMN, TRAINING_DTYPES, apply_schema, encode_features
+from profiler import stage
+from storage import TableStore
 
 base_dir = "/opt/ml/processing"
 bucket = "BUCKET-NAME"
 prefix = "mlops/predictive-maintenance"
 
-def upload_file_s3(df, name):
-    boto3.setup_default_session(region_name = "us-east-1")
-    s3_client = boto3.client("s3", region_name = "us-east-1")
-    with StringIO() as csv_buffer:
-        df.to_csv(csv_buffer, index = False)
+# (last training date, first test date) of every walk-forward fold, in time order
+THRESHOLD_DATES = [[pd.to_datetime('2015-07-31 01:00:00'), pd.to_datetime('2015-08-01 01:00:00')],
+                   [pd.to_datetime('2015-08-31 01:00:00'), pd.to_datetime('2015-09-01 01:00:00')],
+                   [pd.to_datetime('2015-09-30 01:00:00'), pd.to_datetime('2015-10-01 01:00:00')]]
 
-        response = s3_client.put_object(
-            Bucket = bucket, Key = f"{prefix}/data/train-test/{name}.csv", Body = csv_buffer.getvalue()
-        )
-        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+# All folds as one table sorted by datetime, with the row range of each fold next to it
+WALK_FORWARD_TABLE = "walk_forward"
+WALK_FORWARD_FOLDS = "walk_forward_folds.json"
 
-        if status == 200:
-            print(f"Successful S3 put_object response. Status - {status}")
-        else:
-            print(f"Unsuccessful S3 put_object response. Status - {status}")
 
-def train_test_split_script(labeled_features):
-    threshold_dates = [[pd.to_datetime('2015-07-31 01:00:00'), pd.to_datetime('2015-08-01 01:00:00')],
-                   [pd.to_datetime('2015-08-31 01:00:00'), pd.to_datetime('2015-09-01 01:00:00')],
-                   [pd.to_datetime('2015-09-30 01:00:00'), pd.to_datetime('2015-10-01 01:00:00')]]
-    
+# One stable sort by datetime; the machine order within an hour is kept
+def sort_by_datetime(labeled_features):
+    datetimes = labeled_features['datetime'].to_numpy()
+    if len(datetimes) and not (datetimes[1:] >= datetimes[:-1]).all():
+        labeled_features = labeled_features.iloc[np.argsort(datetimes, kind = "stable")]
+    return labeled_features.reset_index(drop = True)
+
+
+# Row ranges of every fold in a datetime-sorted column: rows before the last training date train,
+# rows after the first test date test
+def fold_bounds(datetimes, threshold_dates = THRESHOLD_DATES):
+    datetimes = np.asarray(datetimes, dtype = 'datetime64[ns]')
+    bounds = []
     for last_train_date, first_test_date in threshold_dates:
-        # split out training and test data
-        print(labeled_features['datetime'][0])
-        train_y = labeled_features.loc[labeled_features['datetime'] < last_train_date, 'failure']
-        train_data = pd.get_dummies(labeled_features.loc[labeled_features['datetime'] < last_train_date].drop(['datetime',
-                                                                                                            'machineID',
-                                                                                                              'failure'], axis = 1))
-        test_y = labeled_features.loc[labeled_features['datetime'] > last_train_date, 'failure']
-        test_data = pd.get_dummies(labeled_features.loc[labeled_features['datetime'] > first_test_date].drop(['datetime',
-                                                                                                           'machineID',
-                                                                                                             'failure'], axis = 1))
-    
-    train_data['failure'] = train_y
-    test_data['failure'] = test_y
-    
-    upload_file_s3(train_data, "train")
-    upload_file_s3(test_data, "test")
-
-    pd.DataFrame(train_data).to_csv(f"{base_dir}/train/train.csv", index = False)
-    pd.DataFrame(test_data).to_csv(f"{base_dir}/test/test.csv", index = False)
-    
+        train_end = int(np.searchsorted(datetimes, np.datetime64(pd.Timestamp(last_train_date)), side = 'left'))
+        test_start = int(np.searchsorted(datetimes, np.datetime64(pd.Timestamp(first_test_date)), side = 'right'))
+        bounds.append((train_end, test_start))
+    return bounds
+
+
+# (fold, train_X, train_y, test_X, test_y) of every fold; the table is sorted and encoded once and
+# every fold is a row slice (a view) of the same feature matrix and labels
+def walk_forward_folds(labeled_features, threshold_dates = THRESHOLD_DATES):
+    labeled_features = sort_by_datetime(labeled_features)
+    features = encode_features(labeled_features)
+    labels = labeled_features[LABEL_COLUMN]
+    for fold, (train_end, test_start) in enumerate(fold_bounds(labeled_features['datetime'], threshold_dates)):
+        yield (fold, features.iloc[:train_end], labels.iloc[:train_end],
+               features.iloc[test_start:], labels.iloc[test_start:])
+
+
+# Feature matrix, labels and fold row ranges of the walk-forward table written by train_test_split_script
+def load_walk_forward(directory):
+    table = TableStore(directory, format = "parquet").read(WALK_FORWARD_TABLE)
+    with open(os.path.join(directory, WALK_FORWARD_FOLDS)) as f:
+        folds = json.load(f)
+    table = apply_schema(table, TRAINING_DTYPES)
+    return table.drop(['datetime', LABEL_COLUMN], axis = 1), table[LABEL_COLUMN], folds
+
+
+# Row datetimes of the walk-forward table, in the row order of load_walk_forward
+def walk_forward_datetimes(directory):
+    return TableStore(directory, format = "parquet").read(WALK_FORWARD_TABLE, columns = ['datetime'])['datetime']
+
+
+# The folds of the written walk-forward table, as walk_forward_folds yields them
+def read_walk_forward(directory):
+    features, labels, folds = load_walk_forward(directory)
+    for fold in folds:
+        train_end, test_start = fold['train_end'], fold['test_start']
+        yield (fold['fold'], features.iloc[:train_end], labels.iloc[:train_end],
+               features.iloc[test_start:], labels.iloc[test_start:])
+
+
+@stage()
+def train_test_split_script(labeled_features, out_dir = base_dir, threshold_dates = THRESHOLD_DATES):
+    labeled_features = sort_by_datetime(labeled_features)
+    features = encode_features(labeled_features)
+    features[LABEL_COLUMN] = labeled_features[LABEL_COLUMN]
+    bounds = fold_bounds(labeled_features['datetime'], threshold_dates)
+
+    folds = []
+    for fold, ((last_train_date, first_test_date), (train_end, test_start)) in enumerate(zip(threshold_dates, bounds)):
+        print(f"Fold {fold}: {train_end} training rows up to {last_train_date}, "
+              f"{len(features) - test_start} test rows after {first_test_date}")
+        folds.append({'fold': fold, 'last_train_date': str(last_train_date), 'first_test_date': str(first_test_date),
+                      'train_end': train_end, 'test_start': test_start})
+
+    # every fold in one table under the train output (monthly partitions), the training job slices it
+    train_dir = f"{out_dir}/train"
+    TableStore(train_dir, format = "parquet").write(features.assign(datetime = labeled_features['datetime']),
+                                                    WALK_FORWARD_TABLE)
+    with open(os.path.join(train_dir, WALK_FORWARD_FOLDS), "w") as f:
+        json.dump(folds, f, indent = 2)
+
+    # train.csv / test.csv keep the last fold for the single model training step; the processing
+    # outputs upload them to S3
+    train_end, test_start = bounds[-1]
+    features.iloc[:train_end].to_csv(f"{out_dir}/train/train.csv", index = False)
+    features.iloc[test_start:].to_csv(f"{out_dir}/test/test.csv", index = False)
+    return folds
+
 if __name__ == "__main__":
-    final_data_uri = f"s3://{bucket}/{prefix}/data/preprocessed/preprocessed.csv"
-    final_data = wr.s3.read_csv(final_data_uri)
-    final_data['datetime'] = pd.to_datetime(final_data['datetime'], format="%Y-%m-%d %H:%M:%S")
+    # datetime and category dtypes come back from the preprocessed table as written; the schema
+    # restores them (and the compact numeric dtypes) for CSV tables too
+    final_data = apply_schema(TableStore(f"s3://{bucket}/{prefix}/data/preprocessed").read("preprocessed"))
     train_test_split_script(final_data)
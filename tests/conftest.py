@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the scripts are run from their own directory, and the legacy implementations the tests compare against
+# live next to the benchmarks that time them
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from compact_forest import CompactForest, export_forest, load_forest
+from bench_feature_dtypes import feature_sample
+
+
+# Labeled rows of the benchmarks' synthetic fleet as a float matrix
+def training_set(n_rows, seed = 0):
+    X, y = feature_sample(n_rows, seed)
+    return X.to_numpy(np.float32), y
+
+
+@pytest.fixture(scope = "module")
+def model():
+    X, y = training_set(5000)
+    return RandomForestClassifier(n_estimators = 20, min_samples_leaf = 3, random_state = 0).fit(X, y)
+
+
+def assert_parity(model, forest, X):
+    np.testing.assert_allclose(forest.predict_proba(X), model.predict_proba(X), rtol = 0, atol = 1e-12)
+    assert (forest.predict(X) == model.predict(X)).all()
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 32, 1024, 5000])
+def test_predictions_match_sklearn(model, batch_size):
+    X, _ = training_set(batch_size, seed = 1)
+    assert_parity(model, CompactForest.from_model(model), X)
+
+
+def test_block_boundaries_match_sklearn(model, monkeypatch):
+    monkeypatch.setattr(CompactForest, "BLOCK_ROWS", 100)
+    X, _ = training_set(1050, seed = 2)
+    assert_parity(model, CompactForest.from_model(model), X)
+
+
+def test_exported_forest_is_used_memory_mapped(model, tmp_path):
+    forest = load_forest(export_forest(model, str(tmp_path / "forest")))
+    assert all(isinstance(array, np.memmap) for array in forest.arrays.values())
+    X, _ = training_set(1000, seed = 3)
+    assert_parity(model, forest, X)
+
+
+# A fifth of the values missing, at random
+def with_missing(X, seed):
+    X = X.copy()
+    rng = np.random.default_rng(seed)
+    X[rng.random(X.shape) < 0.2] = np.nan
+    return X
+
+
+def test_missing_values_follow_sklearn(model):
+    X, _ = training_set(2000, seed = 4)
+    assert_parity(model, CompactForest.from_model(model), with_missing(X, 5))
+
+
+def test_missing_values_seen_in_training_follow_sklearn(tmp_path):
+    X, y = training_set(5000, seed = 6)
+    model = RandomForestClassifier(n_estimators = 10, min_samples_leaf = 3, random_state = 0).fit(with_missing(X, 7), y)
+    X_test, _ = training_set(2000, seed = 8)
+    forest = load_forest(export_forest(model, str(tmp_path / "forest")))
+    assert_parity(model, forest, with_missing(X_test, 9))
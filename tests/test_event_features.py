@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+
+from bench_event_features import key_scenarios, legacy_errors_lag_features, legacy_maintenance_features
+from feature_schema import apply_schema
+from preprocessing import errors_lag_features, maintenance_features
+from synthetic_pdm import generate
+
+SCENARIOS = ["full hourly grid", "gaps and missing machines", "shifted start (13:00)"]
+
+
+@pytest.fixture(scope = "module")
+def raw():
+    return generate(12, 45, seed = 3)
+
+
+@pytest.fixture(scope = "module")
+def scenarios(raw):
+    return key_scenarios(raw['telemetry'][['datetime', 'machineID']])
+
+
+# the legacy float64 tables are cast to the feature schema the current functions return
+def assert_same(expected, actual):
+    expected = apply_schema(expected.reset_index(drop = True))
+    assert list(expected.columns) == list(actual.columns)
+    pd.testing.assert_frame_equal(expected, actual, check_dtype = True, check_exact = True)
+
+
+@pytest.mark.filterwarnings("ignore::FutureWarning")
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_error_counts_match_legacy(raw, scenarios, scenario):
+    keys = scenarios[scenario]
+    expected = legacy_errors_lag_features(raw['errors'].copy(), keys)
+    actual = errors_lag_features(raw['errors'].copy(), keys, upload = None)
+    assert len(actual) and actual.iloc[:, 2:].to_numpy().sum() > 0
+    assert_same(expected, actual)
+
+
+@pytest.mark.filterwarnings("ignore::FutureWarning")
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_days_since_replacement_match_legacy(raw, scenarios, scenario):
+    keys = scenarios[scenario]
+    expected = legacy_maintenance_features(raw['maint'].copy(), keys)
+    actual = maintenance_features(raw['maint'].copy(), keys, upload = None)
+    assert_same(expected, actual)
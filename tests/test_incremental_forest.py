@@ -0,0 +1,107 @@
+import copy
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import incremental_forest
+from compact_forest import CompactForest
+from feature_schema import FAILURE_CLASSES
+from incremental_forest import MODEL_META, grow_forest
+from train_test_split_data import train_test_split_script
+from bench_feature_dtypes import labeled_table
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(incremental_forest.__file__))
+
+
+def labeled_rows(n_rows, seed = 0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size = (n_rows, 6)), columns = [f"f{i}" for i in range(6)])
+    score = X.iloc[:, :4].to_numpy() + rng.normal(scale = 0.5, size = (n_rows, 4))
+    labels = np.where(score.max(axis = 1) > 2.0, np.array(FAILURE_CLASSES[1:])[np.argmax(score, axis = 1)], 'none')
+    return X, pd.Series(pd.Categorical(labels, categories = FAILURE_CLASSES))
+
+
+@pytest.fixture(scope = "module")
+def previous():
+    X, y = labeled_rows(4000)
+    return RandomForestClassifier(n_estimators = 10, min_samples_leaf = 3, random_state = 0).fit(X, y)
+
+
+# a week of new rows rarely has every failure class
+def test_slice_missing_classes_keeps_the_previous_classes(previous):
+    X_new, y_new = labeled_rows(300, seed = 1)
+    y_new = y_new.where(~y_new.isin(['comp2', 'comp4']), 'none')
+    model = copy.deepcopy(previous)
+    report = grow_forest(model, X_new, y_new, 5)
+
+    assert report["n_estimators"] == 15 and report["missing_classes"] == 2
+    np.testing.assert_array_equal(model.classes_, previous.classes_)
+    X_test, _ = labeled_rows(500, seed = 2)
+    missing = np.isin(model.classes_, ['comp2', 'comp4'])
+    for tree in model.estimators_[-5:]:
+        assert (tree.predict_proba(X_test.to_numpy())[:, missing] == 0).all()
+    # the new trees average in column by column with the old ones, also in the compact export
+    proba = model.predict_proba(X_test)
+    np.testing.assert_allclose(proba.sum(axis = 1), 1.0)
+    np.testing.assert_allclose(CompactForest.from_model(model).predict_proba(X_test), proba, rtol = 0, atol = 1e-12)
+
+
+# without bootstrapping the new trees are comparable to ones fitted on the slice alone (fewer classes_)
+def test_padding_rows_do_not_change_the_new_trees():
+    X, y = labeled_rows(4000)
+    previous = RandomForestClassifier(n_estimators = 4, bootstrap = False, max_features = 3, random_state = 0).fit(X, y)
+    X_new, y_new = labeled_rows(300, seed = 1)
+    y_new = y_new.where(y_new != 'comp3', 'none')
+    padded = copy.deepcopy(previous)
+    grow_forest(padded, X_new, y_new, 3)
+    alone = copy.deepcopy(previous).set_params(warm_start = True, n_estimators = 7).fit(X_new, y_new)
+    present = np.isin(padded.classes_, alone.classes_)
+    for tree, expected in zip(padded.estimators_[-3:], alone.estimators_[-3:]):
+        np.testing.assert_array_equal(tree.tree_.feature, expected.tree_.feature)
+        np.testing.assert_array_equal(tree.tree_.threshold, expected.tree_.threshold)
+        np.testing.assert_array_equal(tree.tree_.value[:, :, present], expected.tree_.value)
+
+
+def test_class_the_previous_model_never_saw_is_rejected():
+    X, y = labeled_rows(2000)
+    y = y.where(y != 'comp4', 'none')
+    model = RandomForestClassifier(n_estimators = 5, random_state = 0).fit(X, y)
+    X_new, y_new = labeled_rows(300, seed = 1)
+    with pytest.raises(ValueError, match = "never saw"):
+        grow_forest(model, X_new, y_new, 2)
+    assert len(model.estimators_) == 5
+
+
+def test_empty_slice_is_rejected_without_changing_the_model(previous):
+    X_new, y_new = labeled_rows(0, seed = 1)
+    model = copy.deepcopy(previous)
+    with pytest.raises(ValueError, match = "No new training rows"):
+        grow_forest(model, X_new, y_new, 5)
+    assert len(model.estimators_) == 10
+
+
+def rf_script(*args):
+    subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, "rf_script.py"), *args], cwd = SCRIPTS_DIR,
+                   check = True, stdout = subprocess.DEVNULL)
+
+
+# a retraining run on the same walk-forward cutoff finds no new rows and keeps the previous model
+def test_retrain_without_new_rows_keeps_the_previous_model(tmp_path):
+    for name in ("train", "test", "first", "second"):
+        os.makedirs(tmp_path / name)
+    train_test_split_script(labeled_table(3, 300), str(tmp_path))
+    data = ["--train-data", str(tmp_path / "train"), "--test-data", str(tmp_path / "test")]
+    rf_script("--model-dir", str(tmp_path / "first"), "--n-estimators", "3", *data)
+    rf_script("--retrain", "--previous-model", str(tmp_path / "first"), "--model-dir", str(tmp_path / "second"), *data)
+    with open(tmp_path / "first" / MODEL_META) as f:
+        first = json.load(f)
+    with open(tmp_path / "second" / MODEL_META) as f:
+        second = json.load(f)
+    assert second["n_estimators"] == first["n_estimators"] == 3
+    assert second["train_cutoff"] == first["train_cutoff"]
@@ -0,0 +1,146 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+import rf_script
+from batch_score import PART_PATTERN, batch_score, combine_parts
+from bench_batch_score import model_dir
+from feature_schema import FEATURE_COLUMNS, LEGACY_FEATURE_COLUMNS, MACHINE_MODELS
+from inference_client import read_batches
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(rf_script.__file__))
+INFERENCE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "datasets", "PdM_inference_data.csv")
+
+
+@pytest.fixture(scope = "module")
+def model_path(tmp_path_factory):
+    return model_dir(str(tmp_path_factory.mktemp("model") / "model"), n_estimators = 5)
+
+
+def read_payload():
+    with open(INFERENCE_DATA) as f:
+        return f.read()
+
+
+# the endpoint imports rf_script for the handlers alone; the training modules bring storage and the profiler
+def test_serving_handlers_do_not_import_training_modules():
+    code = ("import sys, rf_script\n"
+            "print(' '.join(sorted({'incremental_forest', 'model_search', 'profiler', 'storage',"
+            " 'train_test_split_data'} & set(sys.modules))))")
+    output = subprocess.run([sys.executable, "-c", code], cwd = SCRIPTS_DIR, capture_output = True, text = True,
+                            check = True).stdout
+    assert output.strip() == ""
+
+
+def test_shipped_inference_data_is_in_the_feature_layout():
+    X = rf_script.input_fn(read_payload(), "text/csv")
+    assert X.shape == (100, len(FEATURE_COLUMNS))
+    codes = X[:, FEATURE_COLUMNS.index('model')]
+    assert set(codes.tolist()) <= set(range(len(MACHINE_MODELS)))
+
+
+def test_endpoint_handlers_score_shipped_inference_data(model_path):
+    model = rf_script.model_fn(model_path)
+    prediction = rf_script.predict_fn(rf_script.input_fn(read_payload(), "text/csv"), model)
+    assert len(prediction["predictions"]) == 100
+    np.testing.assert_allclose(prediction["probabilities"].sum(axis = 1), 1.0)
+
+
+def test_batch_score_scores_shipped_inference_data(model_path, tmp_path):
+    out_dir = str(tmp_path / "scores")
+    report = batch_score(INFERENCE_DATA, model_path, out_dir, workers = 1)
+    assert report["scored_rows"] == 100
+    scores = pq.read_table(combine_parts(out_dir, str(tmp_path / "scores.parquet")))
+    assert scores.num_rows == 100
+
+
+# Workers read their chunks by byte range; the parts must line up with the rows of the file
+def test_batch_score_chunks_cover_every_row_once(model_path, tmp_path):
+    whole, chunked = str(tmp_path / "whole"), str(tmp_path / "chunked")
+    batch_score(INFERENCE_DATA, model_path, whole, workers = 1)
+    report = batch_score(INFERENCE_DATA, model_path, chunked, workers = 1, chunk_rows = 7)
+    assert report["chunks"] == 15 and report["rows_per_sec"] > 0
+    scores = pq.read_table(combine_parts(chunked, str(tmp_path / "chunked.parquet")))
+    assert scores.column("row").to_pylist() == list(range(100))
+    assert scores.equals(pq.read_table(combine_parts(whole, str(tmp_path / "whole.parquet"))))
+
+
+def test_combine_parts_refuses_a_run_with_missing_chunks(model_path, tmp_path):
+    out_dir = str(tmp_path / "scores")
+    batch_score(INFERENCE_DATA, model_path, out_dir, workers = 1, chunk_rows = 30)
+    os.remove(os.path.join(out_dir, PART_PATTERN.format(1)))
+    with pytest.raises(ValueError, match = "missing 1 of 4 chunks"):
+        combine_parts(out_dir, str(tmp_path / "scores.parquet"))
+
+
+# Payloads in the former one-hot layout (age, then one indicator per machine model) score like the new layout
+def test_legacy_one_hot_payloads_are_mapped_onto_the_model_code(model_path):
+    X = rf_script.input_fn(read_payload(), "text/csv")
+    model_column = FEATURE_COLUMNS.index('model')
+    one_hot = np.eye(len(MACHINE_MODELS), dtype = np.float32)[X[:, model_column].astype(int)]
+    legacy = np.column_stack([np.delete(X, model_column, axis = 1), one_hot])
+    assert legacy.shape[1] == len(LEGACY_FEATURE_COLUMNS)
+    payload = "\n".join(",".join(repr(float(v)) for v in row) for row in legacy)
+    np.testing.assert_array_equal(rf_script.input_fn(payload, "text/csv"), X)
+    np.testing.assert_array_equal(rf_script.input_fn(json.dumps(legacy.tolist()), "application/json"), X)
+
+
+# A field that is not a number used to end the parse early, and the endpoint returned fewer rows than sent
+@pytest.mark.parametrize("payload", [
+    "1.0,2.0,3.0\n4.0,,6.0\n7.0,8.0,9.0",
+    "1.0,2.0,3.0\n4.0,abc,6.0",
+    "1.0,2.0,3.0\n4.0,5.0",
+    "1.0,2.0,3.0\n4.0,5.0,6.0,7.0",
+    "1.0,2.0,3.0\n\n4.0,5.0,6.0",
+    "1.0,2.0,3.0,",
+])
+def test_malformed_csv_payloads_are_rejected(payload):
+    with pytest.raises(ValueError):
+        rf_script.input_fn(payload, "text/csv")
+
+
+@pytest.mark.parametrize("payload, content_type", [
+    ("", "text/csv"), (b"  \n", "text/csv"), ("volt,rotate\n", "text/csv"),
+    ("[]", "application/json"), ('{"instances": []}', "application/json"), ("\n", "application/jsonlines"),
+])
+def test_empty_payloads_are_rejected(payload, content_type):
+    with pytest.raises(ValueError):
+        rf_script.input_fn(payload, content_type)
+
+
+def test_csv_rows_with_header_and_crlf_line_ends():
+    X = rf_script.input_fn("volt,rotate,pressure\r\n1.5,2,3e2\r\n-4,5.25,.5\r\n", "text/csv")
+    np.testing.assert_array_equal(X, np.array([[1.5, 2, 300], [-4, 5.25, 0.5]], dtype = np.float32))
+
+
+# Only the first line of a file or payload can be a header; rows starting with nan or a missing value are rows
+def test_read_batches_skips_only_the_header(tmp_path):
+    path = tmp_path / "inference.csv"
+    path.write_text("volt,rotate\n1,2\n\nnan,3\n,4\n-1,5\n.5,6")
+    batches = list(read_batches(str(path), 2))
+    assert batches == [(2, "1,2\nnan,3"), (2, ",4\n-1,5"), (1, ".5,6")]
+    path.write_text("nan,3\n1,2\n")
+    assert list(read_batches(str(path), 1)) == [(1, "nan,3"), (1, "1,2")]
+
+
+def test_read_batches_sends_every_shipped_row_once():
+    with open(INFERENCE_DATA) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    batches = list(read_batches(INFERENCE_DATA, 7))
+    assert [n_rows for n_rows, _ in batches] == [7] * 14 + [2]
+    assert "\n".join(body for _, body in batches).split("\n") == lines
+
+
+@pytest.mark.parametrize("payload", ["nan,2.0,3.0", "inf,2.0,3.0"])
+def test_single_rows_starting_with_nan_or_inf_are_not_headers(payload):
+    assert rf_script.input_fn(payload, "text/csv").shape == (1, 3)
+
+
+def test_single_row_starting_with_an_empty_field_is_a_malformed_row():
+    with pytest.raises(ValueError, match = "empty or non-numeric"):
+        rf_script.input_fn(",2.0,3.0", "text/csv")
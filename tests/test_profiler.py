@@ -0,0 +1,101 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import profiler
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(profiler.__file__))
+
+
+def run_python(code, env):
+    return subprocess.run([sys.executable, "-c", code], cwd = SCRIPTS_DIR, env = env, capture_output = True,
+                          text = True, check = True).stdout
+
+
+def test_import_leaves_environment_alone():
+    env = {name: value for name, value in os.environ.items() if name != "PDM_PROFILE_RUN"}
+    output = run_python("import os, profiler; print(os.environ.get('PDM_PROFILE_RUN'))", env)
+    assert output.strip() == "None"
+
+
+def test_subprocess_stages_join_the_trace(tmp_path):
+    trace = str(tmp_path / "trace.json")
+    profiler.configure(trace = trace)
+    try:
+        profiler.events.clear()
+        with profiler.profile_stage("parent"):
+            pass
+        profiler.write_trace()
+        run_python("import profiler\nwith profiler.profile_stage('child'):\n    pass",
+                   profiler.child_env(PDM_PROFILE_TRACE = trace))
+    finally:
+        profiler.events.clear()
+        profiler.configure(trace = "")
+    with open(trace) as f:
+        written = json.load(f)
+    assert written["run"] == profiler.current_run()
+    assert sorted(event["name"] for event in written["traceEvents"]) == ["child", "parent"]
+
+
+def traced_events(function, trace):
+    profiler.events.clear()
+    profiler.configure(trace = str(trace), memory = True)
+    try:
+        function()
+        return {event["name"]: event["args"] for event in profiler.events}
+    finally:
+        profiler.configure(trace = "", memory = False)
+        profiler.events.clear()
+
+
+# a long-lived process (the endpoint) calls decorated stages forever; without a trace they must not pile up
+def test_stages_keep_nothing_without_a_trace():
+    profiler.events.clear()
+    profiler.configure(memory = True)
+    try:
+        with profiler.profile_stage("outer"):
+            profiler.stage("inner")(lambda: None)()
+        assert profiler.events == []
+        assert profiler.stack() == []
+    finally:
+        profiler.configure(memory = False)
+
+
+def test_serial_stages_report_their_own_peak(tmp_path):
+    def run():
+        with profiler.profile_stage("outer"):
+            with profiler.profile_stage("inner"):
+                block = bytearray(8 * 2**20)
+                del block
+
+    args = traced_events(run, tmp_path / "trace.json")
+    assert args["inner"]["py_peak_mb"] >= 8
+    assert args["outer"]["py_peak_mb"] >= args["inner"]["py_peak_mb"]
+    assert "process_py_peak_mb" not in args["inner"]
+
+
+def test_overlapping_stages_report_the_process_peak(tmp_path):
+    both_open = threading.Barrier(2)
+
+    def allocate(name, size):
+        with profiler.profile_stage(name):
+            block = bytearray(size)
+            both_open.wait()
+            del block
+            both_open.wait()
+
+    def run():
+        threads = [threading.Thread(target = allocate, args = (f"stage{i}", 4 * 2**20)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    args = traced_events(run, tmp_path / "trace.json")
+    for name in ("stage0", "stage1"):
+        assert "py_peak_mb" not in args[name]
+        # both blocks were alive at once
+        assert args[name]["process_py_peak_mb"] >= 8
+    assert profiler.open_frames == []